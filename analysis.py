@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+看板的技術指標與策略計算(不依賴 Streamlit)
+每個函數對應看板的一個區塊，回傳 {欄位名稱: 陣列}，看板直接加進 KBar_df，效能測試也呼叫同一組函數
+indicator 為 indicator(名稱, *參數) → 指標字典 的函數(看板中是 IndicatorEngine 的切片)
+報酬欄位第一根為 NaN，累計報酬略過 NaN(與 pandas pct_change/cumprod 相同)
+"""
+
+import numpy as np
+import strategies
+from bar_schema import as_float64
+
+# 看板滑桿的預設值
+DEFAULT_PARAMS = {
+    'ma_long': 20,
+    'ma_short': 5,
+    'rsi_period': 14,
+    'bb_period': 20,
+    'bb_std': 2.0,
+    'macd_fast': 12,
+    'macd_slow': 26,
+    'macd_signal': 9,
+    'short_window': 5,
+    'long_window': 20,
+    'rsi_buy': 30,
+    'rsi_sell': 70,
+}
+
+# 略過 NaN 的累積乘積(NaN 的位置仍為 NaN)
+def _cumprod(returns):
+    missing = np.isnan(returns)
+    cum = np.cumprod(np.where(missing, 1.0, 1.0 + returns))
+    cum[missing] = np.nan
+    return cum
+
+# 移動平均線
+def moving_averages(indicator, ma_long, ma_short):
+    return {
+        'MA_long': indicator('MA', ma_long)['MA'],
+        'MA_short': indicator('MA', ma_short)['MA'],
+    }
+
+# RSI
+def rsi_column(indicator, period):
+    return {'RSI': indicator('RSI', period)['RSI']}
+
+# 布林通道
+def bollinger(indicator, period, nbdev):
+    bb = indicator('BBANDS', period)
+    return {
+        'BB_MID': bb['BB_MID'],
+        'BB_STD': bb['BB_STD'],
+        'BB_UP': bb['BB_MID'] + nbdev * bb['BB_STD'],
+        'BB_DOWN': bb['BB_MID'] - nbdev * bb['BB_STD'],
+    }
+
+# MACD
+def macd_columns(indicator, fast, slow, signal):
+    macd = indicator('MACD', fast, slow, signal)
+    return {name: macd[name] for name in ['MACD', 'MACD_SIGNAL', 'MACD_HIST']}
+
+# 均線交叉策略與累積報酬；rules 為 position_engine 的出場規則(allow_short、stop_loss、take_profit、max_hold)
+def ma_cross_strategy(indicator, close, short_window, long_window, rules=None):
+    close = as_float64(close)
+    short_ma = indicator('MA', short_window)['MA']
+    long_ma = indicator('MA', long_window)['MA']
+    signal = strategies.ma_cross_signal(short_ma, long_ma, price=close, **(rules or {}))
+    returns = np.r_[np.nan, close[1:] / close[:-1] - 1]
+    strategy_return = np.r_[np.nan, signal[:-1] * returns[1:]]
+    return {
+        'short_ma': short_ma,
+        'long_ma': long_ma,
+        'signal': signal,
+        'position': np.r_[np.nan, np.diff(signal)],
+        'return': returns,
+        'strategy_return': strategy_return,
+        'cum_strategy_return': _cumprod(strategy_return),
+        'cum_market_return': _cumprod(returns),
+    }
+
+# RSI 策略與累積報酬(returns 為 ma_cross_strategy 的 'return'；停損停利需傳入 close)
+def rsi_strategy(rsi, returns, buy_thres, sell_thres, close=None, rules=None):
+    price = None if close is None else as_float64(close)
+    signal = strategies.rsi_signal(rsi, buy_thres, sell_thres, price=price, **(rules or {}))
+    strategy_return = np.r_[np.nan, signal[:-1] * returns[1:]]
+    return {
+        'rsi_signal': signal,
+        'rsi_strat_return': strategy_return,
+        'cum_rsi_strat_return': _cumprod(strategy_return),
+    }
+
+# 依看板順序計算全部區塊，回傳合併的欄位字典
+def dashboard_block(indicator, close, params=None):
+    params = {**DEFAULT_PARAMS, **(params or {})}
+    columns = {}
+    columns.update(moving_averages(indicator, params['ma_long'], params['ma_short']))
+    columns.update(rsi_column(indicator, params['rsi_period']))
+    columns.update(bollinger(indicator, params['bb_period'], params['bb_std']))
+    columns.update(macd_columns(indicator, params['macd_fast'], params['macd_slow'], params['macd_signal']))
+    columns.update(ma_cross_strategy(indicator, close, params['short_window'], params['long_window']))
+    columns.update(rsi_strategy(columns['RSI'], columns['return'], params['rsi_buy'], params['rsi_sell'], close))
+    return columns
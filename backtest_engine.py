@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+事件驅動的 K 棒回測引擎
+逐根K棒呼叫策略函數，策略透過 Buy/Sell/SetPosition 下單，實際進出場交給 order_streamlit.Record
+依商品合約規格(contract_spec)扣除手續費、交易稅並套用契約乘數
+另提供訊號陣列策略的向量化快速路徑 run_signal，結果與逐根執行相同
+"""
+
+import numpy as np
+from order_streamlit import Record
+from contract_spec import get_spec
+from bar_schema import as_float64
+
+class BarBacktest():
+    # bars: {欄位: 陣列}(至少包含 time 與 close)；spec 未給時依商品代碼查合約規格
+    def __init__(self, bars, product, spec=None):
+        self.Bars = bars
+        self.Time = np.asarray(bars['time'])
+        self.Close = as_float64(bars['close'])
+        self.Product = product
+        self.Spec = spec if spec is not None else get_spec(product)
+        self.Record = Record(self.Spec)
+        self.Position = 0
+        self.Index = 0
+        # 目前K棒的收盤價(成交價)
+        self.Price = 0.0
+
+    # 買進 qty 口：先回補空單，剩下的口數建立多單
+    def Buy(self, qty=1):
+        i = self.Index
+        cover = min(qty, max(-self.Position, 0))
+        if cover:
+            self.Record.Cover('B', self.Product, self.Time[i], self.Price, cover)
+        if qty - cover:
+            self.Record.Order('B', self.Product, self.Time[i], self.Price, qty - cover)
+        self.Position += qty
+
+    # 賣出 qty 口：先平多單，剩下的口數建立空單
+    def Sell(self, qty=1):
+        i = self.Index
+        cover = min(qty, max(self.Position, 0))
+        if cover:
+            self.Record.Cover('S', self.Product, self.Time[i], self.Price, cover)
+        if qty - cover:
+            self.Record.Order('S', self.Product, self.Time[i], self.Price, qty - cover)
+        self.Position -= qty
+
+    # 調整到目標部位(正數多單、負數空單、0 空手)
+    def SetPosition(self, target):
+        if target > self.Position:
+            self.Buy(target - self.Position)
+        elif target < self.Position:
+            self.Sell(self.Position - target)
+
+    # 逐根執行策略 strategy(engine, i)，以第 i 根收盤價成交，回傳 Record
+    def Run(self, strategy):
+        close = self.Close.tolist()
+        for i in range(len(close)):
+            self.Index = i
+            self.Price = close[i]
+            strategy(self, i)
+        return self.Record
+
+# 訊號陣列策略：訊號即每根收盤後的目標部位(1 多單、-1 空單、0 空手)
+def signal_strategy(signal, qty=1):
+    signal = np.asarray(signal).tolist()
+    def strategy(engine, i):
+        if signal[i] * qty != engine.Position:
+            engine.SetPosition(signal[i] * qty)
+    return strategy
+
+# 訊號陣列的向量化快速路徑：一次找出所有進出場點，整批寫入 Record
+# 結果與 BarBacktest(...).Run(signal_strategy(signal, qty)) 相同，最後未平倉的部位留在 Record 的未平倉中
+def run_signal(bars, signal, product, spec=None, qty=1):
+    spec = spec if spec is not None else get_spec(product)
+    record = Record(spec)
+    time = np.asarray(bars['time'])
+    close = as_float64(bars['close'])
+    signal = np.sign(np.asarray(signal)).astype(np.int8)
+    prev = np.r_[np.int8(0), signal[:-1]]
+    entries = np.flatnonzero((signal != 0) & (signal != prev))
+    exits = np.flatnonzero((prev != 0) & (signal != prev))
+    # 第 k 次出場對應第 k 次進場
+    n = len(exits)
+    record.AddTrades(signal[entries[:n]], product, time[entries[:n]], close[entries[:n]],
+                     time[exits], close[exits], qty)
+    if len(entries) > n:
+        i = entries[-1]
+        record.Order('B' if signal[i] > 0 else 'S', product, time[i], close[i], qty)
+    return record
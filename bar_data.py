@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+欄位式 K 棒容器：直接包裝底層 numpy 陣列，不經過 Python 物件複製
+以字典方式取值(KBar_dic['close'])，可直接交給 CandlePlot 與策略程式使用
+"""
+
+from collections.abc import Mapping
+import numpy as np
+import pandas as pd
+
+class BarData(Mapping):
+    # columns: {欄位: 陣列}，time 為 datetime64；product 為單一商品代碼
+    def __init__(self, columns, product):
+        self.Columns = {name: np.asarray(values) for name, values in columns.items()}
+        if 'time' in self.Columns:
+            self.Columns['time'] = self.Columns['time'].astype('datetime64[ns]', copy=False)
+        self.Product = product
+
+    # 'product' 欄以 broadcast view 呈現(不配置整條字串陣列)
+    def __getitem__(self, key):
+        if key == 'product':
+            return np.broadcast_to(np.array(self.Product, dtype=object), (self.Rows(),))
+        return self.Columns[key]
+
+    def __iter__(self):
+        yield from self.Columns
+        yield 'product'
+
+    def __len__(self):
+        return len(self.Columns) + 1
+
+    # K 棒筆數
+    def Rows(self):
+        return len(next(iter(self.Columns.values()))) if self.Columns else 0
+
+    # 第 [i0, i1) 根(各欄位皆為 view)
+    def Slice(self, i0, i1):
+        return BarData({name: values[i0:i1] for name, values in self.Columns.items()}, self.Product)
+
+    # 轉成 DataFrame(不複製欄位)
+    def ToFrame(self, fields=None):
+        fields = fields or list(self.Columns)
+        return pd.DataFrame({name: self.Columns[name] for name in fields}, copy=False)
+
+# DataFrame 或 {欄位: 陣列} → BarData(只取出底層陣列)
+def to_bar_data(bars, product):
+    if isinstance(bars, pd.DataFrame):
+        bars = {name: bars[name].to_numpy() for name in bars.columns}
+    return BarData(bars, product)
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+多週期K棒金字塔：1 分 → 5 分 → 15 分 → 60 分 → 日K
+每一層都由下一層以分組 OHLCV 彙總(reduceat)建立，切換週期時不必重新處理完整的 1 分K
+分組依期交所交易時段對齊：日盤 08:45–13:45、夜盤 15:00–次日 05:00，夜盤歸入下一個營業日
+K棒時間為該根的結束時間(與原始資料相同，08:46 代表 08:45–08:46 這一分鐘)
+"""
+
+import numpy as np
+from downsample import merge_ohlc
+
+MINUTE = 60 * 10**9
+DAY = 24 * 60 * MINUTE
+# 交易時段(距午夜的分鐘數)
+DAY_OPEN, DAY_CLOSE = 8 * 60 + 45, 13 * 60 + 45
+NIGHT_OPEN, NIGHT_CLOSE = 15 * 60, 5 * 60
+
+# 週期名稱 → 分鐘數(日K為 None)，依由細到粗排列
+TIMEFRAMES = {'1m': 1, '5m': 5, '15m': 15, '60m': 60, '1d': None}
+
+def _Nanoseconds(time):
+    return np.asarray(time).astype('datetime64[ns]').view(np.int64)
+
+# 每根K棒所屬交易時段的開盤與收盤時間(int64 ns)
+# 13:45–15:00 之間的K棒歸入日盤，05:00–08:45 之間的歸入前一個夜盤
+def session_bounds(time):
+    t = _Nanoseconds(time)
+    midnight = t // DAY * DAY
+    tod = t - midnight
+    evening = tod > NIGHT_OPEN * MINUTE
+    early = tod <= DAY_OPEN * MINUTE
+    night = evening | early
+    start = np.where(night, midnight + NIGHT_OPEN * MINUTE - np.where(early, DAY, 0), midnight + DAY_OPEN * MINUTE)
+    length = np.where(night, (NIGHT_CLOSE + 24 * 60 - NIGHT_OPEN) * MINUTE, (DAY_CLOSE - DAY_OPEN) * MINUTE)
+    return start, start + length
+
+# 每根K棒的交易日：日盤為當天，夜盤為開盤日的下一個營業日(holidays 為休市日列表)
+def trade_date(time, holidays=None):
+    start, _ = session_bounds(time)
+    day = start.astype('datetime64[ns]').astype('datetime64[D]')
+    night = (start - start // DAY * DAY) == NIGHT_OPEN * MINUTE
+    shifted = np.busday_offset(day[night], 1, roll='forward', holidays=holidays if holidays is not None else [])
+    day[night] = shifted
+    return day
+
+# 依每根K棒的新時間標籤(已排序)合併，標籤相同的連續K棒合成一根
+def _group(bars, label):
+    starts = np.flatnonzero(np.r_[True, label[1:] != label[:-1]])
+    merged = merge_ohlc(bars, starts)
+    merged['time'] = label[starts].view('datetime64[ns]')
+    if 'amount' in bars:
+        # float32 的金額以 float64 累加後再轉回，避免日K加總的捨入誤差
+        amount = np.asarray(bars['amount'])
+        merged['amount'] = np.add.reduceat(amount, starts, dtype=np.float64).astype(amount.dtype)
+    return merged
+
+# 合併成 minutes 分K：從時段開盤起每 minutes 分鐘一根，最後一根截在收盤時間
+def resample(bars, minutes):
+    t = _Nanoseconds(bars['time'])
+    if len(t) == 0:
+        return {name: np.asarray(values)[:0] for name, values in bars.items()}
+    start, end = session_bounds(t)
+    period = minutes * MINUTE
+    label = np.minimum(start + -(-(t - start) // period) * period, end)
+    return _group(bars, label)
+
+# 合併成日K：同一交易日(夜盤 + 日盤)合成一根，時間標為該交易日日盤收盤
+def resample_daily(bars, holidays=None):
+    if len(bars['close']) == 0:
+        return {name: np.asarray(values)[:0] for name, values in bars.items()}
+    day = trade_date(bars['time'], holidays)
+    label = day.astype('datetime64[ns]').view(np.int64) + DAY_CLOSE * MINUTE
+    return _group(bars, label)
+
+# 由 1 分K 逐層建立整個金字塔，回傳 {週期名稱: {欄位: 陣列}}
+def build_pyramid(bars, holidays=None):
+    pyramid = {'1m': bars}
+    prev = bars
+    for name, minutes in TIMEFRAMES.items():
+        if name == '1m':
+            continue
+        prev = resample(prev, minutes) if minutes else resample_daily(prev, holidays)
+        pyramid[name] = prev
+    return pyramid
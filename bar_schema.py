@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+K 棒的精簡欄位型態(欄位式儲存與 KBar 產生器共用)
+time：datetime64[ns]，即 int64 的 epoch 奈秒(.view(np.int64) 零複製取得整數)
+open/high/low/close/amount：float32，約 7 位有效數字；價格低於 65536 時捨入誤差不超過 0.002，
+    因此最多 PRICE_DECIMALS 位小數的價格由 as_float64 四捨五入後可還原成與原始 float64 完全相同的值
+    (均線相等等邊界情況的訊號不會因型態改變而翻轉)，計算時一律以 as_float64 轉回
+volume：int32(單根最多約 21 億口)
+商品：不再逐根存字串，整段資料一個商品代碼；多商品時以 int16 代碼加上代碼表
+每根K棒由 8+8×4+8+8 位元組(另有逐根的商品物件指標)降為 8+4×4+4+4 位元組，常駐記憶體約減半
+檢查轉換前後的價格、技術指標、回測與批次回測結果：python bar_schema.py
+"""
+
+import sys
+import numpy as np
+import pandas as pd
+
+SCHEMA = {
+    'time':   'datetime64[ns]',
+    'open':   'float32',
+    'high':   'float32',
+    'low':    'float32',
+    'close':  'float32',
+    'volume': 'int32',
+    'amount': 'float32',
+}
+PRICE_FIELDS = ['open', 'high', 'low', 'close']
+# 價格的小數位數(期交所報價最小跳動 0.01)
+PRICE_DECIMALS = 2
+PRODUCT_CODE = 'int16'
+
+# 轉成精簡型態(time 可為字串、datetime 或 datetime64)；volume 超出 int32 範圍時拋出 ValueError
+def to_compact(bars):
+    compact = {}
+    for name, values in bars.items():
+        if name not in SCHEMA:
+            continue
+        if name == 'time':
+            values = pd.to_datetime(np.asarray(values)).to_numpy(dtype='datetime64[ns]')
+        elif name == 'volume':
+            values = np.asarray(values)
+            if len(values) and (values.max() > np.iinfo(np.int32).max or values.min() < np.iinfo(np.int32).min):
+                raise ValueError('volume 超出 int32 範圍')
+        compact[name] = np.ascontiguousarray(values, dtype=SCHEMA[name])
+    return compact
+
+# 價格轉成計算用的 float64：float32 四捨五入到 PRICE_DECIMALS 位還原原值，其他型態直接轉換
+def as_float64(price):
+    price = np.asarray(price)
+    if price.dtype == np.float32:
+        return np.round(price.astype(np.float64), PRICE_DECIMALS)
+    return price.astype(np.float64, copy=False)
+
+# 轉回 float64 計算用的欄位(time 不變)
+def to_float64(bars):
+    return {name: as_float64(values) if name in PRICE_FIELDS else
+            np.asarray(values, dtype=np.float64) if name == 'amount' else values
+            for name, values in bars.items()}
+
+# 價格以 float32 儲存的最大捨入誤差
+def price_tolerance(price):
+    return float(np.spacing(np.float32(np.max(np.abs(price))))) / 2
+
+# 商品名稱 ↔ int16 代碼
+def encode_products(products):
+    categories, codes = np.unique(np.asarray(products, dtype=object).astype(str), return_inverse=True)
+    return codes.astype(PRODUCT_CODE), [str(c) for c in categories]
+
+def decode_products(codes, categories):
+    return np.asarray(categories, dtype=object)[codes]
+
+# 陣列字典的位元組數(物件陣列只計指標，共用的字串物件不重複計算)
+def nbytes(bars):
+    return sum(np.asarray(values).nbytes for values in bars.values())
+
+# ──────────────────────────────────────────────────────────────────────────────
+# 檢查一個 .pkl：原始 float64 與精簡型態的價格誤差、技術指標差異、回測結果與記憶體
+def verify(pkl_path, product='X'):
+    import indicator_engine
+    import strategies
+    from backtest_engine import run_signal
+    df = pd.read_pickle(pkl_path)
+    original = {name: df[name].to_numpy() for name in SCHEMA}
+    original['time'] = pd.to_datetime(df['time']).to_numpy(dtype='datetime64[ns]')
+    original['product'] = np.repeat(product, len(df)).astype(object)
+    compact = to_compact(original)
+    restored = to_float64(compact)
+    report = {
+        'rows': len(df),
+        'bytes_original': nbytes(original),
+        'bytes_compact': nbytes(compact),
+        'price_max_error': max(float(np.max(np.abs(compact[n] - original[n]))) for n in PRICE_FIELDS),
+        'price_tolerance': price_tolerance(original['high']),
+        'price_restored': all(np.array_equal(restored[n], original[n]) for n in PRICE_FIELDS),
+        'volume_exact': bool(np.array_equal(compact['volume'], original['volume'])),
+    }
+    # 技術指標(與看板相同的預設參數)；精簡型態直接傳入，與看板一樣由各函數以 as_float64 轉回
+    close64, close32 = original['close'].astype(np.float64), compact['close']
+    diffs = []
+    for name, params in [('MA', (20,)), ('RSI', (14,)), ('BBANDS', (20,)), ('MACD', (12, 26, 9))]:
+        a = indicator_engine.INDICATORS[name](close64, *params)
+        b = indicator_engine.INDICATORS[name](as_float64(close32), *params)
+        for key in a:
+            scale = np.nanmax(np.abs(a[key])) or 1.0
+            diffs.append(float(np.nanmax(np.abs(a[key] - b[key]))) / scale)
+    report['indicator_max_rel_error'] = max(diffs)
+    # 均線交叉回測(含交易成本)
+    def backtest(close):
+        ma = indicator_engine.ma
+        signal = strategies.ma_cross_signal(ma(as_float64(close), 5)['MA'], ma(as_float64(close), 20)['MA'])
+        return run_signal({'time': original['time'], 'close': close}, signal, product).GetStatistics()
+    a, b = backtest(close64), backtest(close32)
+    report['backtest_trades'] = (a['TotalNumber'], b['TotalNumber'])
+    report['backtest_profit'] = (a['TotalProfit'], b['TotalProfit'])
+    report['backtest_rel_error'] = abs(a['TotalProfit'] - b['TotalProfit']) / max(abs(a['TotalProfit']), 1e-12)
+    # 批次回測由欄位式儲存讀取精簡型態，含成本的結果須與原始 float64 價格經 run_signal 算出的相同
+    import batch_backtest
+    from contract_spec import get_spec
+    params = batch_backtest.DEFAULT_PARAMS
+    signals = {
+        '均線交叉': strategies.ma_cross_signal(indicator_engine.ma(close64, params['short_window'])['MA'],
+                                           indicator_engine.ma(close64, params['long_window'])['MA']),
+        'RSI': strategies.rsi_signal(indicator_engine.rsi(close64, params['rsi_period'])['RSI'],
+                                     params['rsi_buy'], params['rsi_sell']),
+    }
+    batch_product = batch_backtest.product_of(pkl_path)
+    spec = get_spec(batch_product)
+    expected = {name: run_signal({'time': original['time'], 'close': close64}, signal, batch_product, spec)
+                .GetTotalProfitRate()
+                for name, signal in signals.items()}
+    batch = {row['策略']: row['最終報酬'] for row in batch_backtest.backtest_file(pkl_path)}
+    report['batch_return'] = {name: (expected[name], batch[name]) for name in expected}
+    report['batch_match'] = all(abs(expected[name] - batch[name]) < 1e-12 for name in expected)
+    return report
+
+if __name__ == '__main__':
+    import glob
+    failed = False
+    for path in sorted(glob.glob('./*.pkl')):
+        report = verify(path)
+        ok = (report['price_max_error'] <= report['price_tolerance'] and report['price_restored']
+              and report['volume_exact'] and report['indicator_max_rel_error'] < 1e-12
+              and report['backtest_trades'][0] == report['backtest_trades'][1] and report['backtest_rel_error'] < 1e-12
+              and report['batch_match'])
+        failed |= not ok
+        print('通過' if ok else '失敗', path)
+        for key, value in report.items():
+            print(f'    {key}: {value}')
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+"""
+欄位式 K 棒儲存：每個欄位一個可 memory-map 的 .npy 檔，依月份分區
+目錄結構：bar_store/<檔名_路徑雜湊>/<YYYY-MM>/<欄位>.npy，另有 manifest.json 記錄各分區的起訖時間與筆數
+讀取時只開啟與查詢區間重疊的分區，載入時間與記憶體隨查詢區間大小而非整個檔案大小成長
+盤中新增的K棒以 append_bars 寫成封存分段(segments/<序號>/<欄位>.npy，寫入後不再修改)，
+讀取時分段接在月分區之後成為同一個序列；分段累積到 MAX_SEGMENTS 個時由 compact 併回月分區
+原始 .pkl 更新而重新轉換時，新增過且晚於新檔最後一根的K棒會保留下來
+同一個資料集同時只能有一個寫入者(例如即時盤行程)，讀取者隨時可讀(manifest 以換檔方式更新)
+轉換既有檔案：python bar_store.py；合併分段：python bar_store.py compact
+"""
+
+import glob
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+import bar_schema
+
+STORE_ROOT = './bar_store'
+# 分段數達到此值時自動合併
+MAX_SEGMENTS = 32
+# 新增的K棒與已儲存的K棒時間重疊時，以這些欄位確認是同一根
+CHECK_FIELDS = bar_schema.PRICE_FIELDS + ['volume']
+
+# 欄位與型態(精簡型態，見 bar_schema)
+FIELDS = bar_schema.SCHEMA
+
+# ──────────────────────────────────────────────────────────────────────────────
+# 資料集目錄：原始檔名加上完整路徑的雜湊，不同資料夾中的同名檔案各自一個資料集
+def dataset_dir(pkl_path, root=STORE_ROOT):
+    name = os.path.basename(pkl_path).replace('.pkl', '')
+    digest = hashlib.sha1(os.path.normcase(os.path.abspath(pkl_path)).encode('utf-8')).hexdigest()[:10]
+    return os.path.join(root, '%s_%s' % (name, digest))
+
+def _manifest_path(directory):
+    return os.path.join(directory, 'manifest.json')
+
+# 讀取 manifest
+def read_manifest(directory):
+    with open(_manifest_path(directory), encoding='utf-8') as f:
+        return json.load(f)
+
+# 寫入 manifest(先寫暫存檔再換上，讀取者不會讀到寫一半的內容)
+def _write_manifest(directory, manifest):
+    tmp = _manifest_path(directory) + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, _manifest_path(directory))
+
+# 資料集的版本(manifest 的修改時間，轉換、新增K棒、合併時都會改變)；尚未轉換時為 None
+def dataset_version(pkl_path, root=STORE_ROOT):
+    try:
+        return os.stat(_manifest_path(dataset_dir(pkl_path, root))).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+# 月分區與分段(依時間順序)
+def _parts(manifest):
+    return manifest['partitions'] + manifest.get('segments', [])
+
+# 把一段已排序的K棒寫成 directory 下的 name 子目錄(先寫暫存目錄再換上)，回傳分區資料
+def _write_part(directory, name, columns, i0=0, i1=None):
+    i1 = len(columns['time']) if i1 is None else i1
+    path = os.path.join(directory, name)
+    tmp = path + '.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    for field in FIELDS:
+        np.save(os.path.join(tmp, field + '.npy'), columns[field][i0:i1])
+    os.replace(tmp, path)
+    return {
+        'name':  name,
+        'first': int(columns['time'][i0].astype(np.int64)),
+        'last':  int(columns['time'][i1 - 1].astype(np.int64)),
+        'rows':  int(i1 - i0),
+    }
+
+# 依月份切分區，回傳分區資料列表；suffix 加在分區名稱後(合併時與舊分區區隔)
+def _write_months(directory, columns, suffix=''):
+    month = columns['time'].astype('datetime64[M]')
+    bounds = np.flatnonzero(np.r_[True, month[1:] != month[:-1], True])
+    return [_write_part(directory, str(month[i0]) + suffix, columns, i0, i1)
+            for i0, i1 in zip(bounds[:-1], bounds[1:])]
+
+# 寫入一個封存分段並登記到 manifest(不寫回 manifest)
+def _write_segment(directory, manifest, columns):
+    seq = manifest.get('next_segment', 1)
+    os.makedirs(os.path.join(directory, 'segments'), exist_ok=True)
+    manifest.setdefault('segments', []).append(_write_part(directory, 'segments/%06d' % seq, columns))
+    manifest['next_segment'] = seq + 1
+
+# 由 .pkl 轉成欄位式儲存(先寫到暫存目錄再整個換上，避免讀到寫一半的資料)
+# 舊資料集中以 append_bars 新增、晚於新檔最後一根的K棒寫成新資料集的分段
+def convert_pkl(pkl_path, root=STORE_ROOT):
+    df = pd.read_pickle(pkl_path)
+    columns = bar_schema.to_compact({name: df[name].to_numpy() for name in FIELDS})
+    order = np.argsort(columns['time'], kind='stable')
+    columns = {name: values[order] for name, values in columns.items()}
+    directory = dataset_dir(pkl_path, root)
+    tmp = directory + '.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    last = int(columns['time'][-1].astype(np.int64)) if len(columns['time']) else None
+    manifest = {
+        'source':       os.path.basename(pkl_path),
+        'source_mtime': os.path.getmtime(pkl_path),
+        'source_last':  last,
+        'fields':       FIELDS,
+        'partitions':   _write_months(tmp, columns),
+    }
+    appended = _appended(directory, last)
+    if appended is not None:
+        _write_segment(tmp, manifest, appended)
+    _write_manifest(tmp, manifest)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(tmp, directory)
+    return directory
+
+# 舊資料集中晚於原始檔最後一根(也晚於 last 奈秒)的K棒，沒有時回傳 None
+def _appended(directory, last):
+    try:
+        manifest = read_manifest(directory)
+        source_last = manifest.get('source_last', manifest['partitions'][-1]['last'] if manifest['partitions'] else None)
+    except (OSError, ValueError, KeyError):
+        return None
+    start = max(t for t in (source_last, last, -1) if t is not None) + 1
+    if _parts(manifest) and _parts(manifest)[-1]['last'] < start:
+        return None
+    columns = bar_schema.to_compact(read_range(directory, manifest, start))
+    return columns if len(columns['time']) else None
+
+# 開啟資料集：尚未轉換、原始檔更新過或欄位型態改變時自動重新轉換，回傳 (目錄, manifest)
+def open_dataset(pkl_path, root=STORE_ROOT):
+    directory = dataset_dir(pkl_path, root)
+    try:
+        manifest = read_manifest(directory)
+        if manifest['source_mtime'] == os.path.getmtime(pkl_path) and manifest['fields'] == FIELDS:
+            return directory, manifest
+    except (OSError, ValueError, KeyError):
+        pass
+    convert_pkl(pkl_path, root)
+    return directory, read_manifest(directory)
+
+# 資料集的起訖時間
+def time_bounds(manifest):
+    parts = _parts(manifest)
+    return (np.datetime64(parts[0]['first'], 'ns'),
+            np.datetime64(parts[-1]['last'], 'ns'))
+
+# 時間(datetime/date/字串/datetime64)轉成 epoch 奈秒整數
+def to_ns(value):
+    return int(pd.Timestamp(value).value)
+
+# 讀取 [start, end) 區間的 K 棒，只開啟重疊的分區與分段(memory-map)，回傳 {欄位: 陣列}
+def read_range(directory, manifest, start=None, end=None, fields=None):
+    fields = list(fields or manifest['fields'])
+    start = None if start is None else to_ns(start)
+    end = None if end is None else to_ns(end)
+    chunks = {field: [] for field in fields}
+    for part in _parts(manifest):
+        if (start is not None and part['last'] < start) or (end is not None and part['first'] >= end):
+            continue
+        path = os.path.join(directory, part['name'])
+        time = np.load(os.path.join(path, 'time.npy'), mmap_mode='r')
+        i0 = 0 if start is None else np.searchsorted(time.view(np.int64), start, 'left')
+        i1 = len(time) if end is None else np.searchsorted(time.view(np.int64), end, 'left')
+        for field in fields:
+            chunks[field].append(np.load(os.path.join(path, field + '.npy'), mmap_mode='r')[i0:i1])
+    return {field: np.concatenate(chunks[field]) if chunks[field] else np.empty(0, dtype=manifest['fields'][field])
+            for field in fields}
+
+# 讀取第 [i0, i1) 列，只開啟涵蓋的分區；落在單一分區內時回傳 memory-map 的 view
+def read_rows(directory, manifest, i0, i1, fields=None):
+    fields = list(fields or manifest['fields'])
+    chunks = {field: [] for field in fields}
+    offset = 0
+    for part in _parts(manifest):
+        p0, p1 = offset, offset + part['rows']
+        offset = p1
+        if p1 <= i0 or p0 >= i1:
+            continue
+        path = os.path.join(directory, part['name'])
+        for field in fields:
+            column = np.load(os.path.join(path, field + '.npy'), mmap_mode='r')
+            chunks[field].append(column[max(i0, p0) - p0:min(i1, p1) - p0])
+    return {field: (chunks[field][0] if len(chunks[field]) == 1 else np.concatenate(chunks[field]))
+            if chunks[field] else np.empty(0, dtype=manifest['fields'][field])
+            for field in fields}
+
+# ──────────────────────────────────────────────────────────────────────────────
+# 新增K棒：bars 為 {欄位: 陣列}(沒有 amount 時以 收盤價 × 成交量 估計)，時間須遞增
+# 與已儲存K棒時間重疊的部分必須是同一根(CHECK_FIELDS 相同)，視為重送而略過；重疊區間中出現沒有的時間或內容不同時拋出 ValueError
+# 其餘寫成一個封存分段，回傳實際新增的K棒數；分段數達到 max_segments 時自動合併
+def append_bars(pkl_path, bars, root=STORE_ROOT, max_segments=MAX_SEGMENTS):
+    bars = dict(bars)
+    if 'amount' not in bars:
+        bars['amount'] = bar_schema.as_float64(bars['close']) * np.asarray(bars['volume'])
+    columns = bar_schema.to_compact(bars)
+    missing = [field for field in FIELDS if field not in columns]
+    if missing:
+        raise ValueError('缺少欄位：%s' % ', '.join(missing))
+    time = columns['time'].view(np.int64)
+    if np.any(np.diff(time) <= 0):
+        raise ValueError('新增的K棒時間必須遞增')
+    directory, manifest = open_dataset(pkl_path, root)
+    parts = _parts(manifest)
+    last = parts[-1]['last'] if parts else None
+    keep = 0 if last is None else int(np.searchsorted(time, last, 'right'))
+    if keep:
+        stored = read_range(directory, manifest, int(time[0]), last + 1, fields=['time'] + CHECK_FIELDS)
+        i = np.searchsorted(stored['time'].view(np.int64), time[:keep])
+        i = np.minimum(i, len(stored['time']) - 1)
+        same = stored['time'].view(np.int64)[i] == time[:keep]
+        for field in CHECK_FIELDS:
+            same &= stored[field][i] == columns[field][:keep]
+        if not same.all():
+            raise ValueError('新增的K棒與已儲存的K棒不一致：%s' % columns['time'][np.argmin(same)])
+    if keep == len(time):
+        return 0
+    _write_segment(directory, manifest, {field: values[keep:] for field, values in columns.items()})
+    _write_manifest(directory, manifest)
+    if len(manifest['segments']) >= max_segments:
+        compact(pkl_path, root)
+    return len(time) - keep
+
+# 合併：把所有分段與最後一個月分區(同月份的部分)改寫成月分區，回傳新的 manifest
+# 新分區以新的名稱寫入，換上 manifest 之後才刪除舊目錄(已開啟的 memory-map 不受影響)
+def compact(pkl_path, root=STORE_ROOT):
+    directory, manifest = open_dataset(pkl_path, root)
+    segments = manifest.get('segments', [])
+    if not segments:
+        return manifest
+    partitions = list(manifest['partitions'])
+    start = segments[0]['first']
+    # 與第一個分段同月份的月分區一起改寫
+    month = np.datetime64(start, 'ns').astype('datetime64[M]')
+    if partitions and np.datetime64(partitions[-1]['last'], 'ns').astype('datetime64[M]') == month:
+        start = partitions.pop()['first']
+    columns = read_range(directory, manifest, start)
+    generation = manifest.get('generation', 0) + 1
+    new = {**manifest, 'partitions': partitions + _write_months(directory, columns, '.%d' % generation),
+           'segments': [], 'generation': generation}
+    _write_manifest(directory, new)
+    for part in _parts(manifest):
+        if part not in new['partitions']:
+            shutil.rmtree(os.path.join(directory, part['name']), ignore_errors=True)
+    return new
+
+# 即時盤寫入：累積已完成的K棒，達到 flush_rows 根時寫成一個分段
+class SegmentWriter():
+    def __init__(self, pkl_path, root=STORE_ROOT, flush_rows=60):
+        self.Path = pkl_path
+        self.Root = root
+        self.FlushRows = flush_rows
+        self.Pending = []
+        self.Rows = 0
+        # 已交給 Add 的最後一根K棒時間(奈秒)
+        self.Last = None
+        self.Appended = 0
+
+    # 加入已完成的K棒 {欄位: 陣列}
+    def Add(self, bars):
+        bars = bar_schema.to_compact(bars)
+        if not len(bars['time']):
+            return
+        self.Pending.append(bars)
+        self.Rows += len(bars['time'])
+        self.Last = int(bars['time'][-1].astype(np.int64))
+        if self.Rows >= self.FlushRows:
+            self.Flush()
+
+    # 由 KBar(indicator_forKBar_short.KBar，AddPrice 產生)加入上次之後已完成的K棒；最後一根仍在形成中，final=True 時一併寫入
+    def AddKBar(self, kbar, final=False):
+        bars = kbar.TAKBar
+        time = bars['time'].view(np.int64)
+        i0 = 0 if self.Last is None else int(np.searchsorted(time, self.Last, 'right'))
+        i1 = len(time) if final else len(time) - 1
+        if i1 > i0:
+            self.Add({name: values[i0:i1] for name, values in bars.items()})
+
+    # 寫入累積的K棒，回傳實際新增的K棒數
+    def Flush(self):
+        if not self.Pending:
+            return 0
+        bars = {field: np.concatenate([chunk[field] for chunk in self.Pending]) for field in self.Pending[0]}
+        self.Pending, self.Rows = [], 0
+        appended = append_bars(self.Path, bars, self.Root)
+        self.Appended += appended
+        return appended
+
+if __name__ == '__main__':
+    import sys
+    for path in sorted(glob.glob('./*.pkl')):
+        if sys.argv[1:] == ['compact']:
+            manifest = compact(path)
+            print('合併', path, '→', len(manifest['partitions']), '個月分區')
+        else:
+            print('轉換', path, '→', convert_pkl(path))
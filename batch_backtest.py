@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+多商品批次回測：對每個 K 棒檔案各跑一次均線交叉與 RSI 策略
+訊號經 backtest_engine.run_signal 進出場，依商品合約規格扣除手續費與交易稅(與看板的含成本回測相同)
+每個檔案交給行程池中的一個 worker(預設一核一個)，總耗時約等於最慢的一個檔案
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import bar_store
+import indicator_engine
+import strategies
+from backtest_engine import run_signal
+from bar_schema import as_float64
+from contract_spec import get_spec
+
+# 預設策略參數(與看板滑桿預設值相同)
+DEFAULT_PARAMS = {
+    'short_window': 5,
+    'long_window': 20,
+    'rsi_period': 14,
+    'rsi_buy': 30,
+    'rsi_sell': 70,
+}
+
+# 由檔名抓商品代碼(future_KBar_CBF_... → CBF)
+def product_of(path):
+    return os.path.basename(path).replace('.pkl', '').split('_')[2]
+
+# 單一檔案回測，回傳每個策略一列的結果
+# ma_rules、rsi_rules 為兩個策略的出場規則(allow_short、stop_loss、take_profit、max_hold，與看板相同)
+# 最終報酬為已平倉交易扣除成本後的累計投資報酬率，總盈虧以元計(點數 × 契約乘數)，最後未平倉的部位不計入
+def backtest_file(path, params=None, ma_rules=None, rsi_rules=None, root=bar_store.STORE_ROOT):
+    params = {**DEFAULT_PARAMS, **(params or {})}
+    directory, manifest = bar_store.open_dataset(path, root)
+    bars = bar_store.read_range(directory, manifest, fields=['time', 'close'])
+    # 價格以 float32 儲存，還原成 float64 再計算(與看板相同的指標與訊號)
+    time, close = bars['time'], as_float64(bars['close'])
+    product = product_of(path)
+    signals = {
+        '均線交叉': strategies.ma_cross_signal(
+            indicator_engine.ma(close, params['short_window'])['MA'],
+            indicator_engine.ma(close, params['long_window'])['MA'],
+            price=close, **(ma_rules or {})),
+        'RSI': strategies.rsi_signal(
+            indicator_engine.rsi(close, params['rsi_period'])['RSI'],
+            params['rsi_buy'], params['rsi_sell'], price=close, **(rsi_rules or {})),
+    }
+    spec = get_spec(product)
+    market = close[-1] / close[0] - 1 if len(close) else 0.0
+    rows = []
+    for name, signal in signals.items():
+        record = run_signal({'time': time, 'close': close}, signal, product, spec)
+        rows.append({
+            '商品': product,
+            '策略': name,
+            '最終報酬': record.GetTotalProfitRate(),
+            '總盈虧': record.GetTotalProfit() * spec.Multiplier,
+            '市場報酬': market,
+            '勝率': record.GetWinRate(),
+            'MDD': record.GetMDD(),
+            'MDD_rate': record.GetMDD_rate(),
+            '交易次數': record.GetTotalNumber(),
+            'K棒數': len(close),
+        })
+    return rows
+
+# 批次回測多個檔案，回傳合併的比較表
+def run_batch(paths, params=None, max_workers=None, ma_rules=None, rsi_rules=None):
+    paths = list(paths)
+    if not paths:
+        return pd.DataFrame()
+    # 先在主行程建好欄位式儲存，避免多個 worker 同時轉換同一個檔案
+    for path in paths:
+        bar_store.open_dataset(path)
+    max_workers = min(max_workers or os.cpu_count() or 1, len(paths))
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        n = len(paths)
+        results = list(pool.map(backtest_file, paths, [params] * n, [ma_rules] * n, [rsi_rules] * n))
+    return pd.DataFrame([row for rows in results for row in rows])
+
+if __name__ == '__main__':
+    import glob
+    import time
+    t0 = time.perf_counter()
+    print(run_batch(sorted(glob.glob('./*.pkl'))).to_string())
+    print(f"耗時 {time.perf_counter() - t0:.2f} 秒")
@@ -0,0 +1,432 @@
+# -*- coding: utf-8 -*-
+"""
+效能測試：量測 K 棒建構、Record、資料載入與看板計算等熱點路徑的速度
+合成資料固定亂數種子，搭配專案內的 .pkl 檔，結果可重現
+執行：python benchmark_suite.py [--quick] [--output 結果.json] [--compare 基準.json] [--threshold 0.2]
+--compare 會與基準檔逐項比較，變慢超過門檻的項目列為退步並以結束碼 1 離開
+"""
+
+import argparse
+import datetime
+import glob
+import json
+import os
+import pickle
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+import indicator_forKBar_short
+import indicator_f_Lo2_short
+import bar_store
+import analysis
+import shared_cache
+import walk_forward
+import robustness
+import position_engine
+import catalog
+import panel
+import param_sweep
+from order_streamlit import Record
+from indicator_engine import IndicatorEngine
+from bar_data import to_bar_data
+from backtest_engine import BarBacktest, run_signal, signal_strategy
+
+# ──────────────────────────────────────────────────────────────────────────────
+# 合成報價：每筆間隔 1 分鐘，確保每筆都會開新 K 棒
+def synthetic_minute_prices(n, seed=0):
+    rng = np.random.default_rng(seed)
+    start = datetime.datetime(2024, 1, 2, 8, 45)
+    times = [start + datetime.timedelta(minutes=i) for i in range(n)]
+    close = 20000 + np.cumsum(rng.normal(0, 5, n))
+    volume = rng.integers(1, 50, n)
+    return times, close.tolist(), volume.tolist()
+
+# 合成逐筆成交：平均每筆間隔 interval 秒，回傳 datetime64 時間、價格、口數、累計成交量
+def synthetic_ticks(n, interval=2.0, seed=0):
+    rng = np.random.default_rng(seed)
+    start = np.datetime64('2024-01-02T08:45:00', 'ns')
+    gaps = rng.exponential(interval * 1e9, n).astype(np.int64)
+    tick_time = start + np.cumsum(gaps).astype('timedelta64[ns]')
+    price = np.round(20000 + np.cumsum(rng.normal(0, 1, n)))
+    qty = rng.integers(1, 10, n)
+    return tick_time, price, qty, np.cumsum(qty)
+
+# KBar.AddPrice：量測每根 K 棒的平均新增成本，成本應不隨 K 棒數量成長
+def bench_kbar_addprice(sizes=(10_000, 50_000, 200_000), capacity=None):
+    result = {}
+    for n in sizes:
+        times, close, volume = synthetic_minute_prices(n)
+        kbar = indicator_forKBar_short.KBar('2024-01-02', 1, capacity=capacity)
+        t0 = time.perf_counter()
+        for t, c, v in zip(times, close, volume):
+            kbar.AddPrice(t, c, c, c, c, v)
+        elapsed = time.perf_counter() - t0
+        result[n] = elapsed / n * 1e6
+    return result
+
+# 舊版 To_Dictionary(經 df.to_dict() 與逐筆 to_pydatetime)，作為比較基準
+def _legacy_to_dictionary(df, product_name):
+    d = df.to_dict()
+    return {
+        'time':   np.array([t.to_pydatetime() for t in d['time'].values()]),
+        'open':   np.array(list(d['open'].values())),
+        'high':   np.array(list(d['high'].values())),
+        'low':    np.array(list(d['low'].values())),
+        'close':  np.array(list(d['close'].values())),
+        'volume': np.array(list(d['volume'].values())),
+        'amount': np.array(list(d['amount'].values())),
+        'product': np.repeat(product_name, len(d['time']))
+    }
+
+# 計時(取 repeat 次中最快的一次，單位秒)
+def _best_of(func, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+# st.cache_data 對參數做雜湊的成本(未安裝 streamlit 時回傳 None)
+def _cache_hash_cost(*args):
+    try:
+        import hashlib
+        from streamlit.runtime.caching.cache_type import CacheType
+        from streamlit.runtime.caching.hashing import update_hash
+    except ImportError:
+        return None
+    return _best_of(lambda: update_hash(args, hashlib.new('md5'), CacheType.DATA))
+
+# To_Dictionary：舊版轉換 vs 零複製 BarData，以及快取鍵的雜湊成本
+def bench_to_dictionary(pkl_path):
+    directory, manifest = bar_store.open_dataset(pkl_path)
+    bars = bar_store.read_rows(directory, manifest, 0, sum(p['rows'] for p in manifest['partitions']))
+    df = pd.DataFrame(bars)
+    return {
+        'rows': len(df),
+        'legacy_s': _best_of(lambda: _legacy_to_dictionary(df, 'X')),
+        'bar_data_s': _best_of(lambda: to_bar_data(bars, 'X')),
+        'hash_dataframe_s': _cache_hash_cost(df, 'X'),
+        'hash_row_range_s': _cache_hash_cost(pkl_path, 0, len(df)),
+    }
+
+# indicator_f_Lo2_short.KBar 時間K棒：逐筆 TimeAdd 與批次 TimeBatchAdd 的每筆成交成本(µs)
+def bench_time_bars(n=200_000, cycle=1):
+    tick_time, price, qty, _ = synthetic_ticks(n)
+    prod = np.full(n, 'TXF', dtype=object)
+    times = tick_time.astype('datetime64[us]').tolist()
+    price_list, qty_list = price.tolist(), qty.tolist()
+    def loop():
+        kbar = indicator_f_Lo2_short.KBar('20240102', 'time', cycle)
+        for t, p, q in zip(times, price_list, qty_list):
+            kbar.TimeAdd(t, p, q, 'TXF')
+    def batch():
+        kbar = indicator_f_Lo2_short.KBar('20240102', 'time', cycle)
+        kbar.TimeBatchAdd(tick_time, price, qty, prod)
+    return {
+        'ticks': n,
+        'time_add_us': _best_of(loop, 1) / n * 1e6,
+        'time_batch_add_us': _best_of(batch, 3) / n * 1e6,
+    }
+
+# indicator_f_Lo2_short.KBar 量K棒：逐筆 VolumeAdd 與批次 VolumeBatchAdd 的每筆成交成本(µs)
+def bench_volume_bars(n=200_000, cycle=500):
+    _, price, _, amount = synthetic_ticks(n)
+    price_list, amount_list = price.tolist(), amount.tolist()
+    def loop():
+        kbar = indicator_f_Lo2_short.KBar('20240102', 'volume', cycle)
+        for p, a in zip(price_list, amount_list):
+            kbar.VolumeAdd(p, a)
+    def batch():
+        kbar = indicator_f_Lo2_short.KBar('20240102', 'volume', cycle)
+        kbar.VolumeBatchAdd(price, amount)
+    return {
+        'ticks': n,
+        'volume_add_us': _best_of(loop, 1) / n * 1e6,
+        'volume_batch_add_us': _best_of(batch, 3) / n * 1e6,
+    }
+
+# Record：大口數進出場(分多次部分平倉)的每筆成本，以及每個 Get* 統計在大量交易後的成本
+def bench_record(n=20_000, lot=500, covers=5):
+    rng = np.random.default_rng(0)
+    price = 20000 + np.cumsum(rng.normal(0, 5, 2 * n))
+    times = np.arange(2 * n).astype('datetime64[m]').astype('datetime64[ns]')
+    record = Record()
+    t0 = time.perf_counter()
+    for i in range(n):
+        record.Order('B', 'TXF', times[2 * i], price[2 * i], lot)
+        for _ in range(covers):
+            record.Cover('S', 'TXF', times[2 * i + 1], price[2 * i + 1], lot // covers)
+    elapsed = time.perf_counter() - t0
+    result = {
+        'trades': n,
+        'lot': lot,
+        'order_cover_us': elapsed / n * 1e6,
+    }
+    getters = ['GetTotalProfit', 'GetTotalNumber', 'GetAverageProfit', 'GetAverageProfitRate', 'GetWinRate',
+               'GetAccLoss', 'GetMDD', 'GetMDD_rate', 'GetAverEarn', 'GetAverLoss', 'GetCumulativeProfit',
+               'GetCumulativeProfit_rate', 'GetProfit', 'GetProfitRate', 'GetTradeRecord', 'GetTradeColumns',
+               'GetStatistics']
+    for name in getters:
+        getter = getattr(record, name)
+        result[f'{name}_us'] = _best_of(getter, 20) * 1e6
+    return result
+
+# load_data：欄位式儲存讀取完整歷史、最近一個月與直接讀取 .pkl 的比較
+def bench_load_data(pkl_path):
+    directory, manifest = bar_store.open_dataset(pkl_path)
+    rows = sum(p['rows'] for p in manifest['partitions'])
+    last = manifest['partitions'][-1]['rows']
+    return {
+        'rows': rows,
+        'read_pickle_s': _best_of(lambda: pd.read_pickle(pkl_path), 3),
+        'read_rows_all_s': _best_of(lambda: bar_store.read_rows(directory, manifest, 0, rows)),
+        'read_rows_last_month_s': _best_of(lambda: bar_store.read_rows(directory, manifest, rows - last, rows)),
+    }
+
+# 多個 session 同時載入同一份資料的記憶體：st.cache_data(每次取用都是 pickle 複本) vs 共用快取的唯讀 view
+def bench_shared_cache(pkl_path, sessions=20):
+    directory, manifest = bar_store.open_dataset(pkl_path)
+    bars = bar_store.read_range(directory, manifest)
+    blob = pickle.dumps(bars)
+    cache = shared_cache.SharedCache()
+    def held_bytes(get):
+        tracemalloc.start()
+        held = [get() for _ in range(sessions)]
+        current = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del held
+        return current
+    return {
+        'sessions': sessions,
+        'dataset_bytes': sum(v.nbytes for v in bars.values()),
+        'copy_per_session_bytes': held_bytes(lambda: pickle.loads(blob)),
+        'shared_view_bytes': held_bytes(lambda: cache.Get('bars', pkl_path, lambda: bars)),
+    }
+
+# 看板的技術指標與策略區塊(analysis.dashboard_block)：冷快取(每次新的 IndicatorEngine)與熱快取
+def bench_dashboard_block(pkl_path):
+    directory, manifest = bar_store.open_dataset(pkl_path)
+    close = bar_store.read_range(directory, manifest, fields=['close'])['close']
+    def run(engine):
+        def indicator(name, *params):
+            return engine.Slice(pkl_path, name, params, close, 0, len(close))
+        return analysis.dashboard_block(indicator, close)
+    warm = IndicatorEngine()
+    run(warm)
+    return {
+        'rows': len(close),
+        'cold_s': _best_of(lambda: run(IndicatorEngine()), 3),
+        'warm_s': _best_of(lambda: run(warm)),
+    }
+
+# 回測引擎：逐根呼叫策略與向量化快速路徑的每秒K棒數(均線交叉多空訊號，含交易成本)
+def bench_backtest_engine(n=200_000):
+    times, close, _ = synthetic_minute_prices(n)
+    close = np.asarray(close)
+    bars = {'time': np.array(times, dtype='datetime64[ns]'), 'close': close}
+    csum = np.r_[0.0, np.cumsum(close)]
+    fast = np.r_[np.full(4, np.nan), (csum[5:] - csum[:-5]) / 5]
+    slow = np.r_[np.full(19, np.nan), (csum[20:] - csum[:-20]) / 20]
+    signal = np.where(fast > slow, 1, -1)
+    return {
+        'bars': n,
+        'callback_bars_per_s': n / _best_of(lambda: BarBacktest(bars, 'TXF').Run(signal_strategy(signal)), 1),
+        'signal_bars_per_s': n / _best_of(lambda: run_signal(bars, signal, 'TXF')),
+    }
+
+# 滾動式最佳化：24 段完整執行(訓練區間掃描參數格 + 測試區間回測)的秒數
+def bench_walk_forward(pkl_path, folds=24):
+    directory, manifest = bar_store.open_dataset(pkl_path)
+    bars = bar_store.read_range(directory, manifest, fields=['time', 'close'])
+    return {
+        'rows': len(bars['close']),
+        'folds': folds,
+        'ma_s': _best_of(lambda: walk_forward.walk_forward(bars, 'X', 'ma', folds, max_workers=1), 1),
+        'rsi_s': _best_of(lambda: walk_forward.walk_forward(bars, 'X', 'rsi', folds, max_workers=1), 1),
+    }
+
+# 均線交叉參數掃描：看板的 29×51 參數格在完整 1 分K 上掃描一次的秒數
+def bench_ma_sweep(pkl_path):
+    directory, manifest = bar_store.open_dataset(pkl_path)
+    close = bar_store.read_range(directory, manifest, fields=['close'])['close']
+    short, long = np.arange(2, 31), np.arange(10, 61)
+    return {
+        'rows': len(close),
+        'pairs': len(short) * len(long),
+        'sweep_s': _best_of(lambda: param_sweep.ma_cross_sweep(close, short, long, start=long[-1]), 3),
+    }
+
+# 蒙地卡羅穩健度分析：trades 筆交易各重抽 samples 次(bootstrap 與 permutation)的秒數
+def bench_robustness(trades=300, samples=10_000):
+    profit = np.random.default_rng(0).normal(0.05, 1.0, trades)
+    return {
+        'trades': trades,
+        'samples': samples,
+        'bootstrap_s': _best_of(lambda: robustness.simulate(profit, samples, 'bootstrap')),
+        'permutation_s': _best_of(lambda: robustness.simulate(profit, samples, 'permutation')),
+    }
+
+# 持倉引擎：RSI 型多空門檻訊號，不含與含停損/停利/最長持有(不動點迭代)的秒數
+def bench_position_engine(n=200_000):
+    rng = np.random.default_rng(0)
+    rsi = 50 + np.cumsum(rng.normal(0, 3, n)).clip(-45, 45)
+    price = 100 * np.exp(np.cumsum(rng.normal(0, 1e-3, n)))
+    conds = (rsi < 30, rsi > 70, rsi > 70, rsi < 30)
+    return {
+        'bars': n,
+        'plain_s': _best_of(lambda: position_engine.positions(*conds)),
+        'stops_s': _best_of(lambda: position_engine.positions(*conds, price, 0.01, 0.02, 500)),
+    }
+
+# 資料集目錄：沒有變動時每次重跑的 Refresh(只 stat 資料夾)與選取商品時的 Check(只 stat 一個檔案)
+def bench_catalog():
+    dataset_catalog = catalog.Catalog()
+    dataset_catalog.Refresh()
+    path = next(iter(dataset_catalog.Entries), None)
+    return {
+        'datasets': len(dataset_catalog.Entries),
+        'refresh_us': _best_of(dataset_catalog.Refresh) * 1e6,
+        'check_us': _best_of(lambda: dataset_catalog.Check(path)) * 1e6 if path else None,
+    }
+
+# 新增K棒：原始檔少掉最後 batches×batch 根，再逐批以 append_bars 寫入分段，最後合併
+# 另比較新增後技術指標的增量延伸與整段重算
+def bench_append(pkl_path, batches=20, batch=60):
+    df = pd.read_pickle(pkl_path)
+    tail = batches * batch
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, os.path.basename(pkl_path))
+        df.iloc[:-tail].to_pickle(path)
+        root = os.path.join(tmp, 'store')
+        bar_store.open_dataset(path, root)
+        rest = {name: df[name].to_numpy()[-tail:] for name in bar_store.FIELDS}
+        elapsed = []
+        for k in range(batches):
+            t0 = time.perf_counter()
+            bar_store.append_bars(path, {name: values[k * batch:(k + 1) * batch] for name, values in rest.items()},
+                                  root, max_segments=batches + 1)
+            elapsed.append(time.perf_counter() - t0)
+        directory, manifest = bar_store.open_dataset(path, root)
+        read_s = _best_of(lambda: bar_store.read_range(directory, manifest))
+        t0 = time.perf_counter()
+        bar_store.compact(path, root)
+        compact_s = time.perf_counter() - t0
+        close = bar_store.read_range(*bar_store.open_dataset(path, root), fields=['close'])['close']
+        shutil.rmtree(root, ignore_errors=True)
+    def extend():
+        engine = IndicatorEngine()
+        for name, params in (('MA', (20,)), ('RSI', (14,)), ('BBANDS', (20,)), ('MACD', (12, 26, 9))):
+            engine.Get('f', name, params, close[:-batch])
+        t0 = time.perf_counter()
+        for name, params in (('MA', (20,)), ('RSI', (14,)), ('BBANDS', (20,)), ('MACD', (12, 26, 9))):
+            engine.Get('f', name, params, close)
+        return time.perf_counter() - t0
+    def full():
+        engine = IndicatorEngine()
+        for name, params in (('MA', (20,)), ('RSI', (14,)), ('BBANDS', (20,)), ('MACD', (12, 26, 9))):
+            engine.Get('f', name, params, close)
+    return {
+        'append_batch_us': float(np.median(elapsed)) * 1e6,
+        'read_with_segments_s': read_s,
+        'compact_s': compact_s,
+        'indicator_extend_s': min(extend() for _ in range(5)),
+        'indicator_full_s': _best_of(full),
+    }
+
+# 多商品面板：全部 .pkl 對齊到 1 分K 時間格，再以均線交叉回測同權重組合
+def bench_panel(paths):
+    t0 = time.perf_counter()
+    data = panel.load_panel(paths)
+    load_s = time.perf_counter() - t0
+    bars = dict(zip(paths, data['bars']))
+    return {
+        'products': len(paths),
+        'rows': len(data['time']),
+        'load_s': load_s,
+        'align_s': _best_of(lambda: panel.load_panel(paths, loader=bars.get)),
+        'backtest_s': _best_of(lambda: panel.portfolio_backtest(data, panel.signals(data, 'ma'))),
+    }
+
+# ──────────────────────────────────────────────────────────────────────────────
+# 執行全部測試，回傳 {測試名稱: {指標: 數值}}；quick=True 時縮小合成資料量
+def run_all(quick=False):
+    scale = 10 if quick else 1
+    results = {}
+    for label, capacity in (('growth', None), ('ring1000', 1000)):
+        sizes = (10_000 // scale, 50_000 // scale)
+        results[f'kbar_addprice_{label}'] = {f'{n}_us': us for n, us in bench_kbar_addprice(sizes, capacity).items()}
+    results['time_bars'] = bench_time_bars(200_000 // scale)
+    results['volume_bars'] = bench_volume_bars(200_000 // scale)
+    results['record'] = bench_record(20_000 // scale)
+    results['backtest_engine'] = bench_backtest_engine(200_000 // scale)
+    results['robustness'] = bench_robustness(samples=10_000 // scale)
+    results['position_engine'] = bench_position_engine(200_000 // scale)
+    results['catalog'] = bench_catalog()
+    results['panel'] = bench_panel(sorted(glob.glob('./*.pkl')))
+    for path in sorted(glob.glob('./*.pkl')):
+        name = os.path.basename(path).replace('.pkl', '')
+        results[f'to_dictionary:{name}'] = bench_to_dictionary(path)
+        results[f'load_data:{name}'] = bench_load_data(path)
+        results[f'shared_cache:{name}'] = bench_shared_cache(path)
+        results[f'dashboard_block:{name}'] = bench_dashboard_block(path)
+        results[f'walk_forward:{name}'] = bench_walk_forward(path)
+        results[f'ma_sweep:{name}'] = bench_ma_sweep(path)
+        results[f'append:{name}'] = bench_append(path)
+    return results
+
+# 指標方向：_s/_us 結尾越小越好，_per_s 結尾越大越好，其他(筆數等)不比較
+def _direction(metric):
+    if metric.endswith('_per_s'):
+        return 1
+    if metric.endswith('_s') or metric.endswith('_us'):
+        return -1
+    return 0
+
+# 與基準比較，回傳變慢超過 threshold(比例)的項目列表
+def compare(results, baseline, threshold=0.2):
+    regressions = []
+    for bench, metrics in results.items():
+        for metric, value in metrics.items():
+            old = baseline.get(bench, {}).get(metric)
+            sign = _direction(metric)
+            if not sign or old is None or value is None or not old:
+                continue
+            change = (value - old) / old * sign
+            if change < -threshold:
+                regressions.append({'bench': bench, 'metric': metric, 'baseline': old,
+                                    'value': value, 'change': change})
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='效能測試')
+    parser.add_argument('--quick', action='store_true', help='縮小合成資料量')
+    parser.add_argument('--output', default='benchmark_results.json', help='結果輸出的 JSON 檔')
+    parser.add_argument('--compare', help='比較用的基準 JSON 檔')
+    parser.add_argument('--threshold', type=float, default=0.2, help='視為退步的變慢比例')
+    args = parser.parse_args(argv)
+    results = run_all(args.quick)
+    for bench, metrics in results.items():
+        print(bench, ', '.join(f'{k}={v:.4g}' if isinstance(v, float) else f'{k}={v}' for k, v in metrics.items()))
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+                   'quick': args.quick, 'results': results}, f, ensure_ascii=False, indent=2)
+    print(f'結果已寫入 {args.output}')
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.threshold)
+        for r in regressions:
+            print(f"退步 {r['bench']} {r['metric']}：{r['baseline']:.4g} → {r['value']:.4g} ({r['change']:+.1%})")
+        if regressions:
+            return 1
+        print('沒有超過門檻的退步')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
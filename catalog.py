@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+資料集目錄：把每個 K 棒檔案的商品、週期、起訖時間、筆數、交易日清單與儲存位置存成一個 JSON 索引檔
+看板啟動與切換商品時只讀目錄，不必為了日期範圍載入整個檔案
+更新是增量的：資料夾的 mtime 沒變就不列舉其中的檔案(新增、刪除、改名都會改變資料夾 mtime)，
+檔案的 mtime 或大小改變時才重新建立該筆；就地覆寫的檔案在 Check(選取時)或 Refresh(check_files=True)時發現
+以 bar_store.append_bars 新增K棒後欄位式儲存的版本改變，同樣在 Check 或 Refresh(check_files=True)時重新建立
+資料夾清單預設為 ./，可用環境變數 DASHBOARD_DATA_DIRS 指定多個(以 os.pathsep 分隔)
+重建目錄：python catalog.py [資料夾 ...]
+"""
+
+import json
+import os
+import threading
+import numpy as np
+import bar_store
+from time_index import TimeIndex
+
+CATALOG_PATH = os.path.join(bar_store.STORE_ROOT, 'catalog.json')
+CATALOG_VERSION = 3
+# 檔名前綴 → (種類, 顯示名稱前綴)
+PREFIXES = {
+    'stock_KBar_': ('stock', '股票：'),
+    'future_KBar_': ('future', '期貨：'),
+}
+
+# 預設資料夾
+def data_dirs():
+    return [d for d in os.environ.get('DASHBOARD_DATA_DIRS', './').split(os.pathsep) if d]
+
+# 由檔名取得種類、商品代碼與顯示名稱(future_KBar_CBF_2023-04-17_2025-04-17.pkl → 期貨：CBF_2023-04-17_2025-04-17)
+# 不符合命名規則時回傳 None
+def parse_name(filename):
+    if not filename.endswith('.pkl'):
+        return None
+    for prefix, (kind, label) in PREFIXES.items():
+        if filename.startswith(prefix):
+            stem = filename[len(prefix):-len('.pkl')]
+            return {'kind': kind, 'product': stem.split('_')[0], 'display': label + stem}
+    return None
+
+# K 棒間隔 → 週期名稱(1m、5m、60m、1d ...)
+def timeframe_of(time):
+    gaps = np.diff(np.asarray(time).view(np.int64))
+    gaps = gaps[gaps > 0]
+    if not len(gaps):
+        return None
+    minutes = int(gaps.min() // (60 * 10**9))
+    return '1d' if minutes >= 24 * 60 else '%dm' % max(minutes, 1)
+
+# 目錄中的檔案路徑一律為 <正規化的資料夾>/<檔名>(./ 下的檔案為 ./xxx.pkl)
+def _key(path):
+    return os.path.join(os.path.normpath(os.path.dirname(path)), os.path.basename(path))
+
+# 建立一筆目錄資料(必要時先轉換成欄位式儲存)
+def index_file(path, root=bar_store.STORE_ROOT):
+    info = parse_name(os.path.basename(path))
+    stat = os.stat(path)
+    directory, manifest = bar_store.open_dataset(path, root)
+    time = bar_store.read_range(directory, manifest, fields=['time'])['time']
+    days = TimeIndex(time).GetDays()
+    return {
+        'path': path,
+        **info,
+        'timeframe': timeframe_of(time),
+        'first': int(time[0].astype(np.int64)) if len(time) else None,
+        'last': int(time[-1].astype(np.int64)) if len(time) else None,
+        'rows': len(time),
+        'days': [str(day) for day in days],
+        'store': directory,
+        'mtime': stat.st_mtime,
+        'size': stat.st_size,
+        'version': bar_store.dataset_version(path, root),
+    }
+
+class Catalog():
+    # dirs: 資料夾清單；path: 目錄檔位置；root: 欄位式儲存的根目錄
+    def __init__(self, dirs=None, path=CATALOG_PATH, root=bar_store.STORE_ROOT):
+        self.Dirs = [os.path.normpath(d) for d in (dirs or data_dirs())]
+        self.Path = path
+        self.Root = root
+        self.Entries = {}
+        self.DirMtimes = {}
+        self.Lock = threading.Lock()
+        self._Load()
+
+    def _Load(self):
+        try:
+            with open(self.Path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get('version') != CATALOG_VERSION:
+            return
+        self.Entries = data['entries']
+        # 只沿用目前資料夾的記錄，其他資料夾下次 Refresh 時重新列舉
+        self.DirMtimes = {d: m for d, m in data['dirs'].items() if d in self.Dirs}
+
+    # 先寫暫存檔再換上，其他行程不會讀到寫一半的目錄
+    def _Save(self):
+        os.makedirs(os.path.dirname(self.Path) or '.', exist_ok=True)
+        tmp = self.Path + '.%d.tmp' % os.getpid()
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'version': CATALOG_VERSION, 'dirs': self.DirMtimes, 'entries': self.Entries},
+                      f, ensure_ascii=False)
+        os.replace(tmp, self.Path)
+
+    # 重新建立一筆(檔案不存在時移除)，回傳是否有變動
+    def _Update(self, path, stat=None):
+        try:
+            stat = stat or os.stat(path)
+        except FileNotFoundError:
+            return self.Entries.pop(path, None) is not None
+        entry = self.Entries.get(path)
+        if entry is not None and entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size \
+                and entry['version'] == bar_store.dataset_version(path, self.Root):
+            return False
+        self.Entries[path] = index_file(path, self.Root)
+        return True
+
+    # 增量更新：只列舉 mtime 改變的資料夾；check_files=True 時另外檢查每個已知檔案的 mtime
+    # 回傳是否有變動(有變動時寫回目錄檔)
+    def Refresh(self, check_files=False):
+        with self.Lock:
+            changed = False
+            for directory in self.Dirs:
+                try:
+                    mtime = os.stat(directory).st_mtime
+                except FileNotFoundError:
+                    mtime = None
+                known = [p for p, e in self.Entries.items() if os.path.dirname(p) == directory]
+                if mtime != self.DirMtimes.get(directory):
+                    found = set()
+                    if mtime is not None:
+                        with os.scandir(directory) as it:
+                            for item in it:
+                                if item.is_file() and parse_name(item.name) is not None:
+                                    path = os.path.join(directory, item.name)
+                                    found.add(path)
+                                    changed |= self._Update(path, item.stat())
+                    for path in known:
+                        if path not in found:
+                            del self.Entries[path]
+                            changed = True
+                    self.DirMtimes[directory] = mtime
+                    changed = True
+                elif check_files:
+                    for path in known:
+                        changed |= self._Update(path)
+            # 已不在清單中的資料夾
+            for path in [p for p in self.Entries if os.path.dirname(p) not in self.Dirs]:
+                del self.Entries[path]
+                changed = True
+            if changed:
+                self._Save()
+            return changed
+
+    # 確認一個檔案的資料是最新的(只 stat 這個檔案)，回傳該筆目錄資料
+    def Check(self, path):
+        path = _key(path)
+        with self.Lock:
+            if self._Update(path):
+                self._Save()
+            return self.Entries.get(path)
+
+    # 顯示名稱 → 檔案路徑(依顯示名稱排序)；不同資料夾有同名檔案時在名稱後加上資料夾
+    def Names(self):
+        counts = {}
+        for entry in self.Entries.values():
+            counts[entry['display']] = counts.get(entry['display'], 0) + 1
+        return dict(sorted((e['display'] if counts[e['display']] == 1 else '%s（%s）' % (e['display'], os.path.dirname(p)), p)
+                           for p, e in self.Entries.items()))
+
+    # 商品代碼 → 檔案路徑清單
+    def Products(self):
+        products = {}
+        for path, entry in sorted(self.Entries.items()):
+            products.setdefault(entry['product'], []).append(path)
+        return products
+
+    # 交易日清單(datetime64[D])
+    def Days(self, path):
+        return np.array(self.Entries[_key(path)]['days'], dtype='datetime64[D]')
+
+if __name__ == '__main__':
+    import sys
+    import time
+    t0 = time.perf_counter()
+    catalog = Catalog(sys.argv[1:] or None)
+    catalog.Refresh(check_files=True)
+    for display, path in catalog.Names().items():
+        entry = catalog.Entries[path]
+        print(display, entry['timeframe'], entry['rows'], entry['days'][0], '～', entry['days'][-1], entry['store'])
+    print(f"{len(catalog.Entries)} 個資料集，耗時 {time.perf_counter() - t0:.3f} 秒")
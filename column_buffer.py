@@ -0,0 +1,82 @@
+# -*- coding: UTF-8 -*-
+# 載入必要套件
+import numpy as np
+
+# 欄位式緩衝區：每個欄位一條預先配置的 typed numpy 陣列
+# capacity=None 時容量以倍數成長(攤銷 O(1) 新增)；
+# capacity=N 時為固定容量的環狀模式，只保留最新 N 筆(即時盤使用)
+class ColumnBuffer():
+    # dtypes: {欄位名稱: dtype}，欄位順序即 Append 的參數順序
+    def __init__(self, dtypes, capacity=None, size=64):
+        self.Names = list(dtypes)
+        self.Capacity = capacity
+        if capacity is not None:
+            # 環狀模式配置兩倍容量，寫滿時才整段搬回開頭，讓已填區段永遠連續
+            size = 2 * capacity
+        self._data = {name: np.empty(size, dtype=dtypes[name]) for name in self.Names}
+        self._start = 0
+        self._end = 0
+
+    def __len__(self):
+        return self._end - self._start
+
+    # 確保尾端還有 n 格可寫入
+    def _Reserve(self, n):
+        size = len(self._data[self.Names[0]])
+        if self._end + n <= size:
+            return
+        length = self._end - self._start
+        if self.Capacity is not None:
+            # 環狀模式：丟掉超出容量的舊資料後把剩下的搬回開頭
+            keep = min(length, max(self.Capacity - n, 0))
+            for name in self.Names:
+                col = self._data[name]
+                col[:keep] = col[self._end - keep:self._end]
+            self._start, self._end = 0, keep
+            return
+        # 成長模式：容量加倍
+        new_size = max(2 * size, length + n)
+        for name in self.Names:
+            col = np.empty(new_size, dtype=self._data[name].dtype)
+            col[:length] = self._data[name][self._start:self._end]
+            self._data[name] = col
+        self._start, self._end = 0, length
+
+    # 新增一筆(依 Names 順序傳入各欄位的值)
+    def Append(self, *values):
+        self._Reserve(1)
+        for name, value in zip(self.Names, values):
+            self._data[name][self._end] = value
+        self._end += 1
+        if self.Capacity is not None and self._end - self._start > self.Capacity:
+            self._start += 1
+
+    # 一次新增多筆(各欄位傳入等長陣列)
+    def Extend(self, **arrays):
+        n = len(arrays[self.Names[0]])
+        if self.Capacity is not None and n > self.Capacity:
+            arrays = {name: arrays[name][n - self.Capacity:] for name in self.Names}
+            n = self.Capacity
+        self._Reserve(n)
+        for name in self.Names:
+            self._data[name][self._end:self._end + n] = arrays[name]
+        self._end += n
+        if self.Capacity is not None and self._end - self._start > self.Capacity:
+            self._start = self._end - self.Capacity
+
+    # 取欄位已填區段(零複製 view；之後新增資料可能換掉底層陣列，需重新取得)
+    def Get(self, name):
+        return self._data[name][self._start:self._end]
+
+    # 取最後一筆
+    def GetLast(self, name):
+        return self._data[name][self._end - 1]
+
+    # 修改最後一筆
+    def SetLast(self, name, value):
+        self._data[name][self._end - 1] = value
+
+    # 清空
+    def Clear(self):
+        self._start = 0
+        self._end = 0
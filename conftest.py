@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""
+測試共用的合成資料：不需要專案中的 .pkl 檔，執行：python -m pytest -q
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# 合成 1 分K：每天 09:01～13:45，價格為 0.01 跳動的隨機漫步(含連續持平的K棒，均線會出現相等的情況)
+def synthetic_bars(days=3, seed=0, start='2024-01-02'):
+    rng = np.random.default_rng(seed)
+    minutes = np.arange(1, 286)
+    dates = pd.bdate_range(start, periods=days).to_numpy('datetime64[m]')
+    time = (dates[:, None] + np.timedelta64(9 * 60, 'm') + minutes[None, :]).ravel()
+    n = len(time)
+    step = rng.choice([-3, -1, 0, 0, 0, 1, 3], size=n)
+    ticks = 3500 + np.cumsum(step)
+    open_ = np.r_[ticks[0], ticks[:-1]]
+    high = np.maximum(open_, ticks) + rng.integers(0, 3, n)
+    low = np.minimum(open_, ticks) - rng.integers(0, 3, n)
+    volume = rng.integers(1, 40, n)
+    close = ticks / 100
+    return pd.DataFrame({
+        'time': pd.to_datetime(time).strftime('%Y-%m-%d %H:%M:%S').astype(object),
+        'open': open_ / 100,
+        'high': high / 100,
+        'low': low / 100,
+        'close': close,
+        'volume': volume.astype(np.int64),
+        'amount': close * volume,
+    })
+
+# 寫成與專案資料相同命名規則的 .pkl，回傳路徑
+@pytest.fixture
+def synthetic_pkl(tmp_path):
+    path = tmp_path / 'future_KBar_TST_2024-01-02_2024-01-04.pkl'
+    synthetic_bars().to_pickle(path)
+    return str(path)
+
+# 欄位式儲存的根目錄(每個測試一份，不寫入 ./bar_store)
+@pytest.fixture
+def store_root(tmp_path):
+    return str(tmp_path / 'store')
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+商品合約規格：契約乘數、手續費與交易稅
+交易成本換算成每口的價格點數，直接從 Record 的每口盈虧中扣除
+手續費為預設值，實際費率請依券商調整
+"""
+
+import numpy as np
+
+class ContractSpec():
+    # Multiplier: 契約乘數(每點價值)
+    # Fee: 每口單邊固定手續費(元)
+    # FeeRate: 單邊手續費率(依成交金額，股票為 0.001425*折扣)
+    # TaxRate: 交易稅率；TaxBothSides=True 時買賣兩邊都課(期貨)，否則只課賣出的一邊(股票)
+    def __init__(self, Multiplier=1, Fee=0, FeeRate=0, TaxRate=0, TaxBothSides=True):
+        self.Multiplier = Multiplier
+        self.Fee = Fee
+        self.FeeRate = FeeRate
+        self.TaxRate = TaxRate
+        self.TaxBothSides = TaxBothSides
+
+    # 一口來回的手續費與交易稅(元)；side 1:多單 -1:空單
+    def CostValue(self, OrderPrice, CoverPrice, side=1):
+        Fee = 2 * self.Fee + self.FeeRate * (OrderPrice + CoverPrice) * self.Multiplier
+        if self.TaxBothSides:
+            TaxBase = OrderPrice + CoverPrice
+        else:
+            # 多單在出場時賣出，空單在進場時賣出
+            TaxBase = np.where(np.asarray(side) == 1, CoverPrice, OrderPrice)
+        return Fee + self.TaxRate * TaxBase * self.Multiplier
+
+    # 一口來回的成本換算成價格點數
+    def Cost(self, OrderPrice, CoverPrice, side=1):
+        return self.CostValue(OrderPrice, CoverPrice, side) / self.Multiplier
+
+# 股票(一張 1000 股，手續費 0.1425% 乘上折扣，賣出課 0.3% 證交稅)
+def StockSpec(Discount=1):
+    return ContractSpec(Multiplier=1000, FeeRate=0.001425 * Discount, TaxRate=0.003, TaxBothSides=False)
+
+# 期貨(期交稅十萬分之二，買賣兩邊皆課)
+CONTRACT_SPECS = {
+    'TXF': ContractSpec(Multiplier=200, Fee=60, TaxRate=0.00002),   # 臺股期貨
+    'MXF': ContractSpec(Multiplier=50, Fee=30, TaxRate=0.00002),    # 小型臺指
+    'TMF': ContractSpec(Multiplier=10, Fee=15, TaxRate=0.00002),    # 微型臺指
+}
+# 未列出的期貨代碼視為股票期貨(一口 2000 股)
+STOCK_FUTURE_SPEC = ContractSpec(Multiplier=2000, Fee=20, TaxRate=0.00002)
+
+# 取得商品規格
+def get_spec(product):
+    return CONTRACT_SPECS.get(product, STOCK_FUTURE_SPEC)
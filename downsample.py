@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+圖表用降採樣：依圖表寬度把K棒合併成固定數量的區塊，送到瀏覽器的資料量有上限
+K 線以保留 OHLC 的方式合併(開=首根開、高=最高、低=最低、收=末根收、量=加總)
+折線以 LTTB(Largest-Triangle-Three-Buckets)挑選最能保留形狀的點
+每個檔案預先建立多層解析度(每層合併 factor 根)，任何區間都可從最接近的一層切出
+"""
+
+import numpy as np
+
+# ──────────────────────────────────────────────────────────────────────────────
+# 依 starts(各區塊第一根的位置)合併 OHLCV
+def merge_ohlc(bars, starts):
+    starts = np.asarray(starts, dtype=np.intp)
+    n = len(bars['close'])
+    ends = np.r_[starts[1:], n]
+    merged = {
+        'time':  np.asarray(bars['time'])[starts],
+        'open':  np.asarray(bars['open'])[starts],
+        'high':  np.maximum.reduceat(bars['high'], starts),
+        'low':   np.minimum.reduceat(bars['low'], starts),
+        'close': np.asarray(bars['close'])[ends - 1],
+    }
+    if 'volume' in bars:
+        merged['volume'] = np.add.reduceat(bars['volume'], starts)
+    return merged
+
+# 把 n 根K棒平均分成最多 n_buckets 個區塊，回傳各區塊起點
+def bucket_starts(n, n_buckets):
+    if n <= n_buckets:
+        return np.arange(n)
+    return np.unique(np.linspace(0, n, n_buckets + 1)[:-1].astype(np.intp))
+
+# 保留 OHLC 的降採樣(最多 n_buckets 根)
+def downsample_ohlc(bars, n_buckets):
+    n = len(bars['close'])
+    if n <= n_buckets:
+        return bars
+    return merge_ohlc(bars, bucket_starts(n, n_buckets))
+
+# LTTB：從 (x, y) 中挑出 n_out 個點的位置(含頭尾)，y 的 NaN 不會被選為代表點
+def lttb_indices(x, y, n_out):
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if n <= n_out or n_out < 3:
+        return np.arange(n)
+    # 中間 n-2 點分成 n_out-2 個桶
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.intp)
+    selected = np.empty(n_out, dtype=np.intp)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for k in range(n_out - 2):
+        lo, hi = edges[k], edges[k + 1]
+        # 下一桶的平均點(最後一桶用最後一點)
+        if k + 2 < len(edges):
+            nlo, nhi = edges[k + 1], edges[k + 2]
+            cx, cy = x[nlo:nhi].mean(), np.nanmean(y[nlo:nhi]) if np.isfinite(y[nlo:nhi]).any() else np.nan
+        else:
+            cx, cy = x[-1], y[-1]
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        area = np.where(np.isnan(area), -1.0, area)
+        a = lo + int(np.argmax(area))
+        selected[k + 1] = a
+    return selected
+
+# ──────────────────────────────────────────────────────────────────────────────
+# 多層解析度：第 k 層的每根合併了 factor**k 根原始K棒(依原始位置對齊)
+def build_levels(bars, factor=4, min_size=256):
+    levels = [bars]
+    while len(levels[-1]['close']) > min_size:
+        prev = levels[-1]
+        levels.append(merge_ohlc(prev, np.arange(0, len(prev['close']), factor)))
+    return levels
+
+# 取原始第 [i0, i1) 根在 n_buckets 個區塊內的 OHLC：
+# 選最粗但仍比需求細的一層，中間完整的區塊直接取該層切片，頭尾不足一個區塊的部分取原始K棒，再合併到 n_buckets 根
+def select_ohlc(levels, i0, i1, n_buckets, factor=4):
+    span = max(i1 - i0, 1)
+    k = 0
+    while k + 1 < len(levels) and span / factor ** (k + 1) >= n_buckets:
+        k += 1
+    size = factor ** k
+    j0, j1 = -(-i0 // size), i1 // size
+    if k == 0 or j0 >= j1:
+        return downsample_ohlc({name: values[i0:i1] for name, values in levels[0].items()}, n_buckets)
+    raw, level = levels[0], levels[k]
+    parts = [{name: values[i0:j0 * size] for name, values in raw.items() if name in level},
+             {name: values[j0:j1] for name, values in level.items()},
+             {name: values[j1 * size:i1] for name, values in raw.items() if name in level}]
+    merged = {name: np.concatenate([part[name] for part in parts]) for name in level}
+    return downsample_ohlc(merged, n_buckets)
@@ -3,8 +3,7 @@
 金融資料視覺化看板 (自動讀取多檔 .pkl，並呈現 K 棒、MA、RSI、Bollinger 通道、MACD，並支援策略模擬與績效回測)
 """
 
-import os
-import glob
+import asyncio
 import numpy as np
 import pandas as pd
 import streamlit as st
@@ -12,10 +11,33 @@ import streamlit.components.v1 as stc
 import datetime
 import matplotlib.pyplot as plt
 from order_streamlit import Record
+import bar_store
+from time_index import TimeIndex
+from bar_data import to_bar_data
+from indicator_engine import IndicatorEngine
+from param_sweep import ma_cross_sweep
+import analysis
+import batch_backtest
+import walk_forward
+import panel
+import robustness
+from backtest_engine import run_signal
+from contract_spec import get_spec
+from downsample import build_levels, select_ohlc, lttb_indices
+import bar_pyramid
+import live_feed
+import instrumentation
+import shared_cache
+import catalog
 import indicator_f_Lo2_short
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 
+# ──────────────────────────────────────────────────────────────────────────────
+# 各區塊計時與記憶體量測(結果顯示在頁面最下方的診斷面板，並寫入 logs/dashboard_timing.log)
+instr = instrumentation.Instrumentation(memory=st.session_state.get('diag_memory', False))
+instr.Stage('網頁標題')
+
 # ──────────────────────────────────────────────────────────────────────────────
 # 網頁標題
 html_temp = """
@@ -27,91 +49,156 @@ html_temp = """
 stc.html(html_temp)
 
 # ──────────────────────────────────────────────────────────────────────────────
-# 自動尋找所有 .pkl 檔案
-@st.cache_data(ttl=3600)
-def find_all_pkl_files():
-    data_folder = './'
-    pkl_files = glob.glob(os.path.join(data_folder, '*.pkl'))
-    file_display_names = []
-    file_lookup = {}
-    for filepath in pkl_files:
-        filename = os.path.basename(filepath)
-        if filename.startswith("stock_KBar_") or filename.startswith("future_KBar_"):
-            display_name = filename                 .replace("stock_KBar_", "股票：")                 .replace("future_KBar_", "期貨：")                 .replace(".pkl", "")
-            file_display_names.append(display_name)
-            file_lookup[display_name] = filepath
-    return file_display_names, file_lookup
-
-# 載入資料
-@st.cache_data(ttl=3600, show_spinner="正在加載資料...")
-def load_data(path):
-    return pd.read_pickle(path)
+# 資料集目錄(商品、起訖時間、交易日清單等)：整個行程一份，每次重跑只檢查資料夾的 mtime，
+# 有新增或刪除的檔案才列舉該資料夾(資料夾由環境變數 DASHBOARD_DATA_DIRS 指定，預設 ./)
+@st.cache_resource
+def get_catalog():
+    return catalog.Catalog()
+
+@instrumentation.traced('find_datasets')
+def find_datasets():
+    dataset_catalog = get_catalog()
+    dataset_catalog.Refresh()
+    file_lookup = dataset_catalog.Names()
+    return list(file_lookup), file_lookup
+
+# 共用資料快取：整個行程一份、唯讀、依總位元組數淘汰，原始檔 mtime 改變時自動重新載入
+# (取代 st.cache_data：不再每個 session、每次重跑各複製一份)
+# 欄位式儲存新增K棒(bar_store.append_bars)時版本改變，只重新載入K棒，技術指標由快取增量延伸
+data_cache = shared_cache.default_cache()
+
+# 快取版本：先確認欄位式儲存已轉換(open_dataset)再讀取 manifest 的版本，
+# 第一次載入時才不會以轉換前的 None 存入，下次重跑又因版本改變重新載入
+def store_version(path):
+    bar_store.open_dataset(path)
+    return bar_store.dataset_version(path)
+
+# 完整K棒：1 分K 由欄位式儲存讀取(每個檔案一份)，其他週期取自同一個檔案的多週期金字塔
+def load_bars(path, timeframe):
+    if timeframe != '1m':
+        return load_pyramid(path)[timeframe]
+    def loader():
+        instrumentation.mark_miss()
+        directory, manifest = bar_store.open_dataset(path)
+        return bar_store.read_range(directory, manifest)
+    return data_cache.Get(('bars', path, '1m'), path, loader, store_version(path))
+
+# 多週期金字塔(1 分K 以外的所有週期)：每個檔案每個版本只由 1 分K 逐層建立一次，切換週期不再重建
+def load_pyramid(path):
+    def loader():
+        instrumentation.mark_miss()
+        pyramid = bar_pyramid.build_pyramid(load_bars(path, '1m'))
+        # 1 分K 已有自己的快取，不重複計入
+        del pyramid['1m']
+        return pyramid
+    return data_cache.Get(('pyramid', path), path, loader, store_version(path))
+
+# 時間索引(int64 時間與每日起始列)
+def load_time_index(path, timeframe):
+    return data_cache.Get(('time_index', path, timeframe), path, lambda: TimeIndex(load_bars(path, timeframe)['time']),
+                          store_version(path))
+
+# 完整歷史收盤價(技術指標在完整歷史上計算)
+def load_full_close(path, timeframe):
+    return load_bars(path, timeframe)['close']
+
+# 技術指標引擎(整個行程共用一份，依 (檔案, 指標, 參數) 快取完整歷史結果，新增K棒時增量延伸)
+@st.cache_resource
+def get_indicator_engine():
+    engine = IndicatorEngine(max_entries=64)
+    # 原始檔更新時一併清除該檔案的指標快取
+    data_cache.OnInvalidate(engine.Invalidate)
+    return engine
+
+# 均線交叉參數掃描(整個參數格一次算完)，暖機期取自視窗之前的完整歷史
+SWEEP_SHORT = np.arange(2, 31)
+SWEEP_LONG  = np.arange(10, 61)
+@st.cache_data(ttl=3600, show_spinner="正在掃描參數...")
+def run_ma_sweep(path, timeframe, i0, i1):
+    close = load_full_close(path, timeframe)
+    warmup = min(i0, SWEEP_LONG[-1])
+    time = load_time_index(path, timeframe).Slice(i0, i1)
+    years = (time[-1] - time[0]) / (365.25 * 86400e9) if len(time) > 1 else 0
+    return ma_cross_sweep(close[i0 - warmup:i1], SWEEP_SHORT, SWEEP_LONG, start=warmup,
+                          periods_per_year=(i1 - i0) / years if years > 0 else None)
+
+# 圖表用多層解析度 OHLC(每個檔案每個週期一份)
+def load_ohlc_levels(path, timeframe):
+    def loader():
+        bars = load_bars(path, timeframe)
+        return build_levels({name: bars[name] for name in ['time', 'open', 'high', 'low', 'close', 'volume']})
+    return data_cache.Get(('ohlc_levels', path, timeframe), path, loader, store_version(path))
+
+# 載入資料：從共用快取的完整K棒切出第 [i0, i1) 列，回傳 {欄位: 唯讀 view}，不複製
+@instrumentation.traced('load_data', cached=True)
+def load_data(path, timeframe, i0, i1):
+    return {name: values[i0:i1] for name, values in load_bars(path, timeframe).items()}
 
 # ──────────────────────────────────────────────────────────────────────────────
 # 選擇商品與載入原始資料
-file_display_names, file_lookup = find_all_pkl_files()
+instr.Stage('選擇商品與區間')
+file_display_names, file_lookup = find_datasets()
 choice = st.selectbox("選擇金融商品與資料區間", file_display_names)
 selected_file = file_lookup[choice]
-df_original = load_data(selected_file)
+# 只 stat 選取的檔案，就地更新過時重新建立該筆目錄資料
+dataset = get_catalog().Check(selected_file)
 
-# 從檔名抓商品代碼
-file_parts = os.path.basename(selected_file).replace(".pkl", "").split("_")
-product_name = file_parts[2]
-df_original['time'] = pd.to_datetime(df_original['time'])
+# K 棒週期(依期交所日盤/夜盤對齊)
+TIMEFRAME_LABELS = {'1m': '1 分K', '5m': '5 分K', '15m': '15 分K', '60m': '60 分K', '1d': '日K'}
+timeframe = st.selectbox("K 棒週期", list(bar_pyramid.TIMEFRAMES), format_func=TIMEFRAME_LABELS.get, key='timeframe')
+
+# 商品代碼(目錄中由檔名解析)
+product_name = dataset['product']
 
 # ──────────────────────────────────────────────────────────────────────────────
-# 選擇日期區間
+# 選擇日期區間：可選範圍取自目錄，不必先載入資料；再以時間索引二分搜尋取得列區間，不掃描整段歷史
 st.subheader("選擇資料時間區間")
-all_dates = sorted(df_original['time'].dt.date.unique())
-start_date = st.date_input("開始日期", value=all_dates[0], min_value=all_dates[0], max_value=all_dates[-1])
-end_date   = st.date_input("結束日期", value=all_dates[-1], min_value=start_date,   max_value=all_dates[-1])
-df = df_original[(df_original['time'] >= pd.to_datetime(start_date)) &
-                 (df_original['time'] <= pd.to_datetime(end_date))]
-
-# ──────────────────────────────────────────────────────────────────────────────
-# 限制最多顯示最近500筆
-#if len(df) > 500:
-#    df = df.iloc[-500:]
-#
-
-# 資料筆數上限（使用者輸入）與提醒
-st.subheader("設定顯示的資料筆數上限")
-max_rows = st.number_input("輸入最大筆數（最近幾筆資料）", min_value=100, max_value=2000, value=500, step=100)
-
-# 顯示提示：過多資料可能造成顯示問題
-if max_rows > 1500:
-    st.warning("⚠️ 警告：資料筆數過多可能導致圖表無法顯示或系統卡頓，建議不要超過 1500 筆！")
-
-# 限制最多顯示 max_rows 筆資料（從尾端開始）
-if len(df) > max_rows:
-    df = df.iloc[-int(max_rows):]
-
-# ──────────────────────────────────────────────────────────────────────────────
-# 轉為技術分析用字典
-@st.cache_data(ttl=3600)
-def To_Dictionary(df, product_name):
-    d = df.to_dict()
-    K = {
-        'time':   np.array([t.to_pydatetime() for t in d['time'].values()]),
-        'open':   np.array(list(d['open'].values())),
-        'high':   np.array(list(d['high'].values())),
-        'low':    np.array(list(d['low'].values())),
-        'close':  np.array(list(d['close'].values())),
-        'volume': np.array(list(d['volume'].values())),
-        'amount': np.array(list(d['amount'].values())),
-        'product': np.repeat(product_name, len(d['time']))
-    }
-    return K
+first_date = datetime.date.fromisoformat(dataset['days'][0])
+last_date  = datetime.date.fromisoformat(dataset['days'][-1])
+start_date = st.date_input("開始日期", value=first_date, min_value=first_date, max_value=last_date)
+end_date   = st.date_input("結束日期", value=last_date, min_value=start_date,   max_value=last_date)
+time_index = load_time_index(selected_file, timeframe)
+row_start, row_end = time_index.DateRange(start_date, end_date)
 
-KBar_dic = To_Dictionary(df, product_name)
-KBar_df  = pd.DataFrame({
-    'time':   KBar_dic['time'],
-    'open':   KBar_dic['open'],
-    'high':   KBar_dic['high'],
-    'low':    KBar_dic['low'],
-    'close':  KBar_dic['close'],
-    'volume': KBar_dic['volume']
-})
+instr.Stage('載入資料')
+bars = load_data(selected_file, timeframe, row_start, row_end)
+
+# ──────────────────────────────────────────────────────────────────────────────
+# 圖表解析度：圖表只送出約等於像素寬度的點數，完整區間都能顯示，不再限制資料筆數
+st.subheader("設定圖表解析度")
+chart_points = st.slider("每張圖最多點數（約等於圖表像素寬度）", 300, 3000, 1200, step=100, key='chart_points')
+
+# ──────────────────────────────────────────────────────────────────────────────
+# 轉為技術分析用字典(直接包裝陣列不複製，建構成本固定，因此不再經過 st.cache_data 雜湊整個 DataFrame)
+@instrumentation.traced('To_Dictionary')
+def To_Dictionary(bars, product_name):
+    return to_bar_data(bars, product_name)
+
+instr.Stage('轉換字典與圖表降採樣')
+KBar_dic = To_Dictionary(bars, product_name)
+KBar_df  = KBar_dic.ToFrame(['time', 'open', 'high', 'low', 'close', 'volume'])
+
+# 技術指標：從完整歷史的快取結果切出目前視窗
+engine = get_indicator_engine()
+full_close = load_full_close(selected_file, timeframe)
+def indicator(name, *params):
+    return engine.Slice((selected_file, timeframe), name, params, full_close, row_start, row_end)
+
+# 圖表降採樣：K 線依寬度以保留 OHLC 的方式合併(每根至少 2 像素)，折線以 LTTB 選點
+candles = select_ohlc(load_ohlc_levels(selected_file, timeframe), row_start, row_end, chart_points // 2)
+chart_x = KBar_df['time'].to_numpy()
+def thin(y):
+    y = np.asarray(y, dtype=np.float64)
+    idx = lttb_indices(chart_x.view(np.int64), y, chart_points)
+    return chart_x[idx], y[idx]
+def candle_trace():
+    return go.Candlestick(x=candles['time'], open=candles['open'], high=candles['high'],
+                          low=candles['low'], close=candles['close'], name='K 線')
+def volume_trace():
+    return go.Bar(x=candles['time'], y=candles['volume'], name='成交量', marker=dict(color='lightgray'))
+def line_trace(y, name, **kwargs):
+    x, y = thin(y)
+    return go.Scatter(x=x, y=y, mode='lines', name=name, **kwargs)
 
 # ──────────────────────────────────────────────────────────────────────────────
 # 資料摘要
@@ -122,101 +209,99 @@ st.dataframe(KBar_df.head())
 
 # ──────────────────────────────────────────────────────────────────────────────
 # K 線圖與成交量
+instr.Stage('K 線圖 (mplfinance)')
 st.subheader("K 線圖與成交量")
 try:
-    fig_candle = indicator_f_Lo2_short.CandlePlot(KBar_dic)
+    fig_candle = indicator_f_Lo2_short.CandlePlot(candles)
     st.pyplot(fig_candle)
 except Exception as e:
     st.error(f"K 線圖繪製失敗：{e}")
 
 # 移動平均線 MA
+instr.Stage('MA 圖')
 st.subheader("移動平均線 (MA)")
 ma_long  = st.slider("長期 MA 週期", 1, 60, 20, key='ma_long')
 ma_short = st.slider("短期 MA 週期", 1, 60, 5,  key='ma_short')
-KBar_df['MA_long']  = KBar_df['close'].rolling(window=ma_long).mean()
-KBar_df['MA_short'] = KBar_df['close'].rolling(window=ma_short).mean()
+KBar_df = KBar_df.assign(**analysis.moving_averages(indicator, ma_long, ma_short))
 fig_ma = make_subplots(specs=[[{"secondary_y": True}]])
-fig_ma.add_trace(go.Candlestick(x=KBar_df['time'], open=KBar_df['open'], high=KBar_df['high'],
-                                low=KBar_df['low'], close=KBar_df['close'], name='K 線'), secondary_y=True)
-fig_ma.add_trace(go.Scatter(x=KBar_df['time'], y=KBar_df['MA_long'], mode='lines', name=f'MA {ma_long}'), secondary_y=True)
-fig_ma.add_trace(go.Scatter(x=KBar_df['time'], y=KBar_df['MA_short'], mode='lines', name=f'MA {ma_short}'), secondary_y=True)
-fig_ma.add_trace(go.Bar(x=KBar_df['time'], y=KBar_df['volume'], name='成交量', marker=dict(color='lightgray')), secondary_y=False)
+fig_ma.add_trace(candle_trace(), secondary_y=True)
+fig_ma.add_trace(line_trace(KBar_df['MA_long'], f'MA {ma_long}'), secondary_y=True)
+fig_ma.add_trace(line_trace(KBar_df['MA_short'], f'MA {ma_short}'), secondary_y=True)
+fig_ma.add_trace(volume_trace(), secondary_y=False)
 fig_ma.update_layout(yaxis2_title="價格", yaxis_title="成交量")
 st.plotly_chart(fig_ma, use_container_width=True)
 
 # RSI
+instr.Stage('RSI 圖')
 st.subheader("相對強弱指標 (RSI)")
 rsi_period = st.slider("RSI 週期", 2, 30, 14, key='rsi')
-delta = KBar_df['close'].diff()
-gain  = delta.where(delta>0, 0).rolling(window=rsi_period).mean()
-loss  = (-delta.where(delta<0, 0)).rolling(window=rsi_period).mean()
-rs    = gain / loss
-KBar_df['RSI'] = 100 - (100 / (1 + rs))
+KBar_df = KBar_df.assign(**analysis.rsi_column(indicator, rsi_period))
 fig_rsi = go.Figure()
-fig_rsi.add_trace(go.Scatter(x=KBar_df['time'], y=KBar_df['RSI'], mode='lines', name='RSI'))
+fig_rsi.add_trace(line_trace(KBar_df['RSI'], 'RSI'))
 fig_rsi.add_hline(y=70, line_dash="dash", line_color="red")
 fig_rsi.add_hline(y=30, line_dash="dash", line_color="green")
 fig_rsi.update_layout(yaxis_title="RSI 值", xaxis_title="時間")
 st.plotly_chart(fig_rsi, use_container_width=True)
 
 # 布林通道
+instr.Stage('布林通道圖')
 st.subheader("布林通道 (Bollinger Bands)")
 bb_period = st.slider("布林通道週期", 5, 60, 20, key='bb_period')
 bb_std    = st.slider("標準差倍數", 1.0, 3.0, 2.0, step=0.1, key='bb_std')
-KBar_df['BB_MID']  = KBar_df['close'].rolling(window=bb_period).mean()
-KBar_df['BB_STD']  = KBar_df['close'].rolling(window=bb_period).std()
-KBar_df['BB_UP']   = KBar_df['BB_MID'] + bb_std * KBar_df['BB_STD']
-KBar_df['BB_DOWN'] = KBar_df['BB_MID'] - bb_std * KBar_df['BB_STD']
+KBar_df = KBar_df.assign(**analysis.bollinger(indicator, bb_period, bb_std))
 fig_bb = make_subplots(specs=[[{"secondary_y": True}]])
-fig_bb.add_trace(go.Candlestick(x=KBar_df['time'], open=KBar_df['open'], high=KBar_df['high'],
-                                low=KBar_df['low'], close=KBar_df['close'], name='K 線'), secondary_y=True)
-fig_bb.add_trace(go.Scatter(x=KBar_df['time'], y=KBar_df['BB_MID'], mode='lines', name='中軌'), secondary_y=True)
-fig_bb.add_trace(go.Scatter(x=KBar_df['time'], y=KBar_df['BB_UP'], mode='lines', name='上軌'), secondary_y=True)
-fig_bb.add_trace(go.Scatter(x=KBar_df['time'], y=KBar_df['BB_DOWN'], mode='lines', name='下軌'), secondary_y=True)
-fig_bb.add_trace(go.Bar(x=KBar_df['time'], y=KBar_df['volume'], name='成交量', marker=dict(color='lightgray')), secondary_y=False)
+fig_bb.add_trace(candle_trace(), secondary_y=True)
+fig_bb.add_trace(line_trace(KBar_df['BB_MID'], '中軌'), secondary_y=True)
+fig_bb.add_trace(line_trace(KBar_df['BB_UP'], '上軌'), secondary_y=True)
+fig_bb.add_trace(line_trace(KBar_df['BB_DOWN'], '下軌'), secondary_y=True)
+fig_bb.add_trace(volume_trace(), secondary_y=False)
 fig_bb.update_layout(yaxis2_title="價格", yaxis_title="成交量")
 st.plotly_chart(fig_bb, use_container_width=True)
 
 # MACD
+instr.Stage('MACD 圖')
 st.subheader("異同移動平均線 (MACD)")
 fastp = st.slider("MACD 快線", 5, 30, 12, key='macd_fast')
 slowp = st.slider("MACD 慢線", 10, 60, 26, key='macd_slow')
 sigp  = st.slider("MACD 訊號線", 5, 20, 9, key='macd_sig')
-ema_fast = KBar_df['close'].ewm(span=fastp, adjust=False).mean()
-ema_slow = KBar_df['close'].ewm(span=slowp, adjust=False).mean()
-KBar_df['MACD']       = ema_fast - ema_slow
-KBar_df['MACD_SIGNAL'] = KBar_df['MACD'].ewm(span=sigp, adjust=False).mean()
-KBar_df['MACD_HIST']  = KBar_df['MACD'] - KBar_df['MACD_SIGNAL']
+KBar_df = KBar_df.assign(**analysis.macd_columns(indicator, fastp, slowp, sigp))
 fig_macd = make_subplots(rows=2, cols=1, shared_xaxes=True, row_heights=[0.7, 0.3], vertical_spacing=0.05)
-fig_macd.add_trace(go.Scatter(x=KBar_df['time'], y=KBar_df['MACD'], mode='lines', name='MACD'), row=1, col=1)
-fig_macd.add_trace(go.Scatter(x=KBar_df['time'], y=KBar_df['MACD_SIGNAL'], mode='lines', name='Signal'), row=1, col=1)
-fig_macd.add_trace(go.Bar(x=KBar_df['time'], y=KBar_df['MACD_HIST'], name='Histogram', marker=dict(color='gray')), row=2, col=1)
+fig_macd.add_trace(line_trace(KBar_df['MACD'], 'MACD'), row=1, col=1)
+fig_macd.add_trace(line_trace(KBar_df['MACD_SIGNAL'], 'Signal'), row=1, col=1)
+hist_x, hist_y = thin(KBar_df['MACD_HIST'])
+fig_macd.add_trace(go.Bar(x=hist_x, y=hist_y, name='Histogram', marker=dict(color='gray')), row=2, col=1)
 fig_macd.update_layout(yaxis_title="MACD", yaxis2_title="Histogram", xaxis_title="時間")
 st.plotly_chart(fig_macd, use_container_width=True)
 
+# ──────────────────────────────────────────────────────────────────────────────
+# 策略的出場規則(持倉由 position_engine 產生)：放空、停損、停利與最長持有，0 表示不設
+def exit_rule_inputs(prefix):
+    with st.expander("出場規則（放空、停損、停利、最長持有）"):
+        col_short, col_sl, col_tp, col_hold = st.columns(4)
+        allow_short = col_short.checkbox("允許放空", key=f'{prefix}_short')
+        stop_loss = col_sl.number_input("停損（%）", 0.0, 50.0, 0.0, step=0.5, key=f'{prefix}_stop_loss')
+        take_profit = col_tp.number_input("停利（%）", 0.0, 100.0, 0.0, step=0.5, key=f'{prefix}_take_profit')
+        max_hold = col_hold.number_input("最長持有（K棒數）", 0, 100000, 0, step=10, key=f'{prefix}_max_hold')
+    return {
+        'allow_short': allow_short,
+        'stop_loss': stop_loss / 100 or None,
+        'take_profit': take_profit / 100 or None,
+        'max_hold': int(max_hold) or None,
+    }
+
 # ──────────────────────────────────────────────────────────────────────────────
 # 策略模擬與績效回測
+instr.Stage('均線交叉回測')
 st.subheader("策略模擬：移動平均交叉")
 short_window = st.slider("短期 MA 週期", 2, 30, 5)
 long_window = st.slider("長期 MA 週期", 10, 60, 20)
+ma_rules = exit_rule_inputs('ma_rules')
 
-KBar_df['short_ma'] = KBar_df['close'].rolling(window=short_window).mean()
-KBar_df['long_ma'] = KBar_df['close'].rolling(window=long_window).mean()
-
-KBar_df['signal'] = 0
-KBar_df.loc[short_window:, 'signal'] = np.where(
-    KBar_df['short_ma'][short_window:] > KBar_df['long_ma'][short_window:], 1, 0
-)
-KBar_df['position'] = KBar_df['signal'].diff()
-
-KBar_df['return'] = KBar_df['close'].pct_change()
-KBar_df['strategy_return'] = KBar_df['signal'].shift(1) * KBar_df['return']
-KBar_df['cum_strategy_return'] = (1 + KBar_df['strategy_return']).cumprod()
-KBar_df['cum_market_return'] = (1 + KBar_df['return']).cumprod()
+KBar_df = KBar_df.assign(**analysis.ma_cross_strategy(indicator, KBar_df['close'], short_window, long_window, ma_rules))
 
 fig_perf = go.Figure()
-fig_perf.add_trace(go.Scatter(x=KBar_df['time'], y=KBar_df['cum_market_return'], name='市場報酬'))
-fig_perf.add_trace(go.Scatter(x=KBar_df['time'], y=KBar_df['cum_strategy_return'], name='策略報酬'))
+fig_perf.add_trace(line_trace(KBar_df['cum_market_return'], '市場報酬'))
+fig_perf.add_trace(line_trace(KBar_df['cum_strategy_return'], '策略報酬'))
 fig_perf.update_layout(title='績效回測：累積報酬', xaxis_title='時間', yaxis_title='報酬')
 st.plotly_chart(fig_perf, use_container_width=True)
 
@@ -227,25 +312,38 @@ st.plotly_chart(fig_perf, use_container_width=True)
 st.success(f"最終策略報酬：{(KBar_df['cum_strategy_return'].iloc[-1] - 1) * 100:.2f}%")
 st.info(f"最終市場報酬：{(KBar_df['cum_market_return'].iloc[-1] - 1) * 100:.2f}%")
 
+# 參數掃描：一次評估所有 (短期, 長期) 組合並畫成熱圖
+instr.Stage('參數掃描')
+if st.checkbox("參數掃描模式（評估整個參數格）", key='ma_sweep'):
+    sweep = run_ma_sweep(selected_file, timeframe, row_start, row_end)
+    sweep_metrics = {'累積報酬': 'return', '夏普值': 'sharpe', '最大回落 (MDD)': 'mdd'}
+    metric_label = st.selectbox("熱圖指標", list(sweep_metrics), key='ma_sweep_metric')
+    z = sweep[sweep_metrics[metric_label]]
+    fig_sweep = go.Figure(go.Heatmap(z=z, x=SWEEP_LONG, y=SWEEP_SHORT,
+                                     colorscale='RdYlGn_r' if sweep_metrics[metric_label] == 'mdd' else 'RdYlGn'))
+    fig_sweep.update_layout(title=f'參數掃描：{metric_label}', xaxis_title='長期 MA 週期', yaxis_title='短期 MA 週期')
+    st.plotly_chart(fig_sweep, use_container_width=True)
+    best_i, best_j = np.unravel_index(np.nanargmax(sweep['return']), sweep['return'].shape)
+    st.write(f"最佳累積報酬參數：短期 {SWEEP_SHORT[best_i]}、長期 {SWEEP_LONG[best_j]}，"
+             f"報酬 {sweep['return'][best_i, best_j] * 100:.2f}%、夏普值 {sweep['sharpe'][best_i, best_j]:.2f}、"
+             f"MDD {sweep['mdd'][best_i, best_j] * 100:.2f}%")
+
 
 # ──────────────────────────────────────────────────────────────────────────────
 # RSI 策略模擬與績效回測
+instr.Stage('RSI 策略回測')
 st.subheader("策略模擬：RSI 策略（超賣買進，超買賣出）")
 
 rsi_buy_thres = st.slider("超賣進場（低於）", 5, 50, 30, key='rsi_buy')
 rsi_sell_thres = st.slider("超買出場（高於）", 50, 95, 70, key='rsi_sell')
+rsi_rules = exit_rule_inputs('rsi_rules')
 
-KBar_df['rsi_signal'] = 0
-KBar_df.loc[KBar_df['RSI'] < rsi_buy_thres, 'rsi_signal'] = 1   # 進場
-KBar_df.loc[KBar_df['RSI'] > rsi_sell_thres, 'rsi_signal'] = 0  # 出場
-KBar_df['rsi_signal'] = KBar_df['rsi_signal'].ffill()  # 持倉訊號延續
-
-KBar_df['rsi_strat_return'] = KBar_df['rsi_signal'].shift(1) * KBar_df['return']
-KBar_df['cum_rsi_strat_return'] = (1 + KBar_df['rsi_strat_return']).cumprod()
+KBar_df = KBar_df.assign(**analysis.rsi_strategy(KBar_df['RSI'].to_numpy(), KBar_df['return'].to_numpy(),
+                                                 rsi_buy_thres, rsi_sell_thres, KBar_df['close'], rsi_rules))
 
 fig_rsi_perf = go.Figure()
-fig_rsi_perf.add_trace(go.Scatter(x=KBar_df['time'], y=KBar_df['cum_market_return'], name='市場報酬'))
-fig_rsi_perf.add_trace(go.Scatter(x=KBar_df['time'], y=KBar_df['cum_rsi_strat_return'], name='RSI 策略報酬'))
+fig_rsi_perf.add_trace(line_trace(KBar_df['cum_market_return'], '市場報酬'))
+fig_rsi_perf.add_trace(line_trace(KBar_df['cum_rsi_strat_return'], 'RSI 策略報酬'))
 fig_rsi_perf.update_layout(title='RSI 策略績效：累積報酬', xaxis_title='時間', yaxis_title='報酬')
 st.plotly_chart(fig_rsi_perf, use_container_width=True)
 
@@ -253,3 +351,195 @@ st.plotly_chart(fig_rsi_perf, use_container_width=True)
 #st.write("最終 RSI 策略報酬：", f"{round(KBar_df['cum_rsi_strat_return'].iloc[-1] * 100, 2)}%")
 
 st.success(f"最終 RSI 策略報酬：{(KBar_df['cum_rsi_strat_return'].iloc[-1] - 1) * 100:.2f}%")
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# 含交易成本的績效：以上兩個策略的訊號經 Record 進出場，扣除手續費、交易稅並套用契約乘數
+instr.Stage('含成本回測')
+st.subheader("含交易成本的策略績效")
+contract = get_spec(product_name)
+st.caption(f"契約乘數 {contract.Multiplier}、單邊手續費 {contract.Fee} 元、"
+           f"手續費率 {contract.FeeRate}、交易稅率 {contract.TaxRate}")
+cost_records = {
+    '均線交叉': run_signal(KBar_dic, KBar_df['signal'], product_name, contract),
+    'RSI': run_signal(KBar_dic, KBar_df['rsi_signal'], product_name, contract),
+}
+st.dataframe(pd.DataFrame({name: record.GetStatistics() for name, record in cost_records.items()}))
+# 蒙地卡羅穩健度：重抽每口盈虧，累計盈虧的分位帶畫在原本的累計盈虧圖旁邊
+show_robustness = st.checkbox("蒙地卡羅穩健度分析（重抽 10,000 次）", key='robustness')
+ROBUSTNESS_LABELS = {'final': '總盈虧（元）', 'mdd': 'MDD（元）', 'losing_streak': '最長連續虧損（筆）', 'win_rate': '勝率'}
+for name, record in cost_records.items():
+    st.write(f"{name}：總盈虧 {record.GetTotalProfit() * contract.Multiplier:,.0f} 元")
+    if not (show_robustness and record.GetTotalNumber() > 0):
+        record.GeneratorProfitChart(choice='contract', StrategyName=name)
+        continue
+    col_chart, col_mc = st.columns(2)
+    with col_chart:
+        record.GeneratorProfitChart(choice='contract', StrategyName=name)
+    # 每口盈虧換算成元後重抽
+    mc = robustness.analyze(record.GetProfit() * contract.Multiplier)
+    with col_mc:
+        bands = mc['bootstrap']['bands']
+        steps = np.arange(1, bands.shape[1] + 1)
+        fig_mc = go.Figure()
+        fig_mc.add_trace(go.Scatter(x=steps, y=bands[-1], mode='lines', line=dict(width=0), showlegend=False))
+        fig_mc.add_trace(go.Scatter(x=steps, y=bands[0], mode='lines', line=dict(width=0), fill='tonexty',
+                                    fillcolor='rgba(56,114,251,0.15)', name='P5–P95'))
+        fig_mc.add_trace(go.Scatter(x=steps, y=bands[-2], mode='lines', line=dict(width=0), showlegend=False))
+        fig_mc.add_trace(go.Scatter(x=steps, y=bands[1], mode='lines', line=dict(width=0), fill='tonexty',
+                                    fillcolor='rgba(56,114,251,0.3)', name='P25–P75'))
+        fig_mc.add_trace(go.Scatter(x=steps, y=bands[2], mode='lines', line=dict(dash='dash'), name='中位數'))
+        fig_mc.add_trace(go.Scatter(x=steps, y=record.GetCumulativeProfit()[1:] * contract.Multiplier,
+                                    mode='lines', name='實際'))
+        fig_mc.update_layout(title='累計盈虧分位帶（bootstrap）', xaxis_title='交易編號', yaxis_title='累計盈虧（元）')
+        st.plotly_chart(fig_mc, use_container_width=True)
+    fig_dist = make_subplots(rows=1, cols=4, subplot_titles=list(ROBUSTNESS_LABELS.values()))
+    for col, key in enumerate(ROBUSTNESS_LABELS, start=1):
+        for method, color in (('bootstrap', '#3872fb'), ('permutation', '#f39c12')):
+            fig_dist.add_trace(go.Histogram(x=mc[method][key], name=method, marker_color=color, opacity=0.6,
+                                            legendgroup=method, showlegend=col == 1), row=1, col=col)
+        fig_dist.add_vline(x=mc['actual'][key], line_color='red', row=1, col=col)
+    fig_dist.update_layout(barmode='overlay', title=f'{name}：重抽分布（紅線為實際）')
+    st.plotly_chart(fig_dist, use_container_width=True)
+    st.dataframe(mc['summary'])
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# 多商品批次回測：以目前的策略參數與出場規則對所有(或選定的)商品平行回測完整歷史(含交易成本，與上方含成本回測相同)
+instr.Stage('批次回測')
+st.subheader("多商品批次回測")
+batch_choices = st.multiselect("選擇回測商品", file_display_names, default=file_display_names, key='batch_files')
+if st.button("執行批次回測", key='batch_run'):
+    batch_params = {
+        'short_window': short_window,
+        'long_window': long_window,
+        'rsi_period': rsi_period,
+        'rsi_buy': rsi_buy_thres,
+        'rsi_sell': rsi_sell_thres,
+    }
+    with st.spinner("批次回測中..."):
+        batch_result = batch_backtest.run_batch([file_lookup[c] for c in batch_choices], batch_params,
+                                                ma_rules=ma_rules, rsi_rules=rsi_rules)
+    st.dataframe(batch_result.style.format({'最終報酬': '{:.2%}', '總盈虧': '{:,.0f}', '市場報酬': '{:.2%}',
+                                            '勝率': '{:.2%}', 'MDD': '{:.2f}', 'MDD_rate': '{:.2%}'}))
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# 多商品組合：選定商品對齊到共同時間格(目前週期)，以目前的策略參數各自產生訊號，依權重合成組合
+instr.Stage('多商品組合')
+st.subheader("多商品組合回測")
+PANEL_STRATEGIES = {'均線交叉': 'ma', 'RSI': 'rsi'}
+PANEL_ALIGN = {'聯集（缺漏沿用前一根收盤）': 'outer', '交集（只保留都有K棒的時間）': 'inner'}
+panel_choices = st.multiselect("選擇組合商品", file_display_names, default=file_display_names, key='panel_files')
+panel_strategy = st.selectbox("策略", list(PANEL_STRATEGIES), key='panel_strategy')
+panel_align = st.selectbox("時間對齊", list(PANEL_ALIGN), key='panel_align')
+panel_window = st.slider("滾動相關係數視窗（K棒數）", 20, 1000, panel.CORR_WINDOW, step=20, key='panel_window')
+panel_weights = {}
+if panel_choices:
+    weight_cols = st.columns(len(panel_choices))
+    for col, choice in zip(weight_cols, panel_choices):
+        panel_weights[choice] = col.number_input(f"{choice} 權重", min_value=0.0, max_value=1.0,
+                                                 value=round(1.0 / len(panel_choices), 4), step=0.05,
+                                                 key=f'panel_weight_{choice}')
+if st.button("執行組合回測", key='panel_run'):
+    try:
+        panel_paths = [file_lookup[c] for c in panel_choices]
+        panel_data = panel.load_panel(panel_paths, timeframe, PANEL_ALIGN[panel_align],
+                                      loader=lambda path: load_bars(path, timeframe))
+        panel_params = {'short_window': short_window, 'long_window': long_window,
+                        'rsi_period': rsi_period, 'rsi_buy': rsi_buy_thres, 'rsi_sell': rsi_sell_thres}
+        portfolio = panel.portfolio_backtest(
+            panel_data, panel.signals(panel_data, PANEL_STRATEGIES[panel_strategy], panel_params),
+            [panel_weights[c] for c in panel_choices], panel_window)
+    except ValueError as e:
+        st.error(f"無法執行：{e}")
+    else:
+        panel_time = portfolio['time']
+        fig_panel = make_subplots(rows=2, cols=1, shared_xaxes=True, row_heights=[0.7, 0.3],
+                                  subplot_titles=('累積報酬', '組合回落'))
+        curves = [(portfolio['equity'], '組合'), (portfolio['market_equity'], '同權重買進持有')]
+        curves += [(portfolio['product_equity'][:, j], name) for j, name in enumerate(portfolio['products'])]
+        for y, name in curves:
+            idx = lttb_indices(panel_time.view(np.int64), y, chart_points)
+            fig_panel.add_trace(go.Scatter(x=panel_time[idx], y=y[idx], mode='lines', name=name), row=1, col=1)
+        idx = lttb_indices(panel_time.view(np.int64), portfolio['drawdown'], chart_points)
+        fig_panel.add_trace(go.Scatter(x=panel_time[idx], y=portfolio['drawdown'][idx], mode='lines', name='回落',
+                                       fill='tozeroy', line_color='red'), row=2, col=1)
+        st.plotly_chart(fig_panel, use_container_width=True)
+        st.success(f"組合報酬：{(portfolio['equity'][-1] - 1) * 100:.2f}%"
+                   f"（同權重買進持有 {(portfolio['market_equity'][-1] - 1) * 100:.2f}%）")
+        st.dataframe(portfolio['summary'].style.format({'權重': '{:.2f}', '最終報酬': '{:.2%}', '最大回落': '{:.2%}',
+                                                         '有K棒比例': '{:.2%}'}))
+        # 兩兩的滾動相關係數與最後一個視窗的相關係數矩陣
+        corr = portfolio['correlation']
+        products = portfolio['products']
+        fig_corr = go.Figure()
+        for i in range(len(products)):
+            for j in range(i + 1, len(products)):
+                y = corr[:, i, j]
+                ok = ~np.isnan(y)
+                if not ok.any():
+                    continue
+                idx = lttb_indices(panel_time[ok].view(np.int64), y[ok], chart_points)
+                fig_corr.add_trace(go.Scatter(x=panel_time[ok][idx], y=y[ok][idx], mode='lines',
+                                              name=f'{products[i]}－{products[j]}'))
+        fig_corr.update_layout(title=f'滾動相關係數（{panel_window} 根）', yaxis_range=[-1, 1])
+        st.plotly_chart(fig_corr, use_container_width=True)
+        st.dataframe(pd.DataFrame(corr[-1], index=products, columns=products).style.format('{:.3f}'))
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# 滾動式最佳化：在目前商品、目前週期的完整歷史上，逐段以訓練區間選參數、在之後的測試區間評估
+instr.Stage('滾動式最佳化')
+st.subheader("滾動式最佳化（樣本外驗證）")
+WF_STRATEGIES = {'均線交叉': 'ma', 'RSI': 'rsi'}
+WF_OBJECTIVES = {'夏普值': 'sharpe', '累積報酬': 'return'}
+wf_strategy = st.selectbox("策略", list(WF_STRATEGIES), key='wf_strategy')
+wf_objective = st.selectbox("訓練區間選參數的指標", list(WF_OBJECTIVES), key='wf_objective')
+wf_folds = st.slider("段數", 4, 48, 24, key='wf_folds')
+wf_train = st.slider("訓練區間長度（測試區間的倍數）", 1, 12, 3, key='wf_train')
+if st.button("執行滾動式最佳化", key='wf_run'):
+    try:
+        with st.spinner("滾動式最佳化中..."):
+            wf = walk_forward.walk_forward(load_bars(selected_file, timeframe), product_name,
+                                           WF_STRATEGIES[wf_strategy], wf_folds, wf_train,
+                                           WF_OBJECTIVES[wf_objective])
+    except ValueError as e:
+        st.error(f"無法執行：{e}")
+    else:
+        fig_wf = go.Figure()
+        for y, name in [(wf['market'], '市場報酬'), (wf['equity'], '樣本外策略報酬')]:
+            idx = lttb_indices(wf['time'].view(np.int64), y, chart_points)
+            fig_wf.add_trace(go.Scatter(x=wf['time'][idx], y=y[idx], mode='lines', name=name))
+        for t in wf['folds']['測試起']:
+            fig_wf.add_vline(x=t, line_dash='dot', line_color='lightgray')
+        fig_wf.update_layout(title='拼接後的樣本外累積報酬', xaxis_title='時間', yaxis_title='報酬')
+        st.plotly_chart(fig_wf, use_container_width=True)
+        st.success(f"樣本外策略報酬：{(wf['equity'][-1] - 1) * 100:.2f}%（市場 {(wf['market'][-1] - 1) * 100:.2f}%）")
+        st.dataframe(pd.DataFrame({'樣本外': wf['record'].GetStatistics()}))
+        st.dataframe(wf['folds'])
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# 即時行情回放：以 asyncio 接收管線全速回放目前商品，量測吞吐量與端到端延遲
+instr.Stage('即時回放')
+st.subheader("即時行情回放")
+if st.checkbox("回放模式（不需券商連線）", key='live_replay'):
+    replay_limit = st.number_input("回放K棒數", min_value=100, max_value=50000, value=2000, step=100, key='replay_limit')
+    replay_stats, replay_bars = asyncio.run(live_feed.replay(selected_file, speed=0, limit=int(replay_limit)))
+    st.dataframe(pd.DataFrame([replay_stats]))
+    st.dataframe(pd.DataFrame(replay_bars[-10:]))
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# 診斷面板：本次重跑各區塊的耗時、記憶體尖峰增量與快取命中
+instr_total = instr.Finish()
+instr.Log(instr_total, product=product_name, timeframe=timeframe, rows=len(KBar_df))
+with st.expander("診斷資訊（各區塊耗時與記憶體）"):
+    st.checkbox("量測記憶體（tracemalloc，會拖慢重跑）", key='diag_memory')
+    st.write(f"本次重跑共 {instr_total:.3f} 秒")
+    st.write("共用資料快取：", data_cache.Stats())
+    diag_df = pd.DataFrame(instr.Records)
+    diag_df['name'] = ['　' * depth + name for depth, name in zip(diag_df['depth'], diag_df['name'])]
+    st.dataframe(diag_df.drop(columns='depth').rename(columns={
+        'name': '區塊', 'seconds': '耗時（秒）', 'peak_kb': '記憶體尖峰增量（KB）', 'cache': '快取'}))
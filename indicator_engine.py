@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+技術指標引擎：每個指標在商品完整歷史上只算一次，依 (檔案, 指標, 參數) 記憶在有上限的 LRU 快取
+看板只從快取的完整陣列切出目前視窗，視窗左端不會因暖機期出現 NaN
+資料新增K棒(只在尾端增加，最後一根可能被更新)時不整段重算：保留快取中仍相同的前段，
+只往前取 lookback 根暖機後計算新增的部分再接上，與整段重算的差異在浮點捨入誤差以內
+移動平均在價格都落在最小跳動格點上時以整數累積和計算，沒有捨入誤差：結果與起算位置無關，
+參數掃描(param_sweep)、策略與增量計算得到完全相同的均線，兩條均線相等時也一定完全相等
+"""
+
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from bar_schema import as_float64, PRICE_DECIMALS
+
+# ──────────────────────────────────────────────────────────────────────────────
+# 指標計算(輸入完整歷史收盤價，回傳 {名稱: 陣列})
+
+# 價格換成最小跳動的整數倍(int64)；有價格不在格點上(或為 NaN)時回傳 None
+def _ticks(close):
+    scaled = close * 10 ** PRICE_DECIMALS
+    ticks = np.round(scaled)
+    if len(close) and not (np.all(np.abs(scaled - ticks) < 1e-6) and np.abs(ticks).max() < 2 ** 40):
+        return None
+    return ticks.astype(np.int64)
+
+# 多個週期的移動平均矩陣(列：週期，行：時間)，暖機期為 NaN
+# 視窗和由累積和相減取出；價格在格點上時累積和為整數，平均 = 視窗和 / (週期 × 10^小數位數) 只捨入一次
+def rolling_means(close, windows):
+    close = as_float64(close)
+    windows = np.asarray(windows, dtype=np.intp)
+    ticks = _ticks(close)
+    if ticks is not None:
+        csum, scale = np.r_[np.int64(0), np.cumsum(ticks)], 10 ** PRICE_DECIMALS
+    else:
+        csum, scale = np.r_[0.0, np.cumsum(close)], 1
+    idx = np.arange(1, len(close) + 1)
+    lo = np.maximum(idx[None, :] - windows[:, None], 0)
+    means = (csum[idx][None, :] - csum[lo]) / (windows[:, None] * scale)
+    means[idx[None, :] < windows[:, None]] = np.nan
+    return means
+
+# 移動平均
+def ma(close, n):
+    return {'MA': rolling_means(close, [n])[0]}
+
+# RSI(以簡單移動平均計算平均漲跌幅)
+def rsi(close, n):
+    delta = pd.Series(close).diff()
+    gain  = delta.where(delta > 0, 0).rolling(window=n).mean()
+    loss  = (-delta.where(delta < 0, 0)).rolling(window=n).mean()
+    return {'RSI': (100 - (100 / (1 + gain / loss))).to_numpy()}
+
+# 布林通道中軌與標準差(上下軌 = 中軌 ± 倍數 × 標準差，倍數在切片後才套用)
+def bbands(close, n):
+    s = pd.Series(close).rolling(window=n)
+    return {'BB_MID': s.mean().to_numpy(), 'BB_STD': s.std().to_numpy()}
+
+# MACD
+def macd(close, fast, slow, signal):
+    s = pd.Series(close)
+    line = s.ewm(span=fast, adjust=False).mean() - s.ewm(span=slow, adjust=False).mean()
+    sig = line.ewm(span=signal, adjust=False).mean()
+    return {'MACD': line.to_numpy(), 'MACD_SIGNAL': sig.to_numpy(), 'MACD_HIST': (line - sig).to_numpy()}
+
+INDICATORS = {
+    'MA': ma,
+    'RSI': rsi,
+    'BBANDS': bbands,
+    'MACD': macd,
+}
+
+# EMA 的暖機倍數：往前取 span 的這個倍數，起始值的權重 (1-2/(span+1))^k 已小於浮點精度
+EMA_WARMUP = 40
+
+# 增量計算時第 i 根的值需要往前取的K棒數
+def lookback(name, params):
+    if name == 'RSI':
+        return params[0] + 1
+    if name == 'MACD':
+        return EMA_WARMUP * (params[1] + params[2])
+    return params[0]
+
+# 已有前 keep 根的結果，計算 close[keep:] 的部分並接在後面
+def extend(name, params, close, result, keep):
+    start = max(keep - lookback(name, params), 0)
+    tail = INDICATORS[name](as_float64(close[start:]), *params)
+    return {k: np.concatenate([result[k][:keep], tail[k][keep - start:]]) for k in result}
+
+# ──────────────────────────────────────────────────────────────────────────────
+class IndicatorEngine():
+    # 比對快取時檢查的尾端K棒數
+    TAIL = 8
+
+    def __init__(self, max_entries=64):
+        self.MaxEntries = max_entries
+        self.Cache = OrderedDict()
+        # 每筆快取計算時最後 TAIL 根收盤價(判斷資料是否只在尾端增加)
+        self.Tails = {}
+        self.Hits = 0
+        self.Misses = 0
+        self.Extends = 0
+
+    # 快取結果中仍可沿用的前段根數：尾端之前的收盤價相同才沿用，最後一根改變時少沿用一根，否則為 0
+    def _Keep(self, key, close):
+        tail = self.Tails[key]
+        m = len(next(iter(self.Cache[key].values())))
+        if not m or len(close) < m or not np.array_equal(close[m - len(tail):m - 1], tail[:-1]):
+            return 0
+        return m if close[m - 1] == tail[-1] else m - 1
+
+    # 取得指標的完整歷史結果；close 為該檔案目前的完整收盤價
+    # file 可為檔案路徑或 (檔案路徑, 週期)，不同週期的K棒各自快取
+    def Get(self, file, name, params, close):
+        key = (file, name, tuple(params))
+        keep = 0
+        if key in self.Cache:
+            keep = self._Keep(key, close)
+            if keep == len(close) == len(next(iter(self.Cache[key].values()))):
+                self.Hits += 1
+                self.Cache.move_to_end(key)
+                return self.Cache[key]
+        if keep:
+            self.Extends += 1
+            result = extend(name, params, close, self.Cache[key], keep)
+        else:
+            self.Misses += 1
+            result = INDICATORS[name](as_float64(close), *params)
+        for values in result.values():
+            values.flags.writeable = False
+        self.Cache[key] = result
+        self.Cache.move_to_end(key)
+        self.Tails[key] = np.array(close[-self.TAIL:])
+        if len(self.Cache) > self.MaxEntries:
+            self.Tails.pop(self.Cache.popitem(last=False)[0], None)
+        return result
+
+    # 取得指標並切出第 [i0, i1) 根(view)
+    def Slice(self, file, name, params, close, i0, i1):
+        return {k: v[i0:i1] for k, v in self.Get(file, name, params, close).items()}
+
+    # 資料更新時清除該檔案(所有週期)的所有快取
+    def Invalidate(self, file):
+        def owner(key):
+            return key[0][0] if isinstance(key[0], tuple) else key[0]
+        for key in [key for key in self.Cache if owner(key) == file]:
+            del self.Cache[key]
+            self.Tails.pop(key, None)
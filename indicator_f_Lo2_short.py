@@ -3,6 +3,8 @@
 import numpy, datetime
 import pandas as pd
 import mplfinance as mpf
+import bar_schema
+from column_buffer import ColumnBuffer
 
 # 🔹 補上畫圖函式：K 線圖用
 def CandlePlot(KBar_dic):
@@ -18,70 +20,203 @@ def CandlePlot(KBar_dic):
     fig, axes = mpf.plot(df, type='candle', volume=True, style='charles', returnfig=True)
     return fig
 
+# 由逐筆成交批次產生時間K棒(向量化)
+# 以整數除法把每筆成交分到 anchor 起算、每 cycle 一格的時間桶，再以分組 reduce 算 OHLCV
+# 時間倒退的成交併入目前最新的一根(與逐筆 TimeAdd 相同)
+# 回傳 (bucket, 每根K棒的欄位字典)
+def TimeBars(time, price, qty, prod, anchor, cycle, last_bucket=None):
+    t = numpy.asarray(time, dtype='datetime64[ns]').astype(numpy.int64)
+    price = numpy.asarray(price, dtype=numpy.float64)
+    qty = numpy.asarray(qty)
+    bucket = (t - numpy.datetime64(anchor, 'ns').astype(numpy.int64)) // _Nanoseconds(cycle)
+    if last_bucket is not None:
+        bucket[0] = max(bucket[0], last_bucket)
+    bucket = numpy.maximum.accumulate(bucket)
+    starts = numpy.flatnonzero(numpy.r_[True, bucket[1:] != bucket[:-1]])
+    ends = numpy.r_[starts[1:], len(bucket)]
+    bars = {
+        'time': (numpy.datetime64(anchor, 'ns') + bucket[starts] * _Nanoseconds(cycle)).astype('datetime64[ns]'),
+        'open': price[starts],
+        'high': numpy.maximum.reduceat(price, starts),
+        'low': numpy.minimum.reduceat(price, starts),
+        'close': price[ends - 1],
+        'volume': numpy.add.reduceat(qty, starts),
+        'prod': numpy.asarray(prod, dtype=object)[starts],
+    }
+    return bucket[starts], bars
+
+# 由逐筆成交批次產生量K棒(向量化)
+# amount 為累計成交量，累計量自本根開盤起達到 cycle 時開新K棒：
+# 以一次 searchsorted 求出每筆成交若為開盤、下一根的起點 nxt，各根起點即由第一根沿 nxt 走出的路徑
+# (下一根的門檻取決於本根開盤時的累計量，不是固定的 cycle 倍數，與逐筆 VolumeAdd 相同)
+# last_amount 為目前最後一根K棒開盤時的累計量(接續既有K棒時使用)
+def VolumeBars(price, amount, cycle, last_amount=None):
+    price = numpy.asarray(price, dtype=numpy.float64)
+    amount = numpy.asarray(amount)
+    first = 0 if last_amount is None else numpy.searchsorted(amount, last_amount + cycle, 'left')
+    starts = _Chain(numpy.searchsorted(amount, amount + cycle, 'left'), first)
+    # 第一根之前的成交屬於既有的最後一根K棒
+    head = starts[0] if len(starts) else len(amount)
+    bars = {}
+    if len(starts):
+        ends = numpy.r_[starts[1:], len(amount)]
+        bars = {
+            'open': price[starts],
+            'high': numpy.maximum.reduceat(price, starts),
+            'low': numpy.minimum.reduceat(price, starts),
+            'close': price[ends - 1],
+            'amount': amount[starts],
+        }
+    return head, bars
+
+# 由 first 沿 nxt(嚴格遞增，len(nxt) 為終點)走出的所有節點，依序回傳
+# 倍增：第 k 輪時 nodes 為前 2^k 步、jump 為走 2^k 步的位置，新走到的節點都在 nodes 之後，直接接上
+def _Chain(nxt, first):
+    n = len(nxt)
+    if first >= n:
+        return numpy.empty(0, dtype=numpy.intp)
+    jump = numpy.r_[nxt, n].astype(numpy.intp)
+    nodes = numpy.array([first], dtype=numpy.intp)
+    while True:
+        reached = jump[nodes]
+        reached = reached[reached < n]
+        if not len(reached):
+            return nodes
+        nodes = numpy.concatenate([nodes, reached])
+        jump = jump[jump]
+
+def _Nanoseconds(cycle):
+    return int(cycle / datetime.timedelta(microseconds=1)) * 1000
+
 # K線指標class
 # 參數 型態(1:'time' , 2:'volume') 週期
+# TimeAdd/VolumeAdd 為逐筆更新的前端，TimeBatchAdd/VolumeBatchAdd 一次處理整批成交，兩者產生的K棒相同
+# 欄位採 bar_schema 的精簡型態，商品以 int16 代碼儲存(代碼表為 Products)
 class KBar():
     def __init__(self, date, type='time', cycle=1):
+        schema = bar_schema.SCHEMA
         if type == 'time':
             self.Cycle = datetime.timedelta(minutes=cycle)
-            self.StartTime = datetime.datetime.strptime(date + '084500', '%Y%m%d%H%M%S') - (self.Cycle * 2)
-            self.Time = numpy.array([self.StartTime])
-            self.Open = numpy.array([0])
-            self.High = numpy.array([0])
-            self.Low = numpy.array([10000000000000])
-            self.Close = numpy.array([0])
-            self.Volume = numpy.array([0])
-            self.Prod = numpy.array([''])
-            self.flag = 0
+            # 時間桶以當日 08:45 為基準對齊
+            self.Anchor = datetime.datetime.strptime(date + '084500', '%Y%m%d%H%M%S')
+            self.Bucket = None
+            self.Products = []
+            self._Codes = {}
+            self.Bars = ColumnBuffer({
+                'time': schema['time'],
+                'open': schema['open'],
+                'high': schema['high'],
+                'low': schema['low'],
+                'close': schema['close'],
+                'volume': schema['volume'],
+                'prod': bar_schema.PRODUCT_CODE,
+            })
         elif type == 'volume':
             self.Cycle = cycle
-            self.Amount = 0
-            self.Open = numpy.array([])
-            self.High = numpy.array([])
-            self.Low = numpy.array([])
-            self.Close = numpy.array([])
+            self.Amount = None
+            self.Bars = ColumnBuffer({
+                'open': schema['open'],
+                'high': schema['high'],
+                'low': schema['low'],
+                'close': schema['close'],
+            })
+
+    # 各欄位(零複製 view)
+    @property
+    def Time(self):
+        return self.Bars.Get('time')
+    @property
+    def Open(self):
+        return self.Bars.Get('open')
+    @property
+    def High(self):
+        return self.Bars.Get('high')
+    @property
+    def Low(self):
+        return self.Bars.Get('low')
+    @property
+    def Close(self):
+        return self.Bars.Get('close')
+    @property
+    def Volume(self):
+        return self.Bars.Get('volume')
+    # 商品名稱(由代碼還原)
+    @property
+    def Prod(self):
+        return bar_schema.decode_products(self.Bars.Get('prod'), self.Products)
+
+    # 商品名稱 → 代碼(新商品加進代碼表)
+    def _ProdCode(self, prod):
+        code = self._Codes.get(prod)
+        if code is None:
+            code = self._Codes[prod] = len(self.Products)
+            self.Products.append(prod)
+        return code
+
+    # 更新最後一根K棒
+    def _Update(self, price, high, low):
+        Bars = self.Bars
+        Bars.SetLast('close', price)
+        if high > Bars.GetLast('high'):
+            Bars.SetLast('high', high)
+        if low < Bars.GetLast('low'):
+            Bars.SetLast('low', low)
 
+    # 逐筆更新，開新K棒時回傳1，否則回傳0
     def TimeAdd(self, time, price, qty, prod):
-        while self.flag == 0 and time >= self.StartTime:
-            self.Time[-1] = self.StartTime
-            self.StartTime += self.Cycle
-        self.flag = 1
-        if time < self.Time[-1] + self.Cycle:
-            self.Close[-1] = price
-            self.Volume[-1] += qty
-            if price > self.High[-1]:
-                self.High[-1] = price
-            elif price < self.Low[-1]:
-                self.Low[-1] = price
+        bucket = (time - self.Anchor) // self.Cycle
+        if self.Bucket is not None and bucket <= self.Bucket:
+            self._Update(price, price, price)
+            self.Bars.SetLast('volume', self.Bars.GetLast('volume') + qty)
             return 0
-        elif time >= self.Time[-1] + self.Cycle:
-            self.Time = numpy.append(self.Time, self.Time[-1] + self.Cycle)
-            self.Open = numpy.append(self.Open, price)
-            self.High = numpy.append(self.High, price)
-            self.Low = numpy.append(self.Low, price)
-            self.Close = numpy.append(self.Close, price)
-            self.Volume = numpy.append(self.Volume, qty)
-            self.Prod = numpy.append(self.Prod, prod)
-            return 1
+        first = self.Bucket is None
+        self.Bucket = bucket
+        self.Bars.Append(self.Anchor + self.Cycle * bucket, price, price, price, price, qty, self._ProdCode(prod))
+        return 0 if first else 1
+
+    # 批次更新，回傳新增的K棒數
+    def TimeBatchAdd(self, time, price, qty, prod):
+        if len(time) == 0:
+            return 0
+        bucket, bars = TimeBars(time, price, qty, prod, self.Anchor, self.Cycle, self.Bucket)
+        n = len(bucket)
+        if self.Bucket is not None and bucket[0] == self.Bucket:
+            # 第一組併入既有的最後一根K棒
+            self._Update(bars['close'][0], bars['high'][0], bars['low'][0])
+            self.Bars.SetLast('volume', self.Bars.GetLast('volume') + bars['volume'][0])
+            bars = {name: bars[name][1:] for name in bars}
+            n -= 1
+        codes, names = bar_schema.encode_products(bars['prod'])
+        bars['prod'] = numpy.array([self._ProdCode(name) for name in names], dtype=bar_schema.PRODUCT_CODE)[codes]
+        self.Bars.Extend(**bars)
+        self.Bucket = int(bucket[-1])
+        return n
 
+    # 逐筆更新(amount 為累計成交量)，開新K棒時回傳1，否則回傳0
     def VolumeAdd(self, price, amount):
-        if self.Amount == 0:
-            self.Open = numpy.append(self.Open, price)
-            self.High = numpy.append(self.High, price)
-            self.Low = numpy.append(self.Low, price)
-            self.Close = numpy.append(self.Close, price)
+        if self.Amount is None:
+            self.Bars.Append(price, price, price, price)
             self.Amount = amount
+            return 0
         elif amount - self.Amount < self.Cycle:
-            self.Close[-1] = price
-            if price > self.High[-1]:
-                self.High[-1] = price
-            elif price < self.Low[-1]:
-                self.Low[-1] = price
+            self._Update(price, price, price)
             return 0
-        elif amount - self.Amount > self.Cycle:
-            self.Open = numpy.append(self.Open, price)
-            self.High = numpy.append(self.High, price)
-            self.Low = numpy.append(self.Low, price)
-            self.Close = numpy.append(self.Close, price)
+        else:
+            self.Bars.Append(price, price, price, price)
             self.Amount = amount
             return 1
+
+    # 批次更新(amount 為累計成交量)，回傳新增的K棒數
+    def VolumeBatchAdd(self, price, amount):
+        if len(price) == 0:
+            return 0
+        price = numpy.asarray(price, dtype=numpy.float64)
+        head, bars = VolumeBars(price, amount, self.Cycle, self.Amount)
+        if head > 0:
+            # 第一根之前的成交併入既有的最後一根K棒
+            self._Update(price[head - 1], price[:head].max(), price[:head].min())
+        if not bars:
+            return 0
+        self.Amount = bars.pop('amount')[-1]
+        self.Bars.Extend(**bars)
+        return len(bars['open'])
@@ -2,95 +2,125 @@
 import requests,datetime,os,time
 import numpy as np
 import matplotlib.dates as mdates
-#from talib.abstract import *  # 載入技術指標函數
+import bar_schema
+from column_buffer import ColumnBuffer
+# 技術指標改用串流計算(取代 talib)，每根K棒 O(1) 更新
+from stream_indicator import StreamSMA, StreamEMA, StreamWMA, StreamBBands, StreamRSI, StreamKD, StreamWILLR, StreamBIAS
 
     
 # 算K棒
 class KBar():
     # 設定初始化變數
-    def __init__(self,date,cycle = 1):
-        # K棒的頻率(分鐘)
-        self.TAKBar = {}
-        self.TAKBar['time'] = np.array([])
-        self.TAKBar['open'] = np.array([])
-        self.TAKBar['high'] = np.array([])
-        self.TAKBar['low'] = np.array([])
-        self.TAKBar['close'] = np.array([])
-        self.TAKBar['volume'] = np.array([])
+    # capacity=None 保留全部歷史；capacity=N 為即時盤用的固定容量環狀模式，只保留最新 N 根
+    def __init__(self,date,cycle = 1,capacity = None):
+        # K棒欄位(預先配置、倍數成長的 typed 陣列，取值皆為零複製 view；型態見 bar_schema)
+        self.Buffer = ColumnBuffer({name: bar_schema.SCHEMA[name] for name in ['time','open','high','low','close','volume']},
+                                   capacity = capacity)
         self.current = datetime.datetime.strptime(date + ' 00:00:00','%Y-%m-%d %H:%M:%S')
+        # K棒的頻率(分鐘)
         self.cycle = datetime.timedelta(minutes = cycle)
+        # 已啟用的串流指標 {(名稱, 參數): (指標, 數值緩衝區)}，第一次呼叫 Get 時建立
+        self.Indicators = {}
+    # 相容舊介面：以字典取得各欄位
+    @property
+    def TAKBar(self):
+        return {name: self.Buffer.Get(name) for name in self.Buffer.Names}
     # 更新最新報價
     def AddPrice(self,time, open_price, close_price, low_price, high_price,volume):
         # 同一根K棒
         if time <= self.current:
+            Buffer = self.Buffer
             # 更新收盤價
-            self.TAKBar['close'][-1] = close_price
+            Buffer.SetLast('close',close_price)
             # 更新成交量
-            self.TAKBar['volume'][-1] += volume  
+            Buffer.SetLast('volume',Buffer.GetLast('volume') + volume)
             # 更新最高價
-            self.TAKBar['high'][-1] = max(self.TAKBar['high'][-1],high_price)
+            Buffer.SetLast('high',max(Buffer.GetLast('high'),high_price))
             # 更新最低價
-            self.TAKBar['low'][-1] = min(self.TAKBar['low'][-1],low_price)  
+            Buffer.SetLast('low',min(Buffer.GetLast('low'),low_price))
+            # 重算最新一根的指標
+            self._UpdateIndicators(True)
             # 若沒有更新K棒，則回傳0
             return 0
         # 不同根K棒
         else:
             while time > self.current:
                 self.current += self.cycle
-            self.TAKBar['time'] = np.append(self.TAKBar['time'],self.current)
-            self.TAKBar['open'] = np.append(self.TAKBar['open'],open_price)
-            self.TAKBar['high'] = np.append(self.TAKBar['high'],high_price)
-            self.TAKBar['low'] = np.append(self.TAKBar['low'],low_price)
-            self.TAKBar['close'] = np.append(self.TAKBar['close'],close_price)
-            self.TAKBar['volume'] = np.append(self.TAKBar['volume'],volume)
+            self.Buffer.Append(self.current,open_price,high_price,low_price,close_price,volume)
+            # 上一根K棒完成，併入指標狀態並計算新的一根
+            self._UpdateIndicators(False)
             # 若有更新K棒，則回傳1
             return 1
+    # 更新所有已啟用的指標(amend=True 為同一根K棒報價更新)
+    def _UpdateIndicators(self,amend):
+        if not self.Indicators:
+            return
+        Buffer = self.Buffer
+        # 價格以 float32 儲存，還原成 float64 後計算指標
+        high,low,close = [round(float(Buffer.GetLast(name)),bar_schema.PRICE_DECIMALS) for name in ('high','low','close')]
+        for indicator,values in self.Indicators.values():
+            if amend:
+                for name,value in zip(values.Names,indicator.Amend(high,low,close)):
+                    values.SetLast(name,value)
+            else:
+                values.Append(*indicator.Push(high,low,close))
+    # 取得(必要時建立)指標的數值緩衝區，建立時以目前保留的K棒補算歷史
+    def _Indicator(self,key,factory):
+        if key not in self.Indicators:
+            indicator = factory()
+            values = ColumnBuffer({name: np.float64 for name in indicator.Names}, capacity = self.Buffer.Capacity)
+            high,low,close = [bar_schema.as_float64(values).tolist() for values in (self.GetHigh(),self.GetLow(),self.GetClose())]
+            for i in range(len(close)):
+                values.Append(*indicator.Push(high[i],low[i],close[i]))
+            self.Indicators[key] = (indicator,values)
+        return self.Indicators[key][1]
     # 取時間
     def GetTime(self):
-        return self.TAKBar['time']      
+        return self.Buffer.Get('time')
     # 取開盤價
     def GetOpen(self):
-        return self.TAKBar['open']
+        return self.Buffer.Get('open')
     # 取最高價
     def GetHigh(self):
-        return self.TAKBar['high']
+        return self.Buffer.Get('high')
     # 取最低價
     def GetLow(self):
-        return self.TAKBar['low']
+        return self.Buffer.Get('low')
     # 取收盤價
     def GetClose(self):
-        return self.TAKBar['close']
+        return self.Buffer.Get('close')
     # 取成交量
     def GetVolume(self):
-        return self.TAKBar['volume']
-    # 取MA值(MA期數)
-    # def GetMA(self,n,matype):
-    #     return MA(self.TAKBar,n,matype)    
-    # # 取SMA值(SMA期數)
-    # def GetSMA(self,n):
-    #     return SMA(self.TAKBar,n)
-    # # 取WMA值(WMA期數)
-    # def GetWMA(self,n):
-    #     return WMA(self.TAKBar,n)
-    # # 取EMA值(EMA期數)
-    # def GetEMA(self,n):
-    #     return EMA(self.TAKBar,n)    
-    # # 取布林通道值(中線期數)
-    # def GetBBands(self,n):
-    #     return BBANDS(self.TAKBar,n)   ##BBANDS()函數有很多選項,此處只使用期數 n
-    # # RSI(RSI期數)
-    # def GetRSI(self,n):
-    #     return RSI(self.TAKBar,n)
-    # # 取KD值(RSV期數,K值期數,D值期數)
-    # def GetKD(self,rsv,k,d):
-    #     return STOCH(self.TAKBar,fastk_period = rsv,slowk_period = k,slowd_period = d)
-    # # 取得威廉指標        
-    # def GetWILLR(self,tp=14):  
-    #     return WILLR(self.TAKBar, timeperiod=tp)
-    # # 取得乖離率
-    # def GetBIAS(self,tn=10):
-    #     mavalue=MA(self.TAKBar,timeperiod=tn,matype=0)
-    #     return (self.TAKBar['close']-mavalue)/mavalue
+        return self.Buffer.Get('volume')
+    # 取MA值(MA期數, 0:SMA 1:EMA 2:WMA)
+    def GetMA(self,n,matype = 0):
+        return (self.GetSMA,self.GetEMA,self.GetWMA)[matype](n)
+    # 取SMA值(SMA期數)
+    def GetSMA(self,n):
+        return self._Indicator(('SMA',n),lambda: StreamSMA(n)).Get('value')
+    # 取WMA值(WMA期數)
+    def GetWMA(self,n):
+        return self._Indicator(('WMA',n),lambda: StreamWMA(n)).Get('value')
+    # 取EMA值(EMA期數)
+    def GetEMA(self,n):
+        return self._Indicator(('EMA',n),lambda: StreamEMA(n)).Get('value')
+    # 取布林通道值(中線期數, 標準差倍數)，回傳 (上軌, 中線, 下軌)
+    def GetBBands(self,n,nbdev = 2):
+        values = self._Indicator(('BBANDS',n,nbdev),lambda: StreamBBands(n,nbdev))
+        return values.Get('upper'),values.Get('middle'),values.Get('lower')
+    # RSI(RSI期數)
+    def GetRSI(self,n):
+        return self._Indicator(('RSI',n),lambda: StreamRSI(n)).Get('value')
+    # 取KD值(RSV期數,K值期數,D值期數)，回傳 (K, D)
+    def GetKD(self,rsv,k,d):
+        values = self._Indicator(('KD',rsv,k,d),lambda: StreamKD(rsv,k,d))
+        return values.Get('k'),values.Get('d')
+    # 取得威廉指標
+    def GetWILLR(self,tp=14):
+        return self._Indicator(('WILLR',tp),lambda: StreamWILLR(tp)).Get('value')
+    # 取得乖離率
+    def GetBIAS(self,tn=10):
+        return self._Indicator(('BIAS',tn),lambda: StreamBIAS(tn)).Get('value')
 
 
 
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+看板的計時與記憶體量測：以區段(span)記錄每個階段的耗時、記憶體尖峰增量與快取命中
+Span 為 context manager，traced 為裝飾器，Stage 依序切換看板的大區塊(前一個區塊自動結束)
+被快取的函數在函數本體內呼叫 mark_miss()，該次呼叫就記為未命中(沒有呼叫即為命中)
+記憶體以 tracemalloc 量測(會拖慢配置，預設關閉)，每次重跑的結果以 JSON 一行寫入輪替的記錄檔
+tracemalloc 只在有量測進行中時開啟：第一個 memory=True 的量測開始追蹤，最後一個結束(Finish)時停止
+(追蹤與尖峰值是整個行程共用的，多個 session 同時量測時各區段的尖峰可能包含其他 session 的配置)
+"""
+
+import functools
+import json
+import logging
+import logging.handlers
+import os
+import threading
+import time
+import tracemalloc
+import weakref
+
+LOG_PATH = './logs/dashboard_timing.log'
+# 單一記錄檔上限與保留的舊檔數
+LOG_BYTES = 1_000_000
+LOG_BACKUPS = 5
+
+_local = threading.local()
+
+# 正在量測記憶體的 Instrumentation 數；由本模組開啟的追蹤在歸零時停止(外部開啟的不動)
+_trace_lock = threading.Lock()
+_trace_users = 0
+_trace_started = False
+
+def _start_tracing():
+    global _trace_users, _trace_started
+    with _trace_lock:
+        if _trace_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _trace_started = True
+        _trace_users += 1
+
+def _stop_tracing():
+    global _trace_users, _trace_started
+    with _trace_lock:
+        _trace_users -= 1
+        if _trace_users == 0 and _trace_started:
+            tracemalloc.stop()
+            _trace_started = False
+
+# 取得(第一次呼叫時建立)輪替記錄檔的 logger
+def get_logger(path=LOG_PATH):
+    logger = logging.getLogger('dashboard.timing')
+    if not logger.handlers:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handler = logging.handlers.RotatingFileHandler(path, maxBytes=LOG_BYTES, backupCount=LOG_BACKUPS,
+                                                       encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    return logger
+
+class Instrumentation():
+    # memory=True 時以 tracemalloc 量測每個區段的記憶體尖峰增量(追蹤到 Finish 為止)
+    def __init__(self, memory=False):
+        self.Memory = memory
+        self.Records = []
+        self._Stack = []
+        self._Stage = None
+        self._Tracing = False
+        self.Started = time.perf_counter()
+        if memory:
+            _start_tracing()
+            self._Tracing = True
+        # 弱參照：沒有呼叫 Finish 的量測也能被回收(並結束記憶體追蹤)
+        _local.current = weakref.ref(self)
+
+    # 結束記憶體追蹤(只結束一次；重跑中途例外沒有呼叫 Finish 時由 __del__ 結束)
+    def _StopTracing(self):
+        if self._Tracing:
+            self._Tracing = False
+            _stop_tracing()
+
+    def __del__(self):
+        self._StopTracing()
+
+    # 區段開始：回傳該區段的紀錄(dict)
+    def _Enter(self, name, cached):
+        record = {'name': name, 'depth': len(self._Stack), 'seconds': None, 'peak_kb': None,
+                  'cache': 'hit' if cached else '', '_child_peak': 0}
+        if self._Tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            if self._Stack:
+                parent = self._Stack[-1]
+                parent['_child_peak'] = max(parent['_child_peak'], peak)
+            tracemalloc.reset_peak()
+            record['_start_mem'] = current
+        record['_t0'] = time.perf_counter()
+        self._Stack.append(record)
+        self.Records.append(record)
+        return record
+
+    # 區段結束：記錄耗時與記憶體尖峰增量，並把尖峰往外層傳
+    def _Exit(self, record):
+        record['seconds'] = time.perf_counter() - record.pop('_t0')
+        self._Stack.remove(record)
+        if '_start_mem' in record:
+            peak = max(tracemalloc.get_traced_memory()[1], record['_child_peak'])
+            record['peak_kb'] = (peak - record.pop('_start_mem')) / 1024
+            if self._Stack:
+                parent = self._Stack[-1]
+                parent['_child_peak'] = max(parent['_child_peak'], peak)
+        record.pop('_child_peak')
+
+    # 量測一段程式：with instr.Span('載入資料', cached=True): ...
+    def Span(self, name, cached=False):
+        instr = self
+        class _Span():
+            def __enter__(self):
+                self.Record = instr._Enter(name, cached)
+                return self.Record
+            def __exit__(self, *exc):
+                instr._Exit(self.Record)
+                return False
+        return _Span()
+
+    # 切換到下一個大區塊(結束目前的區塊)
+    def Stage(self, name):
+        if self._Stage is not None:
+            self._Exit(self._Stage)
+        self._Stage = self._Enter(name, False)
+
+    # 目前最內層的區段記為快取未命中
+    def MarkMiss(self):
+        for record in reversed(self._Stack):
+            if record['cache']:
+                record['cache'] = 'miss'
+                return
+
+    # 結束所有區段，回傳總耗時
+    def Finish(self):
+        if self._Stage is not None:
+            self._Exit(self._Stage)
+            self._Stage = None
+        for record in reversed(list(self._Stack)):
+            self._Exit(record)
+        self._StopTracing()
+        if current() is self:
+            _local.current = None
+        return time.perf_counter() - self.Started
+
+    # 把這次重跑的所有區段以 JSON 一行寫入記錄檔
+    def Log(self, total=None, logger=None, **extra):
+        logger = logger or get_logger()
+        total = time.perf_counter() - self.Started if total is None else total
+        logger.info(json.dumps({'total_s': round(total, 6), **extra,
+                                'spans': [{k: v for k, v in r.items() if v not in (None, '')} for r in self.Records]},
+                               ensure_ascii=False))
+
+# 目前執行緒正在量測的 Instrumentation(Streamlit 每個 session 在自己的執行緒重跑)
+def current():
+    ref = getattr(_local, 'current', None)
+    return ref() if ref is not None else None
+
+# 在被快取的函數本體內呼叫：本次呼叫為快取未命中
+def mark_miss():
+    instr = current()
+    if instr is not None:
+        instr.MarkMiss()
+
+# 裝飾器：每次呼叫都記錄為一個區段(沒有進行中的量測時直接呼叫)
+def traced(name=None, cached=False):
+    def decorator(func):
+        label = name or func.__name__
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            instr = current()
+            if instr is None:
+                return func(*args, **kwargs)
+            with instr.Span(label, cached):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
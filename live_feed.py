@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+"""
+即時行情接收：asyncio 管線把逐筆成交批次送進 K 棒產生器，再把完成的 K 棒與指標推送給訂閱者
+資料來源可替換：ReplaySource 以設定的倍速回放 .pkl 歷史資料(不需券商連線)，ShioajiSource 接 shioaji 即時報價
+所有佇列都有容量上限，下游處理不及時上游的 put 會等待(背壓)，不會無限制堆積
+指定 stores 時完成的K棒另外以 bar_store.SegmentWriter 寫進該商品的欄位式儲存(封存分段)，看板下次重跑即可讀到
+執行：python live_feed.py [檔案.pkl] [回放倍速(0 為全速)]
+檢查回放寫入欄位式儲存的K棒與原始檔一致：python live_feed.py verify [檔案.pkl ...]
+"""
+
+import asyncio
+import collections
+import sys
+import time
+import numpy as np
+import pandas as pd
+import bar_store
+import indicator_f_Lo2_short
+from bar_schema import as_float64
+from column_buffer import ColumnBuffer
+from stream_indicator import StreamSMA, StreamRSI
+
+# 逐筆成交：time 為 int64 奈秒，received 為進入管線的時間(perf_counter_ns，量測端到端延遲用)
+Tick = collections.namedtuple('Tick', ['time', 'price', 'qty', 'prod', 'received'])
+
+# 預設推送的指標：{名稱: 建立串流指標的函數}，每個商品各自一組，每根完成的K棒 O(1) 更新
+DEFAULT_INDICATORS = {
+    'MA5': lambda: StreamSMA(5),
+    'MA20': lambda: StreamSMA(20),
+    'RSI14': lambda: StreamRSI(14),
+}
+
+# ──────────────────────────────────────────────────────────────────────────────
+# 本機回放：把 1 分K 拆成 4 筆成交(開→低→高→收，下跌K棒為 開→高→低→收)依時間送出
+class ReplaySource():
+    # speed: 回放倍速(市場秒數/實際秒數)，0 或 None 為全速
+    # max_gap: 收盤、跨日等空檔最多只等待的市場秒數
+    # limit: 只回放前 limit 根K棒
+    def __init__(self, path, speed=60.0, max_gap=60, limit=None, prod=None):
+        self.Path = path
+        self.Speed = speed
+        self.MaxGap = max_gap
+        self.Limit = limit
+        self.Prod = prod or path.replace('\\', '/').split('/')[-1].split('_')[2]
+
+    # 產生全部回放成交的陣列 (time, price, qty)
+    def Ticks(self):
+        df = pd.read_pickle(self.Path)
+        if self.Limit is not None:
+            df = df.iloc[:self.Limit]
+        # 原始K棒時間為該分鐘的結束時間，成交平均分布在這一分鐘內
+        start = pd.to_datetime(df['time']).to_numpy('datetime64[ns]').view(np.int64) - 60 * 10**9
+        o, h, l, c = (df[name].to_numpy(np.float64) for name in ['open', 'high', 'low', 'close'])
+        up = c >= o
+        price = np.stack([o, np.where(up, l, h), np.where(up, h, l), c], axis=1).ravel()
+        tick_time = (start[:, None] + np.arange(4) * 15 * 10**9).ravel()
+        volume = df['volume'].to_numpy(np.int64)
+        qty = np.repeat(volume // 4, 4).reshape(-1, 4)
+        qty[:, -1] += volume % 4
+        return tick_time, price, qty.ravel()
+
+    async def Run(self, emit):
+        tick_time, price, qty = self.Ticks()
+        tick_time, price, qty = tick_time.tolist(), price.tolist(), qty.tolist()
+        wall0 = time.perf_counter()
+        market = 0.0
+        for i in range(len(tick_time)):
+            if self.Speed and i:
+                market += min((tick_time[i] - tick_time[i - 1]) / 1e9, self.MaxGap)
+                delay = wall0 + market / self.Speed - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            await emit(Tick(tick_time[i], price[i], qty[i], self.Prod, time.perf_counter_ns()))
+
+# shioaji 即時報價(期貨/選擇權逐筆)；api 需已登入
+# 報價回呼在 shioaji 的執行緒執行，佇列滿時該執行緒會等待，直到管線消化
+class ShioajiSource():
+    def __init__(self, api, contracts):
+        self.Api = api
+        self.Contracts = list(contracts)
+
+    async def Run(self, emit):
+        import shioaji as sj
+        loop = asyncio.get_running_loop()
+        def on_tick(exchange, tick):
+            item = Tick(int(np.datetime64(tick.datetime, 'ns').astype(np.int64)), float(tick.close),
+                        int(tick.volume), tick.code, time.perf_counter_ns())
+            asyncio.run_coroutine_threadsafe(emit(item), loop).result()
+        self.Api.quote.set_on_tick_fop_v1_callback(on_tick)
+        for contract in self.Contracts:
+            self.Api.quote.subscribe(contract, quote_type=sj.constant.QuoteType.Tick,
+                                     version=sj.constant.QuoteVersion.v1)
+        try:
+            # 持續接收直到被取消
+            await asyncio.Event().wait()
+        finally:
+            for contract in self.Contracts:
+                self.Api.quote.unsubscribe(contract, quote_type=sj.constant.QuoteType.Tick,
+                                           version=sj.constant.QuoteVersion.v1)
+
+# ──────────────────────────────────────────────────────────────────────────────
+# 接收管線：來源 → 有界佇列 → 批次 TimeBatchAdd(每個商品一個 KBar) → 訂閱者佇列
+class FeedPipeline():
+    # cycle: K棒週期(分鐘)；queue_size: 成交佇列上限；batch_size: 每次最多處理的成交筆數
+    # stores: {商品: .pkl 路徑}，完成的K棒寫入對應的欄位式儲存(根目錄為 store_root)
+    def __init__(self, source, cycle=1, queue_size=2048, batch_size=512, indicators=None, stores=None,
+                 store_root=bar_store.STORE_ROOT):
+        self.Source = source
+        self.Cycle = cycle
+        self.Queue = asyncio.Queue(maxsize=queue_size)
+        self.BatchSize = batch_size
+        self.Indicators = DEFAULT_INDICATORS if indicators is None else indicators
+        # 商品 → KBar、串流指標、已推送的K棒數
+        self.Builders = {}
+        self.Streams = {}
+        self.Published = {}
+        self.Writers = {prod: bar_store.SegmentWriter(path, store_root) for prod, path in (stores or {}).items()}
+        self.Subscribers = []
+        self.Latency = ColumnBuffer({'latency': np.int64})
+        self.TickCount = 0
+        self.BarCount = 0
+        self.Started = None
+        self.Finished = None
+
+    # 訂閱完成的K棒，回傳有界佇列(讀不完時管線會等待)；資料結束時收到 None
+    def Subscribe(self, maxsize=1000):
+        queue = asyncio.Queue(maxsize=maxsize)
+        self.Subscribers.append(queue)
+        return queue
+
+    # 來源呼叫：放入一筆成交(佇列滿時等待)
+    async def Put(self, tick):
+        await self.Queue.put(tick)
+
+    # 推送商品 prod 第 [已推送, upto) 根K棒
+    async def _Publish(self, prod, upto):
+        kbar = self.Builders[prod]
+        streams = self.Streams.setdefault(prod, {name: factory() for name, factory in self.Indicators.items()})
+        start = self.Published.get(prod, 0)
+        # KBar 以時間桶的起點標記，推送與寫入時改為結束時間(與 .pkl、欄位式儲存相同)
+        end = kbar.Time[start:upto] + np.timedelta64(self.Cycle, 'm')
+        # K棒以精簡型態儲存，推送前價格還原成 float64
+        prices = {name: as_float64(getattr(kbar, name.capitalize())[start:upto]).tolist()
+                  for name in ['open', 'high', 'low', 'close']}
+        for i in range(start, upto):
+            bar = {'prod': prod, 'time': end[i - start], **{name: values[i - start] for name, values in prices.items()},
+                   'volume': int(kbar.Volume[i])}
+            # 只推送已完成的K棒，指標不需要 Amend
+            for name, stream in streams.items():
+                values = stream.Push(bar['high'], bar['low'], bar['close'])
+                if len(values) == 1:
+                    bar[name] = values[0]
+                else:
+                    bar.update({f'{name}_{sub}': value for sub, value in zip(stream.Names, values)})
+            for queue in self.Subscribers:
+                await queue.put(bar)
+            self.BarCount += 1
+        if prod in self.Writers and upto > start:
+            self.Writers[prod].Add({'time': end, **{name: getattr(kbar, name.capitalize())[start:upto]
+                                                    for name in ['open', 'high', 'low', 'close', 'volume']}})
+        self.Published[prod] = max(self.Published.get(prod, 0), upto)
+
+    # 處理一批成交：依商品分組批次更新K棒，最後一根仍在形成中，之前的都已完成
+    async def _Process(self, batch):
+        tick_time, price, qty, prod, received = zip(*batch)
+        tick_time = np.array(tick_time, dtype=np.int64).view('datetime64[ns]')
+        price = np.array(price, dtype=np.float64)
+        qty = np.array(qty, dtype=np.int64)
+        prod = np.array(prod, dtype=object)
+        for p in dict.fromkeys(prod):
+            mask = prod == p
+            if p not in self.Builders:
+                date = tick_time[mask][0].astype('datetime64[D]').item().strftime('%Y%m%d')
+                self.Builders[p] = indicator_f_Lo2_short.KBar(date, 'time', self.Cycle)
+            kbar = self.Builders[p]
+            kbar.TimeBatchAdd(tick_time[mask], price[mask], qty[mask], prod[mask])
+            await self._Publish(p, len(kbar.Close) - 1)
+        self.Latency.Extend(latency=time.perf_counter_ns() - np.array(received, dtype=np.int64))
+        self.TickCount += len(batch)
+
+    async def _Consume(self):
+        done = False
+        while not done:
+            tick = await self.Queue.get()
+            if tick is None:
+                break
+            batch = [tick]
+            while len(batch) < self.BatchSize and not self.Queue.empty():
+                tick = self.Queue.get_nowait()
+                if tick is None:
+                    done = True
+                    break
+                batch.append(tick)
+            await self._Process(batch)
+        # 資料結束：推送最後一根K棒並通知訂閱者
+        for prod, kbar in self.Builders.items():
+            await self._Publish(prod, len(kbar.Close))
+        for writer in self.Writers.values():
+            writer.Flush()
+        for queue in self.Subscribers:
+            await queue.put(None)
+
+    # 執行到來源結束，回傳統計
+    async def Run(self):
+        self.Started = time.perf_counter()
+        consumer = asyncio.create_task(self._Consume())
+        source = asyncio.create_task(self.Source.Run(self.Put))
+        try:
+            await asyncio.wait([consumer, source], return_when=asyncio.FIRST_COMPLETED)
+            if consumer.done():
+                # 處理端出錯(例如新增的K棒與欄位式儲存不一致)時停止來源，不會卡在已滿的佇列
+                source.cancel()
+                await asyncio.gather(source, return_exceptions=True)
+            else:
+                await source
+        finally:
+            if not consumer.done():
+                await self.Queue.put(None)
+            await consumer
+            self.Finished = time.perf_counter()
+        return self.Stats()
+
+    # 吞吐量與端到端延遲(成交進入管線 → 所屬批次處理並推送完成)
+    def Stats(self):
+        latency = self.Latency.Get('latency') / 1e3
+        elapsed = (self.Finished or time.perf_counter()) - (self.Started or time.perf_counter())
+        return {
+            'ticks': self.TickCount,
+            'bars': self.BarCount,
+            'seconds': elapsed,
+            'ticks_per_sec': self.TickCount / elapsed if elapsed > 0 else np.nan,
+            'latency_p50_us': float(np.percentile(latency, 50)) if len(latency) else np.nan,
+            'latency_p99_us': float(np.percentile(latency, 99)) if len(latency) else np.nan,
+            'latency_max_us': float(latency.max()) if len(latency) else np.nan,
+        }
+
+# 訂閱者：持續讀取K棒並交給 callback，直到資料結束
+async def consume(queue, callback):
+    while True:
+        bar = await queue.get()
+        if bar is None:
+            return
+        callback(bar)
+
+# 回放一個檔案並收集推送的K棒，回傳 (統計, K棒列表)
+async def replay(path, speed=0, limit=None, cycle=1, **kwargs):
+    pipeline = FeedPipeline(ReplaySource(path, speed=speed, limit=limit), cycle=cycle, **kwargs)
+    bars = []
+    subscriber = asyncio.create_task(consume(pipeline.Subscribe(), bars.append))
+    stats = await pipeline.Run()
+    await subscriber
+    return stats, bars
+
+# 檢查回放寫入欄位式儲存的K棒：暫存資料夾中以原始檔前 head 根建立資料集，回放前 limit 根並寫入
+# (與已儲存重疊的部分由 append_bars 逐根比對)，再把資料集與原始檔前 limit 根逐列比對，回傳不一致的列數
+def verify_store(path, limit=3000, head=1000):
+    import os
+    import tempfile
+    df = pd.read_pickle(path).iloc[:limit]
+    df['time'] = pd.to_datetime(df['time'])
+    with tempfile.TemporaryDirectory() as tmp:
+        store = os.path.join(tmp, os.path.basename(path))
+        df.iloc[:head].to_pickle(store)
+        root = os.path.join(tmp, 'store')
+        source = ReplaySource(path, speed=0, limit=limit)
+        pipeline = FeedPipeline(source, stores={source.Prod: store}, store_root=root)
+        asyncio.run(pipeline.Run())
+        stored = bar_store.read_range(*bar_store.open_dataset(store, root))
+    if len(stored['time']) != len(df):
+        return abs(len(stored['time']) - len(df))
+    same = stored['time'] == df['time'].to_numpy('datetime64[ns]')
+    for name in ['open', 'high', 'low', 'close']:
+        same &= as_float64(stored[name]) == df[name].to_numpy(np.float64)
+    same &= stored['volume'] == df['volume'].to_numpy()
+    return int((~same).sum())
+
+if __name__ == '__main__':
+    import glob
+    if sys.argv[1:2] == ['verify']:
+        failed = False
+        for path in sys.argv[2:] or sorted(glob.glob('./*.pkl')):
+            mismatched = verify_store(path)
+            failed |= mismatched > 0
+            print('通過' if not mismatched else f'失敗({mismatched} 列不一致)', path)
+        sys.exit(1 if failed else 0)
+    path = sys.argv[1] if len(sys.argv) > 1 else sorted(glob.glob('./*.pkl'))[0]
+    speed = float(sys.argv[2]) if len(sys.argv) > 2 else 0
+    stats, bars = asyncio.run(replay(path, speed=speed))
+    for key, value in stats.items():
+        print(f"{key}: {value:,.2f}" if isinstance(value, float) else f"{key}: {value:,}")
+    print('最後一根：', bars[-1] if bars else None)
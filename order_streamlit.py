@@ -6,67 +6,195 @@ import matplotlib.dates as mdates
 import numpy as np
 # import haohaninfo,time
 import time
+from collections import deque
 import streamlit as st
+from column_buffer import ColumnBuffer
 
 # 下單部位管理物件
+# 未平倉部位：每個(買賣方向, 商品)一條先進先出的佇列，每筆進場記錄一次並保存口數，平倉時可部分成交
+# 交易紀錄與每口盈虧存放在 typed 欄位陣列
+# Spec 為商品合約規格(contract_spec.ContractSpec)，給定時每口盈虧會扣除來回手續費與交易稅(換算成點數)
 class Record():
-    def __init__(self ):   ## 建構子
-        # 儲存績效
-        self.Profit=[]
-        self.Profit_rate=[]
-        # 未平倉
+    def __init__(self, Spec=None):   ## 建構子
+        self.Spec=Spec
+        # 儲存績效(每口一筆)
+        self.Performance=ColumnBuffer({'profit':np.float64,'profit_rate':np.float64})
+        # 未平倉 {(1或-1, 商品): deque([[口數, 進場時間, 進場價格], ...])}
         self.OpenInterestQty=0
-        self.OpenInterest=[]
-        # 交易紀錄總計
-        self.TradeRecord=[]
+        self.OpenInterest={}
+        # 交易紀錄總計(方向 1:多單 -1:空單，商品以代碼存放，對照 self.Products)
+        self.TradeRecord=ColumnBuffer({
+            'side':np.int8,
+            'product':np.int32,
+            'order_time':'datetime64[ns]',
+            'order_price':np.float64,
+            'cover_time':'datetime64[ns]',
+            'cover_price':np.float64,
+            'qty':np.int64,
+            'cost':np.float64,
+        })
+        self.Products=[]
+        self.ProductCode={}
+        # 平倉時即時累計的績效統計，各 Get 函數直接回傳
+        self.TotalNumber=0
+        self.TotalProfit=0
+        self.TotalProfit_rate=0
+        self.WinNumber=0
+        self.WinProfit=0
+        self.LossNumber=0
+        self.LossProfit=0
+        self.AccLoss=0
+        self.MaxAccLoss=0
+        self.MaxCapital=0
+        self.MDD=0
+        self.MaxCapital_rate=0
+        self.MDD_rate=0
+        # 累計盈虧與累計投資報酬率(第一筆為 0)
+        self.Cumulative=ColumnBuffer({'profit':np.float64,'profit_rate':np.float64})
+        self.Cumulative.Append(0,0)
+    # 每口盈虧
+    @property
+    def Profit(self):
+        return self.Performance.Get('profit')
+    # 每口投資報酬率
+    @property
+    def Profit_rate(self):
+        return self.Performance.Get('profit_rate')
     # 進場紀錄
     def Order(self, BS,Product,OrderTime,OrderPrice,OrderQty):
         if BS=='B' or BS=='Buy':
-            for i in range(OrderQty):
-                self.OpenInterest.append([1,Product,OrderTime,OrderPrice])
-                self.OpenInterestQty +=1
+            side=1
         elif BS=='S' or BS=='Sell':
-            for i in range(OrderQty):
-                self.OpenInterest.append([-1,Product,OrderTime,OrderPrice])
-                self.OpenInterestQty -=1
+            side=-1
+        else:
+            return
+        self.OpenInterest.setdefault((side,Product),deque()).append([OrderQty,OrderTime,OrderPrice])
+        self.OpenInterestQty += side*OrderQty
     # 出場紀錄(買賣別需與進場相反，多單進場則空單出場)
     def Cover(self, BS,Product,CoverTime,CoverPrice,CoverQty):
         if BS=='S' or BS=='Sell':
-            for i in range(CoverQty):
-                # 取得多單未平倉部位
-                TmpInterest=[ i for i in self.OpenInterest if i[0]==1 ][0]
-                if TmpInterest != []:
-                    # 清除未平倉紀錄
-                    self.OpenInterest.remove(TmpInterest)
-                    self.OpenInterestQty -=1
-                    # 新增交易紀錄
-                    self.TradeRecord.append(['B',TmpInterest[1],TmpInterest[2],TmpInterest[3],CoverTime,CoverPrice])
-                    self.Profit.append(CoverPrice-TmpInterest[3])
-                    self.Profit_rate.append((CoverPrice-TmpInterest[3])/TmpInterest[3])
-                else:
-                    print('尚無進場')
+            side=1
         elif BS=='B' or BS=='Buy':
-            for i in range(CoverQty):
-                # 取得空單未平倉部位
-                TmpInterest=[ i for i in self.OpenInterest if i[0]==-1 ][0]
-                if TmpInterest != []:
-                    # 清除未平倉紀錄
-                    self.OpenInterest.remove(TmpInterest)
-                    self.OpenInterestQty +=1
-                    # 新增交易紀錄
-                    self.TradeRecord.append(['S',TmpInterest[1],TmpInterest[2],TmpInterest[3],CoverTime,CoverPrice])
-                    self.Profit.append(TmpInterest[3]-CoverPrice)
-                    self.Profit_rate.append((TmpInterest[3]-CoverPrice)/TmpInterest[3])
-                else:
-                    print('尚無進場')
+            side=-1
+        else:
+            return
+        # 取得該方向、該商品的未平倉部位
+        Lots=self.OpenInterest.get((side,Product))
+        while CoverQty>0:
+            if not Lots:
+                print('尚無進場')
+                return
+            Lot=Lots[0]
+            Qty=min(CoverQty,Lot[0])
+            # 清除未平倉紀錄(部分平倉則只扣口數)
+            if Qty==Lot[0]:
+                Lots.popleft()
+            else:
+                Lot[0]-=Qty
+            CoverQty-=Qty
+            self.OpenInterestQty -= side*Qty
+            # 新增交易紀錄
+            self._AddTrade(side,Product,Lot[1],Lot[2],CoverTime,CoverPrice,Qty)
+    # 新增一筆平倉紀錄與每口盈虧
+    def _AddTrade(self, side,Product,OrderTime,OrderPrice,CoverTime,CoverPrice,Qty):
+        if Product not in self.ProductCode:
+            self.ProductCode[Product]=len(self.Products)
+            self.Products.append(Product)
+        # 每口交易成本(點數)
+        Cost=self.Spec.Cost(OrderPrice,CoverPrice,side) if self.Spec is not None else 0
+        self.TradeRecord.Append(side,self.ProductCode[Product],OrderTime,OrderPrice,CoverTime,CoverPrice,Qty,Cost)
+        Profit=(CoverPrice-OrderPrice)*side-Cost
+        Profit_rate=Profit/OrderPrice
+        self.Performance.Extend(profit=np.full(Qty,Profit),profit_rate=np.full(Qty,Profit_rate))
+        self._UpdateStatistics(Profit,Profit_rate,Qty)
+    # 以 Qty 口相同盈虧更新累計統計，O(1)
+    def _UpdateStatistics(self, Profit,Profit_rate,Qty):
+        Steps=np.arange(1,Qty+1)
+        self.Cumulative.Extend(profit=self.TotalProfit+Profit*Steps,profit_rate=self.TotalProfit_rate+Profit_rate*Steps)
+        self.TotalNumber+=Qty
+        self.TotalProfit+=Profit*Qty
+        self.TotalProfit_rate+=Profit_rate*Qty
+        if Profit>0:
+            self.WinNumber+=Qty
+            self.WinProfit+=Profit*Qty
+        elif Profit<0:
+            self.LossNumber+=Qty
+            self.LossProfit+=Profit*Qty
+        # 連續虧損
+        if Profit<=0:
+            self.AccLoss+=Profit*Qty
+            self.MaxAccLoss=min(self.MaxAccLoss,self.AccLoss)
+        else:
+            self.AccLoss=0
+        # 盈虧同向變動，回落只可能在虧損時擴大、高點只可能在獲利時創新
+        self.MaxCapital=max(self.MaxCapital,self.TotalProfit)
+        self.MDD=max(self.MDD,self.MaxCapital-self.TotalProfit)
+        self.MaxCapital_rate=max(self.MaxCapital_rate,self.TotalProfit_rate)
+        self.MDD_rate=max(self.MDD_rate,self.MaxCapital_rate-self.TotalProfit_rate)
+    # 一次新增多筆已平倉交易(各參數為等長陣列，Product 為單一商品)，供向量化回測使用
+    def AddTrades(self, side,Product,OrderTime,OrderPrice,CoverTime,CoverPrice,Qty):
+        side=np.asarray(side,dtype=np.int8)
+        OrderPrice=np.asarray(OrderPrice,dtype=np.float64)
+        CoverPrice=np.asarray(CoverPrice,dtype=np.float64)
+        Qty=np.broadcast_to(np.asarray(Qty,dtype=np.int64),side.shape)
+        if len(side)==0:
+            return
+        if Product not in self.ProductCode:
+            self.ProductCode[Product]=len(self.Products)
+            self.Products.append(Product)
+        Cost=self.Spec.Cost(OrderPrice,CoverPrice,side) if self.Spec is not None else np.zeros(len(side))
+        self.TradeRecord.Extend(side=side,product=np.full(len(side),self.ProductCode[Product]),
+                                order_time=OrderTime,order_price=OrderPrice,
+                                cover_time=CoverTime,cover_price=CoverPrice,qty=Qty,cost=Cost)
+        Profit=np.repeat((CoverPrice-OrderPrice)*side-Cost,Qty)
+        Profit_rate=Profit/np.repeat(OrderPrice,Qty)
+        self.Performance.Extend(profit=Profit,profit_rate=Profit_rate)
+        self._UpdateStatisticsBatch(Profit,Profit_rate)
+    # 以每口盈虧陣列更新累計統計(接續目前的累計值)
+    def _UpdateStatisticsBatch(self, Profit,Profit_rate):
+        Capital=self.TotalProfit+np.cumsum(Profit)
+        Capital_rate=self.TotalProfit_rate+np.cumsum(Profit_rate)
+        self.Cumulative.Extend(profit=Capital,profit_rate=Capital_rate)
+        self.TotalNumber+=len(Profit)
+        self.TotalProfit=Capital[-1]
+        self.TotalProfit_rate=Capital_rate[-1]
+        Win=Profit>0
+        Loss=Profit<0
+        self.WinNumber+=int(Win.sum())
+        self.WinProfit+=Profit[Win].sum()
+        self.LossNumber+=int(Loss.sum())
+        self.LossProfit+=Profit[Loss].sum()
+        # 連續虧損：最近一次獲利之後的累計虧損，批次開頭接續目前的連續虧損
+        Lose=Profit<=0
+        AccLoss=np.cumsum(np.where(Lose,Profit,0))
+        LastWin=np.maximum.accumulate(np.where(Lose,-1,np.arange(len(Profit))))
+        AccLoss=np.where(LastWin>=0,AccLoss-AccLoss[np.maximum(LastWin,0)],self.AccLoss+AccLoss)
+        self.AccLoss=AccLoss[-1]
+        self.MaxAccLoss=min(self.MaxAccLoss,AccLoss.min())
+        # 回落
+        Peak=np.maximum(self.MaxCapital,np.maximum.accumulate(Capital))
+        self.MaxCapital=Peak[-1]
+        self.MDD=max(self.MDD,(Peak-Capital).max())
+        Peak_rate=np.maximum(self.MaxCapital_rate,np.maximum.accumulate(Capital_rate))
+        self.MaxCapital_rate=Peak_rate[-1]
+        self.MDD_rate=max(self.MDD_rate,(Peak_rate-Capital_rate).max())
     # 取得當前未平倉量
     def GetOpenInterest(self):               
         # 取得未平倉量
         return self.OpenInterestQty
-    # 取得交易紀錄
+    # 取得交易紀錄清單(每口一筆 [買賣別, 商品, 進場時間, 進場價格, 出場時間, 出場價格]，多單買賣別為 'B'、空單為 'S')
     def GetTradeRecord(self):               
-        # 取得未平倉量
-        return self.TradeRecord   
+        Columns=self.GetTradeColumns()
+        Qty=Columns['qty']
+        Rows=zip(np.where(Columns['side']==1,'B','S').tolist(),Columns['product'].tolist(),
+                 Columns['order_time'].astype('datetime64[us]').tolist(),Columns['order_price'].tolist(),
+                 Columns['cover_time'].astype('datetime64[us]').tolist(),Columns['cover_price'].tolist())
+        return [list(Row) for Row,Lots in zip(Rows,Qty.tolist()) for _ in range(Lots)]
+    # 取得交易紀錄欄位(各欄位為 typed 陣列，每筆平倉一列並附口數與交易成本，product 已轉回商品名稱)
+    def GetTradeColumns(self):               
+        Columns={name:self.TradeRecord.Get(name) for name in self.TradeRecord.Names}
+        Columns['product']=np.array(self.Products,dtype=object)[Columns['product']] if self.Products else np.array([],dtype=object)
+        return Columns
     # 取得交易盈虧清單
     def GetProfit(self):       
         return self.Profit 
@@ -129,113 +257,79 @@ class Record():
     
     # 取得交易總盈虧
     def GetTotalProfit(self):
-        if len(self.Profit)>0:
-            return sum(self.Profit)
-        else:
-            return 0
+        return self.TotalProfit
+    # 取得累計投資報酬率(每口報酬率的總和，已扣除交易成本)
+    def GetTotalProfitRate(self):
+        return self.TotalProfit_rate
     # 取得交易次數
     def GetTotalNumber(self): 
-        if len(self.Profit)>0:
-            return len(self.Profit)
-        else: 
-            return 0
+        return self.TotalNumber
     # 取得平均交易盈虧(每次)
     def GetAverageProfit(self): 
-        if len(self.Profit)>0:
-            return sum(self.Profit)/len(self.Profit)
+        if self.TotalNumber>0:
+            return self.TotalProfit/self.TotalNumber
         else:
             return 0
     # 取得交易 "平均" 投資報酬率
     def GetAverageProfitRate(self): 
-        if len(self.Profit_rate)>0:
-            return sum(self.Profit_rate)/len(self.Profit_rate)
+        if self.TotalNumber>0:
+            return self.TotalProfit_rate/self.TotalNumber
         else:
             return 0
     # 取得勝率
     def GetWinRate(self):
-        WinProfit = [ i for i in self.Profit if i > 0 ]
-        if len(self.Profit)>0:
-            return len(WinProfit)/len(self.Profit)
+        if self.TotalNumber>0:
+            return self.WinNumber/self.TotalNumber
         else:
             return 0
     # 最大連續虧損
     def GetAccLoss(self):
-        if len(self.Profit)>0:
-            AccLoss = 0
-            MaxAccLoss = 0
-            for p in self.Profit:
-                if p <= 0:
-                    AccLoss+=p
-                    if AccLoss < MaxAccLoss:
-                        MaxAccLoss=AccLoss
-                else:
-                    AccLoss=0
-            return MaxAccLoss
-        else:
-            return 0
+        return self.MaxAccLoss
     # 最大累計盈虧回落(MDD)
     def GetMDD(self):
-        if len(self.Profit)>0:
-            MDD,Capital,MaxCapital = 0,0,0
-            for p in self.Profit:
-                Capital += p  ## Capital = Capital+p
-                MaxCapital = max(MaxCapital,Capital)
-                DD = MaxCapital - Capital
-                MDD = max(MDD,DD)
-            return MDD
-        else:
-            return 0
+        return self.MDD
     # 最大累計投資報酬率回落(MDD_rate)
     def GetMDD_rate(self):
-        if len(self.Profit_rate)>0:
-            MDD_rate,Capital_rate,MaxCapital_rate = 0,0,0
-            for p in self.Profit_rate:
-                Capital_rate += p
-                MaxCapital_rate = max(MaxCapital_rate,Capital_rate)
-                DD_rate = MaxCapital_rate - Capital_rate
-                MDD_rate = max(MDD_rate,DD_rate)
-            return MDD_rate
-        else:
-            return 0
+        return self.MDD_rate
     # 平均獲利(只看獲利的) 
     def GetAverEarn(self):
-        if len(self.Profit)>0:
-            WinProfit = [ i for i in self.Profit if i > 0 ]
-            if len(WinProfit)>0:
-                return sum(WinProfit)/len(WinProfit)
-            else:
-                return 0
+        if self.WinNumber>0:
+            return self.WinProfit/self.WinNumber
         else:
             return 0
         
     # 平均虧損(只看虧損的)
     def GetAverLoss(self):
-        if len(self.Profit)>0:
-            FailProfit = [ i for i in self.Profit if i < 0 ]
-            if len(FailProfit)>0:
-                return sum(FailProfit)/len(FailProfit)
-            else:
-                return 0
+        if self.LossNumber>0:
+            return self.LossProfit/self.LossNumber
         else:
             return 0
     # 累計盈虧
     def GetCumulativeProfit(self):
-        if len(self.Profit)>0:
-            TotalProfit=[0]
-            for i in self.Profit:
-                TotalProfit.append(TotalProfit[-1]+i)
-            return TotalProfit
+        if self.TotalNumber>0:
+            return self.Cumulative.Get('profit')
         else:
             return 0
     # 累計投資報酬率
     def GetCumulativeProfit_rate(self):
-        if len(self.Profit_rate)>0:
-            TotalProfit_rate=[0]
-            for i in self.Profit_rate:
-                TotalProfit_rate.append(TotalProfit_rate[-1]+i)
-            return TotalProfit_rate
+        if self.TotalNumber>0:
+            return self.Cumulative.Get('profit_rate')
         else:
             return 0
+    # 取得所有績效統計
+    def GetStatistics(self):
+        return {
+            'TotalProfit':self.GetTotalProfit(),
+            'TotalNumber':self.GetTotalNumber(),
+            'AverageProfit':self.GetAverageProfit(),
+            'AverageProfitRate':self.GetAverageProfitRate(),
+            'WinRate':self.GetWinRate(),
+            'AccLoss':self.GetAccLoss(),
+            'MDD':self.GetMDD(),
+            'MDD_rate':self.GetMDD_rate(),
+            'AverEarn':self.GetAverEarn(),
+            'AverLoss':self.GetAverLoss(),
+        }
     ## 產出交易績效圖(累計盈虧)
     def GeneratorProfitChart(self, choice='stock', StrategyName='Strategy'):
         #### 設置 matplotlib 支持中文的字體: 這裡使用的是 'SimHei' 字體，您也可以替換為任何支持中文的字體
@@ -250,21 +344,22 @@ class Record():
         plt.figure()
         
         #### 計算累計績效
-        TotalProfit=[0]
-        if len(self.Profit)>0:
-            for i in self.Profit:
-                TotalProfit.append(TotalProfit[-1]+i)
+        TotalProfit=self.Cumulative.Get('profit')
         
         #### 繪製圖形
         # ax.plot( TotalProfit[1:]  , '-', marker='o', linewidth=1 )
         if choice == 'stock':
-            TotalProfit_re = [i*1000 for i in TotalProfit]
+            TotalProfit_re = TotalProfit*1000
             plt.plot( TotalProfit_re[1:] , '-', marker='o', linewidth=1 )
         if choice == 'future1':
-            TotalProfit_re = [i*200 for i in TotalProfit]
+            TotalProfit_re = TotalProfit*200
             plt.plot( TotalProfit_re[1:] , '-', marker='o', linewidth=1 )
         if choice == 'future2':
-            TotalProfit_re = [i*50 for i in TotalProfit]
+            TotalProfit_re = TotalProfit*50
+            plt.plot( TotalProfit_re[1:] , '-', marker='o', linewidth=1 )
+        # 依建構時給定的合約規格乘數換算成金額
+        if choice == 'contract':
+            TotalProfit_re = TotalProfit*(self.Spec.Multiplier if self.Spec is not None else 1)
             plt.plot( TotalProfit_re[1:] , '-', marker='o', linewidth=1 )
             
         
@@ -307,11 +402,7 @@ class Record():
         plt.figure()
         
         #### 計算累計投資報酬率
-        TotalProfit_rate=[0]
-        if len(self.Profit_rate)>0:
-            for i in self.Profit_rate:
-                TotalProfit_rate.append(TotalProfit_rate[-1]+i)
-                
+        TotalProfit_rate=self.Cumulative.Get('profit_rate')
         
         #### 繪製圖形
         # ax.plot( TotalProfit_rate[1:]  , '-', marker='o', linewidth=1 )
@@ -350,6 +441,36 @@ class Record():
 
     
 
+# 以 NumPy 一次算出所有績效統計(每口盈虧陣列)，用來驗證 Record 的即時累計值
+def BatchStatistics(Profit,Profit_rate):
+    Profit=np.asarray(Profit,dtype=np.float64)
+    Profit_rate=np.asarray(Profit_rate,dtype=np.float64)
+    n=len(Profit)
+    if n==0:
+        return {key:0 for key in ['TotalProfit','TotalNumber','AverageProfit','AverageProfitRate','WinRate',
+                                   'AccLoss','MDD','MDD_rate','AverEarn','AverLoss']}
+    Capital=np.cumsum(Profit)
+    Capital_rate=np.cumsum(Profit_rate)
+    Win=Profit>0
+    Loss=Profit<0
+    # 連續虧損：累計虧損減去最近一次獲利時的累計值
+    Lose=Profit<=0
+    AccLoss=np.cumsum(np.where(Lose,Profit,0))
+    LastWin=np.maximum.accumulate(np.where(Lose,-1,np.arange(n)))
+    AccLoss=AccLoss-np.where(LastWin>=0,AccLoss[np.maximum(LastWin,0)],0)
+    return {
+        'TotalProfit':Capital[-1],
+        'TotalNumber':n,
+        'AverageProfit':Capital[-1]/n,
+        'AverageProfitRate':Capital_rate[-1]/n,
+        'WinRate':Win.sum()/n,
+        'AccLoss':min(AccLoss.min(),0),
+        'MDD':(np.maximum.accumulate(np.maximum(Capital,0))-Capital).max(),
+        'MDD_rate':(np.maximum.accumulate(np.maximum(Capital_rate,0))-Capital_rate).max(),
+        'AverEarn':Profit[Win].mean() if Win.any() else 0,
+        'AverLoss':Profit[Loss].mean() if Loss.any() else 0,
+    }
+
 # # 市價委託單(預設非當沖、倉別自動)
 # def OrderMKT(Broker,Product,BS,Qty,DayTrade='0',OrderType='A'):
 #     # 送出交易委託
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+多商品面板：把數個商品的K棒對齊到共同的時間格，成為 (時間, 商品) 的 2-D 陣列，再以向量化方式回測加權組合
+對齊：時間格為各商品時間的聯集(how='outer')或交集(how='inner')，present 標記該商品在該時間是否有K棒；
+    沒有K棒時價格沿用前一根(fill='ffill'，當根報酬為 0)或為 NaN(fill=None)，成交量為 0，商品第一根之前一律為 NaN
+訊號：各商品在自己的K棒上計算(缺漏的時間不補假K棒，不影響均線與 RSI)，再放上時間格並沿用前一個值
+組合：第 t 根的報酬 = Σ 權重 × 第 t-1 根的部位 × 該商品第 t 根的報酬(與 strategies.strategy_returns 相同)
+滾動相關係數以累積和一次算出每個時間點的相關係數矩陣，沒有逐窗的迴圈
+執行：python panel.py [週期] [ma|rsi]
+"""
+
+import os
+import numpy as np
+import pandas as pd
+import bar_pyramid
+import bar_store
+import batch_backtest
+import catalog
+import indicator_engine
+import strategies
+from bar_schema import as_float64
+
+# 預設的滾動相關係數視窗(K棒數)
+CORR_WINDOW = 240
+
+# 由檔名取得商品代碼
+def _product(path):
+    info = catalog.parse_name(os.path.basename(path))
+    return info['product'] if info else os.path.basename(path).replace('.pkl', '')
+
+# 讀取一個檔案某週期的完整K棒
+def _load(path, timeframe):
+    bars = bar_store.read_range(*bar_store.open_dataset(path))
+    return bars if timeframe == '1m' else bar_pyramid.build_pyramid(bars)[timeframe]
+
+# 對齊多個商品：paths 為 .pkl 路徑清單；loader(path) 回傳該週期的完整K棒(預設由欄位式儲存讀取)
+# 回傳 {'time': (T,) 時間格, 'products': 商品代碼, 'present': (T, P) 是否有K棒, 'index': (T, P) 該商品在該時間
+#       最近一根K棒的列號(-1 為第一根之前), 'open','high','low','close': (T, P) float64, 'volume': (T, P) int64,
+#       'bars': 各商品自己的完整K棒}
+def load_panel(paths, timeframe='1m', how='outer', fill='ffill', loader=None):
+    paths = list(paths)
+    if not paths:
+        raise ValueError('沒有選擇商品')
+    loader = loader or (lambda path: _load(path, timeframe))
+    bars = [loader(path) for path in paths]
+    times = [np.asarray(b['time']).view(np.int64) for b in bars]
+    if how == 'outer':
+        grid = np.unique(np.concatenate(times))
+    elif how == 'inner':
+        grid = times[0]
+        for t in times[1:]:
+            grid = np.intersect1d(grid, t, assume_unique=True)
+    else:
+        raise ValueError('未知的對齊方式：%s' % how)
+    n, p = len(grid), len(paths)
+    index = np.empty((n, p), dtype=np.int64)
+    for j, t in enumerate(times):
+        index[:, j] = np.searchsorted(t, grid, 'right') - 1
+    before = index < 0
+    row = np.maximum(index, 0)
+    present = ~before & (np.stack([t[row[:, j]] if len(t) else np.full(n, -1) for j, t in enumerate(times)],
+                                  axis=1) == grid[:, None])
+    missing = before if fill == 'ffill' else ~present
+    panel = {'time': grid.view('datetime64[ns]'), 'products': [_product(path) for path in paths],
+             'present': present, 'index': index, 'bars': bars}
+    for field in ['open', 'high', 'low', 'close']:
+        values = np.stack([as_float64(b[field])[row[:, j]] if len(b[field]) else np.full(n, np.nan)
+                           for j, b in enumerate(bars)], axis=1)
+        values[missing] = np.nan
+        panel[field] = values
+    volume = np.stack([np.asarray(b['volume'], dtype=np.int64)[row[:, j]] if len(b['volume']) else np.zeros(n, np.int64)
+                       for j, b in enumerate(bars)], axis=1)
+    volume[~present] = 0
+    panel['volume'] = volume
+    return panel
+
+# 各商品的報酬 (T, P)：收盤價相對前一根的變化，沒有前一根或價格為 NaN 時為 0
+def bar_returns(panel):
+    close = panel['close']
+    ret = np.zeros_like(close)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ret[1:] = close[1:] / close[:-1] - 1
+    return np.nan_to_num(ret, nan=0.0, posinf=0.0, neginf=0.0)
+
+# 各商品在自己的K棒上計算策略訊號，再放上時間格 (T, P)，第一根之前為 0
+# strategy：'ma' 或 'rsi'；params 同 batch_backtest.DEFAULT_PARAMS；rules 為出場規則(停損、停利、最長持有)
+def signals(panel, strategy='ma', params=None, **rules):
+    params = {**batch_backtest.DEFAULT_PARAMS, **(params or {})}
+    signal = np.zeros(panel['close'].shape, dtype=np.int8)
+    for j, bars in enumerate(panel['bars']):
+        close = as_float64(bars['close'])
+        if strategy == 'ma':
+            own = strategies.ma_cross_signal(indicator_engine.ma(close, params['short_window'])['MA'],
+                                             indicator_engine.ma(close, params['long_window'])['MA'],
+                                             price=close, **rules)
+        elif strategy == 'rsi':
+            own = strategies.rsi_signal(indicator_engine.rsi(close, params['rsi_period'])['RSI'],
+                                        params['rsi_buy'], params['rsi_sell'], price=close, **rules)
+        else:
+            raise ValueError('未知的策略：%s' % strategy)
+        index = panel['index'][:, j]
+        signal[:, j] = np.where(index >= 0, np.asarray(own, dtype=np.int8)[np.maximum(index, 0)], 0)
+    return signal
+
+# 滾動相關係數：returns 為 (T, P)，回傳 (T, P, P)，前 window-1 根與視窗內變異數為 0 時為 NaN
+def rolling_correlation(returns, window=CORR_WINDOW):
+    x = np.asarray(returns, dtype=np.float64)
+    n, p = x.shape
+    corr = np.full((n, p, p), np.nan)
+    if n < window:
+        return corr
+    # 視窗內的和與交叉乘積和(累積和相減)
+    s = np.cumsum(np.vstack([np.zeros((1, p)), x]), axis=0)
+    s = s[window:] - s[:-window]
+    sxy = np.cumsum(np.concatenate([np.zeros((1, p, p)), x[:, :, None] * x[:, None, :]]), axis=0)
+    sxy = sxy[window:] - sxy[:-window]
+    cov = sxy - s[:, :, None] * s[:, None, :] / window
+    var = np.diagonal(cov, axis1=1, axis2=2)
+    # 累積和相減的誤差與整段平方和同數量級，低於此值的變異數視為 0
+    valid = var > 1e-12 * np.sum(x * x, axis=0)
+    scale = np.sqrt(np.where(valid, var, np.nan))
+    corr[window - 1:] = cov / (scale[:, :, None] * scale[:, None, :])
+    return np.clip(corr, -1, 1)
+
+# 相對前高的回落比例(0 或負值)
+def _drawdown(equity):
+    return equity / np.maximum.accumulate(equity, axis=0) - 1
+
+# 加權組合回測：signal 為 (T, P) 部位(1、0、-1)，weights 為 {商品: 權重} 或長度 P 的陣列(資金比例，預設平均分配)
+# 回傳 {'time', 'products', 'weights', 'returns': 各商品策略報酬 (T, P), 'portfolio': 組合報酬,
+#       'equity','drawdown': 組合的累積報酬與回落, 'product_equity': 各商品的累積報酬 (T, P),
+#       'market_equity': 同權重買進持有的累積報酬(每個商品 1/P，與 weights 無關), 'correlation': 各商品報酬的滾動相關係數 (T, P, P), 'summary': 比較表}
+def portfolio_backtest(panel, signal, weights=None, window=CORR_WINDOW):
+    products = panel['products']
+    if weights is None:
+        weights = np.full(len(products), 1.0 / len(products))
+    elif isinstance(weights, dict):
+        weights = np.array([weights.get(product, 0.0) for product in products], dtype=np.float64)
+    weights = np.asarray(weights, dtype=np.float64)
+    market = bar_returns(panel)
+    returns = np.zeros_like(market)
+    returns[1:] = np.asarray(signal[:-1], dtype=np.float64) * market[1:]
+    portfolio = returns @ weights
+    equity = np.cumprod(1 + portfolio)
+    product_equity = np.cumprod(1 + returns, axis=0)
+    market_equity = np.cumprod(1 + market @ np.full(len(products), 1.0 / len(products)))
+    rows = [{'商品': product, '權重': w, '最終報酬': product_equity[-1, j] - 1,
+             '最大回落': -_drawdown(product_equity[:, j]).min(), '有K棒比例': panel['present'][:, j].mean()}
+            for j, (product, w) in enumerate(zip(products, weights))]
+    rows.append({'商品': '組合', '權重': weights.sum(), '最終報酬': equity[-1] - 1,
+                 '最大回落': -_drawdown(equity).min(), '有K棒比例': panel['present'].all(axis=1).mean()})
+    return {
+        'time': panel['time'],
+        'products': products,
+        'weights': weights,
+        'returns': returns,
+        'portfolio': portfolio,
+        'equity': equity,
+        'drawdown': _drawdown(equity),
+        'product_equity': product_equity,
+        'market_equity': market_equity,
+        'correlation': rolling_correlation(market, window),
+        'summary': pd.DataFrame(rows),
+    }
+
+if __name__ == '__main__':
+    import glob
+    import sys
+    import time
+    timeframe = sys.argv[1] if len(sys.argv) > 1 else '1m'
+    strategy = sys.argv[2] if len(sys.argv) > 2 else 'ma'
+    t0 = time.perf_counter()
+    panel = load_panel(sorted(glob.glob('./*.pkl')), timeframe)
+    t1 = time.perf_counter()
+    result = portfolio_backtest(panel, signals(panel, strategy))
+    t2 = time.perf_counter()
+    print(result['summary'].to_string())
+    print('最後一個視窗的相關係數：')
+    print(pd.DataFrame(result['correlation'][-1], index=panel['products'], columns=panel['products']).round(3).to_string())
+    print(f"{len(panel['time'])} 根 × {len(panel['products'])} 個商品：對齊 {t1 - t0:.3f} 秒，回測 {t2 - t1:.3f} 秒")
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+門檻型策略的持倉引擎(向量化狀態機)：由進出場條件陣列產生每根K棒收盤後的持倉(1 多單、-1 空單、0 空手)
+只在狀態改變的K棒標記目標持倉，其他K棒為 NaN，再向前填補(ffill)，條件之間的區間自然維持原本的持倉
+進場條件以「由不成立變成立」的那一根觸發；同一根同時符合進出場時出場優先，同時符合多空進場時都不進場
+停損、停利、最長持有在部位延續的K棒以收盤價判斷(同一根有出場或反向訊號時以訊號為準)，
+觸發的K棒強制平倉，之後要等進場條件重新觸發才會再進場
+強制平倉會改變之後的部位，因此反覆「算持倉 → 找每段部位第一個觸發點」直到沒有新的觸發點(不動點)，每次迭代都是整批陣列運算
+"""
+
+import numpy as np
+
+# 條件陣列(NaN 比較結果為 False)；None 視為全部不成立
+def _condition(cond, n):
+    if cond is None:
+        return np.zeros(n, dtype=bool)
+    return np.asarray(cond, dtype=bool)
+
+# 由不成立變成立的K棒
+def _edge(cond):
+    return cond & ~np.r_[False, cond[:-1]]
+
+# 標記後向前填補：mark 為 NaN 的K棒沿用前一根的值，開頭為 0
+def ffill(mark):
+    filled = np.where(np.isnan(mark), -1, np.arange(len(mark)))
+    filled = np.maximum.accumulate(filled)
+    return np.where(filled >= 0, mark[np.maximum(filled, 0)], 0.0)
+
+# 單邊狀態(1 持有、0 空手)：entry 標記 1，exit 標記 0(出場優先)
+def _side(entry, exit):
+    mark = np.full(len(entry), np.nan)
+    mark[entry] = 1
+    mark[exit] = 0
+    return ffill(mark)
+
+# 每段部位的第一個強制平倉點：停損/停利為相對進場價的報酬比例，max_hold 為持有K棒數
+def _first_trigger(position, price, stop_loss, take_profit, max_hold):
+    n = len(position)
+    idx = np.arange(n)
+    start = (position != 0) & (position != np.r_[0, position[:-1]])
+    entry = np.maximum.accumulate(np.where(start, idx, 0))
+    held = position != 0
+    trigger = np.zeros(n, dtype=bool)
+    if price is not None and (stop_loss is not None or take_profit is not None):
+        ret = position * (price / price[entry] - 1)
+        if stop_loss is not None:
+            trigger |= ret <= -stop_loss
+        if take_profit is not None:
+            trigger |= ret >= take_profit
+    if max_hold is not None:
+        trigger |= idx - entry >= max_hold
+    trigger &= held & (idx > entry)
+    # 同一段部位中第一個觸發點：觸發累計數在該段開始後第一次增加
+    count = np.cumsum(trigger)
+    before = np.where(entry > 0, count[np.maximum(entry - 1, 0)], 0)
+    return trigger & (count - before == 1)
+
+# 由進出場條件產生持倉
+# long_entry/long_exit：多單進出場條件；short_entry/short_exit：空單進出場條件(反向進場會先平掉原本的部位)
+# price：停損停利用的價格(收盤價)；stop_loss/take_profit：報酬比例(0.02 為 2%)；max_hold：最長持有K棒數
+# 回傳 int8 持倉陣列
+def positions(long_entry=None, long_exit=None, short_entry=None, short_exit=None,
+              price=None, stop_loss=None, take_profit=None, max_hold=None):
+    conds = [c for c in (long_entry, long_exit, short_entry, short_exit) if c is not None]
+    n = len(conds[0]) if conds else 0
+    long_entry, long_exit, short_entry, short_exit = (_condition(c, n) for c in
+                                                      (long_entry, long_exit, short_entry, short_exit))
+    long_edge, short_edge = _edge(long_entry), _edge(short_entry)
+    both = long_edge & short_edge
+    long_edge, short_edge = long_edge & ~both, short_edge & ~both
+    if price is not None:
+        price = np.asarray(price, dtype=np.float64)
+    stops = stop_loss is not None or take_profit is not None or max_hold is not None
+    forced = np.zeros(n, dtype=bool)
+    while True:
+        position = (_side(long_edge, long_exit | short_edge | forced)
+                    - _side(short_edge, short_exit | long_edge | forced)).astype(np.int8)
+        if not stops:
+            return position
+        first = _first_trigger(position, price, stop_loss, take_profit, max_hold) & ~forced
+        if not first.any():
+            return position
+        forced |= first
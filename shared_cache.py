@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+整個行程共用的唯讀資料快取(取代每個 session、每次重跑各自複製一份的 st.cache_data)
+每份資料只存一次，取用時拿到的是不可寫的 view；依總位元組數做 LRU 淘汰，原始檔 mtime 改變時自動重新載入
+另可傳入資料版本(例如欄位式儲存新增K棒後的 manifest 版本)：只有版本改變時重新載入該筆，不通知清除(衍生的指標快取可增量延伸)
+shared=True 時 {欄位: 陣列} 形式的資料放進 multiprocessing.shared_memory，同一台機器上的其他行程以名稱直接附加
+(環境變數 DASHBOARD_SHARED_MEMORY=1 讓 default_cache() 使用共享記憶體)
+"""
+
+import atexit
+import collections
+import hashlib
+import json
+import os
+import threading
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+
+# 預設快取上限(位元組)
+MAX_BYTES = 512 * 1024**2
+# 共享記憶體區塊的開頭保留給描述欄位的 JSON
+HEADER_BYTES = 4096
+SHM_PREFIX = 'fhw_'
+
+# ──────────────────────────────────────────────────────────────────────────────
+# 把 {欄位: 陣列} 放進一個共享記憶體區塊，回傳 (區塊, 唯讀陣列字典, 是否為本行程建立)
+# 同名區塊已存在(其他行程已建立)時直接附加
+def publish(name, arrays):
+    arrays = {field: np.ascontiguousarray(values) for field, values in arrays.items()}
+    layout, offset = {}, HEADER_BYTES
+    for field, values in arrays.items():
+        layout[field] = {'dtype': values.dtype.str, 'shape': values.shape, 'offset': offset}
+        offset += -(-values.nbytes // 64) * 64
+    try:
+        shm = shared_memory.SharedMemory(name=name, create=True, size=max(offset, HEADER_BYTES + 1))
+    except FileExistsError:
+        return attach(name) + (False,)
+    for field, values in arrays.items():
+        spec = layout[field]
+        np.ndarray(values.shape, values.dtype, buffer=shm.buf, offset=spec['offset'])[...] = values
+    header = json.dumps(layout).encode()
+    shm.buf[len(header):HEADER_BYTES] = bytes(HEADER_BYTES - len(header))
+    # 表頭最後寫入，其他行程讀到完整表頭時資料已就緒
+    shm.buf[:len(header)] = header
+    return shm, _views(shm, layout), True
+
+# 附加其他行程建立的共享記憶體區塊，回傳 (區塊, 唯讀陣列字典)
+def attach(name):
+    # 只是附加的行程不向 resource_tracker 登記，結束時不會刪除別人建立的區塊
+    try:
+        shm = shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python 3.13 以前沒有 track 參數，附加期間暫時略過登記
+        register = resource_tracker.register
+        resource_tracker.register = lambda *args: None
+        try:
+            shm = shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+    layout = json.loads(bytes(shm.buf[:HEADER_BYTES]).rstrip(b'\0'))
+    return shm, _views(shm, layout)
+
+def _views(shm, layout):
+    arrays = {}
+    for field, spec in layout.items():
+        values = np.ndarray(tuple(spec['shape']), np.dtype(spec['dtype']), buffer=shm.buf, offset=spec['offset'])
+        values.flags.writeable = False
+        arrays[field] = values
+    return arrays
+
+# 估計快取值佔用的位元組數(陣列、陣列的字典/列表，或屬性中含陣列的物件)
+def _nbytes(value):
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sum(_nbytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(_nbytes(v) for v in value)
+    if hasattr(value, '__dict__'):
+        return sum(_nbytes(v) for v in vars(value).values())
+    return 0
+
+# 把快取值中的陣列設為唯讀(字典中的陣列換成唯讀 view，不複製資料)
+def _freeze(value):
+    if isinstance(value, np.ndarray):
+        view = value.view()
+        view.flags.writeable = False
+        return view
+    if isinstance(value, dict):
+        return {k: _freeze(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_freeze(v) for v in value]
+    return value
+
+_Entry = collections.namedtuple('_Entry', ['path', 'mtime', 'version', 'value', 'nbytes', 'shm', 'owner'])
+
+class SharedCache():
+    # max_bytes: 總容量上限；shared: 陣列字典是否放進共享記憶體
+    def __init__(self, max_bytes=MAX_BYTES, shared=False):
+        self.MaxBytes = max_bytes
+        self.Shared = shared
+        self.Entries = collections.OrderedDict()
+        self.Bytes = 0
+        self.Hits = 0
+        self.Misses = 0
+        self.Evictions = 0
+        self.Lock = threading.Lock()
+        # 每個鍵一把載入鎖，同時要求同一份資料的 session 只載入一次
+        self._Loading = collections.defaultdict(threading.Lock)
+        # 原始檔更新時通知(例如清除技術指標快取)
+        self._Listeners = []
+        # 已淘汰但仍有 view 在使用中的共享記憶體區塊
+        self._Retired = []
+
+    # 註冊原始檔更新時的通知函數 callback(path)
+    def OnInvalidate(self, callback):
+        if callback not in self._Listeners:
+            self._Listeners.append(callback)
+
+    # 取得 key 對應的資料，path 的 mtime 或 version 與快取時不同、或尚未快取時呼叫 loader() 載入
+    # mtime 改變時清除該原始檔的所有資料並通知；只有 version 改變時只重新載入這一筆
+    def Get(self, key, path, loader, version=None):
+        mtime = os.path.getmtime(path)
+        with self.Lock:
+            entry = self.Entries.get(key)
+            if entry is not None and entry.mtime == mtime and entry.version == version:
+                self.Hits += 1
+                self.Entries.move_to_end(key)
+                return entry.value
+        with self._Loading[key]:
+            with self.Lock:
+                entry = self.Entries.get(key)
+                if entry is not None and entry.mtime == mtime and entry.version == version:
+                    self.Hits += 1
+                    return entry.value
+                if entry is not None and entry.mtime == mtime:
+                    self._Drop(self.Entries.pop(key))
+                    entry = None
+            if entry is not None:
+                self.Invalidate(path)
+            self.Misses += 1
+            value, shm, owner = self._Store(key, (mtime, version), loader())
+            with self.Lock:
+                self.Entries[key] = _Entry(path, mtime, version, value, _nbytes(value), shm, owner)
+                self.Bytes += self.Entries[key].nbytes
+                self._Evict()
+            return value
+
+    def _Store(self, key, stamp, value):
+        if self.Shared and isinstance(value, dict) and value and \
+                all(isinstance(v, np.ndarray) for v in value.values()):
+            digest = hashlib.sha1(repr((key, stamp)).encode()).hexdigest()[:20]
+            shm, arrays, owner = publish(SHM_PREFIX + digest, value)
+            return arrays, shm, owner
+        return _freeze(value), None, False
+
+    # 依 LRU 淘汰到總容量以下(至少保留最新的一筆)
+    def _Evict(self):
+        while self.Bytes > self.MaxBytes and len(self.Entries) > 1:
+            _, entry = self.Entries.popitem(last=False)
+            self._Drop(entry)
+            self.Evictions += 1
+
+    def _Drop(self, entry):
+        self.Bytes -= entry.nbytes
+        if entry.shm is not None:
+            # 建立者移除名稱(已附加的行程仍可繼續使用)，之後再要求時會重新建立
+            if entry.owner:
+                entry.shm.unlink()
+            self._Retired.append(entry.shm)
+        # 已沒有 view 的共享記憶體區塊才能關閉
+        for shm in list(self._Retired):
+            try:
+                shm.close()
+            except BufferError:
+                continue
+            self._Retired.remove(shm)
+
+    # 清除某個原始檔的所有資料(path=None 清除全部)並通知
+    def Invalidate(self, path=None):
+        with self.Lock:
+            for key in [k for k, e in self.Entries.items() if path is None or e.path == path]:
+                self._Drop(self.Entries.pop(key))
+        for callback in self._Listeners:
+            callback(path)
+
+    # 清空並移除本行程建立的共享記憶體區塊(行程結束時呼叫)
+    def Close(self):
+        with self.Lock:
+            while self.Entries:
+                self._Drop(self.Entries.popitem()[1])
+
+    def Stats(self):
+        return {
+            'entries': len(self.Entries),
+            'bytes': self.Bytes,
+            'max_bytes': self.MaxBytes,
+            'hits': self.Hits,
+            'misses': self.Misses,
+            'evictions': self.Evictions,
+        }
+
+_default = None
+_default_lock = threading.Lock()
+
+# 行程內唯一的共用快取
+def default_cache():
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = SharedCache(shared=os.environ.get('DASHBOARD_SHARED_MEMORY') == '1')
+            atexit.register(_default.Close)
+        return _default
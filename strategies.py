@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""
+策略訊號與績效(不依賴 Streamlit，看板與批次回測共用)
+訊號為每根K棒收盤後的持倉(1:持有多單 -1:持有空單 0:空手)，第 t 根的報酬由第 t-1 根的訊號決定
+持倉由 position_engine 的狀態機產生；rules 可加上 allow_short(反向訊號放空)、stop_loss、take_profit、max_hold
+(停損停利以收盤價計算，需傳入 price)
+訊號轉成交易紀錄(含多空與交易成本)請用 backtest_engine.run_signal
+"""
+
+import numpy as np
+from bar_schema import as_float64
+import position_engine
+
+# 均線交叉：短期均線站上長期均線時做多，跌破(或相等)時出場；allow_short 時跌破即放空、站上時回補
+def ma_cross_signal(short_ma, long_ma, allow_short=False, **rules):
+    short_ma, long_ma = np.asarray(short_ma), np.asarray(long_ma)
+    return position_engine.positions(
+        long_entry=short_ma > long_ma, long_exit=short_ma <= long_ma,
+        short_entry=short_ma < long_ma if allow_short else None,
+        short_exit=short_ma >= long_ma if allow_short else None, **rules)
+
+# RSI：低於超賣門檻時進場做多，持有到高於超買門檻才出場(兩門檻之間維持原本的持倉)
+# allow_short 時高於超買門檻放空，持有到低於超賣門檻才回補
+def rsi_signal(rsi, buy_thres, sell_thres, allow_short=False, **rules):
+    rsi = np.asarray(rsi)
+    return position_engine.positions(
+        long_entry=rsi < buy_thres, long_exit=rsi > sell_thres,
+        short_entry=rsi > sell_thres if allow_short else None,
+        short_exit=rsi < buy_thres if allow_short else None, **rules)
+
+# 市場報酬與策略報酬(第一根為 0)
+def strategy_returns(close, signal):
+    close = as_float64(close)
+    market = np.r_[0.0, close[1:] / close[:-1] - 1]
+    strategy = np.r_[0.0, np.asarray(signal[:-1]) * market[1:]]
+    return market, strategy
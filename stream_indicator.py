@@ -0,0 +1,367 @@
+# -*- coding: utf-8 -*-
+"""
+串流技術指標：每根K棒 O(1) 更新(KD/威廉指標的單調佇列為攤銷 O(1))
+Push 在新K棒開始時呼叫：先把上一根(已完成)併入累積狀態，再算新K棒的值
+Amend 在同一根K棒的報價更新時呼叫：只用已完成K棒的狀態重算最新一根，不改動狀態
+定義與 talib 相同(SMA/EMA/WMA/BBANDS/RSI/STOCH/WILLR)，資料不足的前幾根為 NaN
+分母為 0(價格完全沒變動)時 RSI、KD 取 50，威廉指標取 -50
+檔案後半為整段計算的批次參考實作，用來驗證串流結果
+"""
+
+import collections
+import math
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+NAN = float('nan')
+# 滑動和每隔這麼多次(且不少於視窗長度)以視窗重新加總一次，避免加減累積捨入誤差(攤銷後仍為 O(1))
+RESYNC = 1024
+
+# ──────────────────────────────────────────────────────────────────────────────
+# 最近 n-1 根已完成數值的滑動和；Value(x) 為加上目前這根 x 的 n 根平均
+class _RollingSum():
+    def __init__(self, n):
+        self.N = n
+        self.Window = collections.deque()
+        self.Sum = 0.0
+        self.Count = 0
+
+    def Commit(self, x):
+        self.Window.append(x)
+        self.Sum += x
+        if len(self.Window) > self.N - 1:
+            self.Sum -= self.Window.popleft()
+        self.Count += 1
+        if self.Count % max(RESYNC, self.N) == 0:
+            self.Sum = math.fsum(self.Window)
+
+    def Value(self, x):
+        if len(self.Window) < self.N - 1:
+            return NAN
+        return (self.Sum + x) / self.N
+
+# 最近 n-1 根已完成數值的滑動最大值(sign=-1 為最小值)，單調佇列存 (序號, 值)
+class _RollingExtreme():
+    def __init__(self, n, sign=1):
+        self.N = n
+        self.Sign = sign
+        self.Deque = collections.deque()
+        self.Count = 0
+
+    def Commit(self, x):
+        v = self.Sign * x
+        while self.Deque and self.Deque[-1][1] <= v:
+            self.Deque.pop()
+        self.Deque.append((self.Count, v))
+        self.Count += 1
+        while self.Deque and self.Deque[0][0] < self.Count - (self.N - 1):
+            self.Deque.popleft()
+
+    def Value(self, x):
+        if self.Count < self.N - 1:
+            return NAN
+        v = self.Sign * x
+        if self.Deque and self.Deque[0][1] > v:
+            v = self.Deque[0][1]
+        return self.Sign * v
+
+# 串流指標共同介面：子類別實作 _Commit(已完成K棒) 與 _Value(目前K棒)
+class _Stream():
+    Names = ['value']
+
+    def __init__(self):
+        self.Pending = None
+
+    def Push(self, high, low, close):
+        if self.Pending is not None:
+            self._Commit(*self.Pending)
+        self.Pending = (high, low, close)
+        return self._Value(high, low, close)
+
+    def Amend(self, high, low, close):
+        self.Pending = (high, low, close)
+        return self._Value(high, low, close)
+
+# ──────────────────────────────────────────────────────────────────────────────
+# 簡單移動平均
+class StreamSMA(_Stream):
+    def __init__(self, n):
+        super().__init__()
+        self.Rolling = _RollingSum(n)
+
+    def _Commit(self, high, low, close):
+        self.Rolling.Commit(close)
+
+    def _Value(self, high, low, close):
+        return (self.Rolling.Value(close),)
+
+# 指數移動平均(以前 n 根的 SMA 為起始值)
+class StreamEMA(_Stream):
+    def __init__(self, n):
+        super().__init__()
+        self.N = n
+        self.Alpha = 2.0 / (n + 1)
+        self.Count = 0
+        self.Seed = 0.0
+        self.EMA = NAN
+
+    def _Next(self, close):
+        if self.Count < self.N - 1:
+            return NAN
+        if self.Count == self.N - 1:
+            return (self.Seed + close) / self.N
+        return self.EMA + self.Alpha * (close - self.EMA)
+
+    def _Commit(self, high, low, close):
+        if self.Count < self.N - 1:
+            self.Seed += close
+        else:
+            self.EMA = self._Next(close)
+        self.Count += 1
+
+    def _Value(self, high, low, close):
+        return (self._Next(close),)
+
+# 加權移動平均(最新一根權重 n，最舊一根權重 1)
+class StreamWMA(_Stream):
+    def __init__(self, n):
+        super().__init__()
+        self.N = n
+        self.Window = collections.deque()
+        self.Sum = 0.0
+        # 已完成的 n-1 根以權重 1..n-1 加總
+        self.Weighted = 0.0
+        self.Count = 0
+
+    def _Commit(self, high, low, close):
+        if len(self.Window) < self.N - 1:
+            self.Window.append(close)
+            self.Sum += close
+            self.Weighted += len(self.Window) * close
+        elif self.N > 1:
+            # 每根權重減 1(最舊一根降為 0 移出)，新的一根權重 n-1
+            self.Weighted += (self.N - 1) * close - self.Sum
+            self.Sum += close - self.Window.popleft()
+            self.Window.append(close)
+        self.Count += 1
+        if self.Count % max(RESYNC, self.N) == 0:
+            self.Sum = math.fsum(self.Window)
+            self.Weighted = math.fsum(w * x for w, x in enumerate(self.Window, 1))
+
+    def _Value(self, high, low, close):
+        if len(self.Window) < self.N - 1:
+            return (NAN,)
+        return ((self.Weighted + self.N * close) / (self.N * (self.N + 1) / 2),)
+
+# 布林通道(中線為 SMA，標準差為母體標準差)，滑動視窗以 Welford 法更新平均與平方差和
+class StreamBBands(_Stream):
+    Names = ['upper', 'middle', 'lower']
+
+    def __init__(self, n, nbdev=2.0):
+        super().__init__()
+        self.N = n
+        self.NbDev = nbdev
+        self.Window = collections.deque()
+        self.Mean = 0.0
+        self.M2 = 0.0
+        self.Count = 0
+
+    def _Commit(self, high, low, close):
+        self.Count += 1
+        if self.Count % max(RESYNC, self.N) == 0:
+            self.Window.append(close)
+            if len(self.Window) > self.N - 1:
+                self.Window.popleft()
+            window = np.array(self.Window)
+            self.Mean = float(window.mean()) if len(window) else 0.0
+            self.M2 = float(((window - self.Mean) ** 2).sum())
+            return
+        self.Window.append(close)
+        count = len(self.Window)
+        delta = close - self.Mean
+        self.Mean += delta / count
+        self.M2 += delta * (close - self.Mean)
+        if count > self.N - 1:
+            old = self.Window.popleft()
+            count -= 1
+            if count == 0:
+                self.Mean, self.M2 = 0.0, 0.0
+            else:
+                mean = self.Mean
+                self.Mean = (mean * (count + 1) - old) / count
+                self.M2 -= (old - mean) * (old - self.Mean)
+
+    def _Value(self, high, low, close):
+        if len(self.Window) < self.N - 1:
+            return (NAN, NAN, NAN)
+        delta = close - self.Mean
+        mean = self.Mean + delta / self.N
+        std = math.sqrt(max((self.M2 + delta * (close - mean)) / self.N, 0.0))
+        return (mean + self.NbDev * std, mean, mean - self.NbDev * std)
+
+# 相對強弱指標(Wilder 平滑，前 n 個漲跌以簡單平均為起始值)
+class StreamRSI(_Stream):
+    def __init__(self, n):
+        super().__init__()
+        self.N = n
+        self.Prev = None
+        self.Count = 0
+        self.Gain = 0.0
+        self.Loss = 0.0
+
+    def _Next(self, close):
+        change = close - self.Prev
+        gain, loss = max(change, 0.0), max(-change, 0.0)
+        if self.Count < self.N - 1:
+            return self.Gain + gain, self.Loss + loss
+        if self.Count == self.N - 1:
+            return (self.Gain + gain) / self.N, (self.Loss + loss) / self.N
+        return (self.Gain * (self.N - 1) + gain) / self.N, (self.Loss * (self.N - 1) + loss) / self.N
+
+    def _Commit(self, high, low, close):
+        if self.Prev is not None:
+            self.Gain, self.Loss = self._Next(close)
+            self.Count += 1
+        self.Prev = close
+
+    def _Value(self, high, low, close):
+        if self.Prev is None or self.Count < self.N - 1:
+            return (NAN,)
+        gain, loss = self._Next(close)
+        return (100.0 * gain / (gain + loss) if gain + loss else 50.0,)
+
+# KD(talib STOCH：RSV 期間最高/最低，K 為 RSV 的 k 期 SMA，D 為 K 的 d 期 SMA)
+class StreamKD(_Stream):
+    Names = ['k', 'd']
+
+    def __init__(self, rsv=9, k=3, d=3):
+        super().__init__()
+        self.High = _RollingExtreme(rsv, 1)
+        self.Low = _RollingExtreme(rsv, -1)
+        self.K = _RollingSum(k)
+        self.D = _RollingSum(d)
+
+    def _FastK(self, high, low, close):
+        hh, ll = self.High.Value(high), self.Low.Value(low)
+        if hh != hh:
+            return NAN
+        return 100.0 * (close - ll) / (hh - ll) if hh > ll else 50.0
+
+    def _Commit(self, high, low, close):
+        fastk = self._FastK(high, low, close)
+        if fastk == fastk:
+            slowk = self.K.Value(fastk)
+            self.K.Commit(fastk)
+            if slowk == slowk:
+                self.D.Commit(slowk)
+        self.High.Commit(high)
+        self.Low.Commit(low)
+
+    def _Value(self, high, low, close):
+        fastk = self._FastK(high, low, close)
+        slowk = self.K.Value(fastk) if fastk == fastk else NAN
+        return (slowk, self.D.Value(slowk) if slowk == slowk else NAN)
+
+# 威廉指標
+class StreamWILLR(_Stream):
+    def __init__(self, n=14):
+        super().__init__()
+        self.High = _RollingExtreme(n, 1)
+        self.Low = _RollingExtreme(n, -1)
+
+    def _Commit(self, high, low, close):
+        self.High.Commit(high)
+        self.Low.Commit(low)
+
+    def _Value(self, high, low, close):
+        hh, ll = self.High.Value(high), self.Low.Value(low)
+        if hh != hh:
+            return (NAN,)
+        return (-100.0 * (hh - close) / (hh - ll) if hh > ll else -50.0,)
+
+# 乖離率 (收盤 - SMA) / SMA
+class StreamBIAS(_Stream):
+    def __init__(self, n=10):
+        super().__init__()
+        self.Rolling = _RollingSum(n)
+
+    def _Commit(self, high, low, close):
+        self.Rolling.Commit(close)
+
+    def _Value(self, high, low, close):
+        ma = self.Rolling.Value(close)
+        return ((close - ma) / ma,)
+
+# ──────────────────────────────────────────────────────────────────────────────
+# 批次參考實作(整段計算，輸入為完整的 numpy 陣列)
+def _rolling(values, n, func):
+    values = np.asarray(values, dtype=np.float64)
+    out = np.full(len(values), np.nan)
+    if len(values) >= n:
+        out[n - 1:] = func(sliding_window_view(values, n), axis=-1)
+    return out
+
+# 只對非 NaN 的尾段計算(前段維持 NaN)
+def _tail(values, func):
+    out = np.full(len(values), np.nan)
+    valid = np.flatnonzero(~np.isnan(values))
+    if len(valid):
+        out[valid[0]:] = func(values[valid[0]:])
+    return out
+
+def sma(close, n):
+    return _rolling(close, n, np.mean)
+
+def ema(close, n):
+    close = np.asarray(close, dtype=np.float64)
+    out = np.full(len(close), np.nan)
+    if len(close) >= n:
+        alpha = 2.0 / (n + 1)
+        value = close[:n].sum() / n
+        out[n - 1] = value
+        for i in range(n, len(close)):
+            value = value + alpha * (close[i] - value)
+            out[i] = value
+    return out
+
+def wma(close, n):
+    weights = np.arange(1, n + 1, dtype=np.float64)
+    return _rolling(close, n, lambda w, axis: w @ weights / weights.sum())
+
+def bbands(close, n, nbdev=2.0):
+    mid = sma(close, n)
+    std = _rolling(close, n, np.std)
+    return mid + nbdev * std, mid, mid - nbdev * std
+
+def rsi(close, n):
+    close = np.asarray(close, dtype=np.float64)
+    out = np.full(len(close), np.nan)
+    if len(close) > n:
+        change = np.diff(close)
+        gain, loss = np.maximum(change, 0), np.maximum(-change, 0)
+        g, l = gain[:n].sum() / n, loss[:n].sum() / n
+        for i in range(n, len(close)):
+            if i > n:
+                g = (g * (n - 1) + gain[i - 1]) / n
+                l = (l * (n - 1) + loss[i - 1]) / n
+            out[i] = 100.0 * g / (g + l) if g + l else 50.0
+    return out
+
+def stoch(high, low, close, rsv=9, k=3, d=3):
+    hh, ll = _rolling(high, rsv, np.max), _rolling(low, rsv, np.min)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        fastk = np.where(hh > ll, 100.0 * (np.asarray(close) - ll) / (hh - ll), 50.0)
+    fastk[np.isnan(hh)] = np.nan
+    slowk = _tail(fastk, lambda v: sma(v, k))
+    return slowk, _tail(slowk, lambda v: sma(v, d))
+
+def willr(high, low, close, n=14):
+    hh, ll = _rolling(high, n, np.max), _rolling(low, n, np.min)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        out = np.where(hh > ll, -100.0 * (hh - np.asarray(close)) / (hh - ll), -50.0)
+    out[np.isnan(hh)] = np.nan
+    return out
+
+def bias(close, n=10):
+    ma = sma(close, n)
+    return (np.asarray(close) - ma) / ma
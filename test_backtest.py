@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+訊號回測：run_signal 處理 -1、0、1 之間的所有轉換，結果與逐根執行的 BarBacktest 相同
+"""
+
+import numpy as np
+from backtest_engine import BarBacktest, run_signal, signal_strategy
+from contract_spec import ContractSpec, get_spec
+
+def _bars(n):
+    return {'time': np.datetime64('2024-01-02T09:01') + np.arange(n).astype('timedelta64[m]'),
+            'close': 100 + np.arange(n) * 1.0}
+
+def test_short_then_long():
+    bars = _bars(6)
+    record = run_signal(bars, [0, -1, -1, 0, 1, 0], 'TXF', ContractSpec())
+    trades = record.GetTradeRecord()
+    assert [row[0] for row in trades] == ['S', 'B']
+    assert [(row[3], row[5]) for row in trades] == [(101.0, 103.0), (104.0, 105.0)]
+    assert record.GetProfit().tolist() == [-2.0, 1.0]
+    assert record.GetOpenInterest() == 0
+
+def test_reversal_without_flat_bar():
+    record = run_signal(_bars(5), [1, -1, 1, 1, 0], 'TXF', ContractSpec())
+    assert [row[0] for row in record.GetTradeRecord()] == ['B', 'S', 'B']
+
+def test_matches_event_engine():
+    rng = np.random.default_rng(0)
+    n = 500
+    bars = {'time': _bars(n)['time'], 'close': np.round(100 + np.cumsum(rng.normal(0, 0.5, n)), 2)}
+    signal = rng.choice([-1, 0, 1], size=n, p=[0.1, 0.8, 0.1])
+    signal = np.repeat(signal[::5], 5)
+    spec = get_spec('TXF')
+    fast = run_signal(bars, signal, 'TXF', spec)
+    slow = BarBacktest(bars, 'TXF', spec).Run(signal_strategy(signal))
+    assert fast.GetTradeRecord() == slow.GetTradeRecord()
+    assert np.allclose(fast.GetProfit(), slow.GetProfit())
+    assert fast.GetOpenInterest() == slow.GetOpenInterest()
+
+def test_batch_applies_exit_rules(synthetic_pkl, store_root):
+    import batch_backtest
+    import bar_store
+    import indicator_engine
+    import strategies
+    from bar_schema import as_float64
+    bars = bar_store.read_range(*bar_store.open_dataset(synthetic_pkl, store_root))
+    close = as_float64(bars['close'])
+    ma_rules = {'allow_short': True, 'max_hold': 30}
+    rsi_rules = {'allow_short': True, 'stop_loss': 0.002, 'max_hold': 5}
+    rows = {row['策略']: row for row in batch_backtest.backtest_file(synthetic_pkl, None, ma_rules, rsi_rules, store_root)}
+    signals = {
+        '均線交叉': strategies.ma_cross_signal(indicator_engine.ma(close, 5)['MA'], indicator_engine.ma(close, 20)['MA'],
+                                           price=close, **ma_rules),
+        'RSI': strategies.rsi_signal(indicator_engine.rsi(close, 14)['RSI'], 30, 70, price=close, **rsi_rules),
+    }
+    plain = {row['策略']: row for row in batch_backtest.backtest_file(synthetic_pkl, root=store_root)}
+    for name, signal in signals.items():
+        record = run_signal(bars, signal, 'TST', get_spec('TST'))
+        assert rows[name]['交易次數'] == record.GetTotalNumber()
+        assert rows[name]['最終報酬'] == record.GetTotalProfitRate()
+        assert rows[name]['交易次數'] != plain[name]['交易次數']
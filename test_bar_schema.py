@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""
+精簡欄位型態：float32 儲存的價格由 as_float64 還原成原始 float64
+"""
+
+import numpy as np
+import pytest
+import bar_schema
+from conftest import synthetic_bars
+
+def test_as_float64_restores_two_decimal_prices():
+    rng = np.random.default_rng(1)
+    price = rng.integers(1, 6_000_000, 100_000) / 10 ** bar_schema.PRICE_DECIMALS
+    stored = price.astype(np.float32)
+    assert not np.array_equal(stored.astype(np.float64), price)
+    assert np.array_equal(bar_schema.as_float64(stored), price)
+
+def test_as_float64_keeps_float64():
+    price = np.array([1.005, 2.0004, 31.15])
+    assert bar_schema.as_float64(price) is price
+
+def test_compact_round_trip():
+    df = synthetic_bars()
+    original = {name: df[name].to_numpy() for name in bar_schema.SCHEMA}
+    compact = bar_schema.to_compact(original)
+    assert {name: str(values.dtype) for name, values in compact.items()} == bar_schema.SCHEMA
+    restored = bar_schema.to_float64(compact)
+    for name in bar_schema.PRICE_FIELDS:
+        assert np.array_equal(restored[name], original[name])
+    assert np.array_equal(compact['volume'], original['volume'])
+    assert bar_schema.nbytes(compact) < bar_schema.nbytes(original)
+
+def test_compact_rejects_volume_overflow():
+    with pytest.raises(ValueError):
+        bar_schema.to_compact({'volume': np.array([1, 2 ** 31])})
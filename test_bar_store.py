@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+欄位式儲存：轉換、新增K棒(append_bars)與即時資料寫入後逐列與原始資料相同
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+import bar_store
+import live_feed
+from bar_schema import as_float64
+
+def _read(path, root):
+    return bar_store.read_range(*bar_store.open_dataset(path, root))
+
+# 原始檔的前 head 根另存成新的 .pkl，其餘當作之後新增的K棒
+def _split(path, head):
+    df = pd.read_pickle(path)
+    df.iloc[:head].to_pickle(path)
+    rest = df.iloc[head:]
+    return {'time': pd.to_datetime(rest['time']).to_numpy('datetime64[ns]'),
+            **{name: rest[name].to_numpy() for name in ['open', 'high', 'low', 'close', 'volume', 'amount']}}, df
+
+def _assert_same(stored, df):
+    assert np.array_equal(stored['time'], pd.to_datetime(df['time']).to_numpy('datetime64[ns]'))
+    for name in ['open', 'high', 'low', 'close']:
+        assert np.array_equal(as_float64(stored[name]), df[name].to_numpy())
+    assert np.array_equal(stored['volume'], df['volume'].to_numpy())
+
+def test_convert_round_trip(synthetic_pkl, store_root):
+    _assert_same(_read(synthetic_pkl, store_root), pd.read_pickle(synthetic_pkl))
+
+def test_append_bars(synthetic_pkl, store_root):
+    new, df = _split(synthetic_pkl, 400)
+    _read(synthetic_pkl, store_root)
+    assert bar_store.append_bars(synthetic_pkl, new, store_root) == len(df) - 400
+    _assert_same(_read(synthetic_pkl, store_root), df)
+
+def test_append_bars_drops_identical_overlap(synthetic_pkl, store_root):
+    new, df = _split(synthetic_pkl, 400)
+    bar_store.append_bars(synthetic_pkl, {name: values[:100] for name, values in new.items()}, store_root)
+    # 前 100 根已儲存，只新增其餘的K棒
+    assert bar_store.append_bars(synthetic_pkl, new, store_root) == len(df) - 500
+    _assert_same(_read(synthetic_pkl, store_root), df)
+
+def test_append_bars_rejects_conflicting_overlap(synthetic_pkl, store_root):
+    new, df = _split(synthetic_pkl, 400)
+    bar_store.append_bars(synthetic_pkl, {name: values[:100] for name, values in new.items()}, store_root)
+    changed = dict(new)
+    changed['close'] = new['close'].copy()
+    changed['close'][50] += 0.01
+    with pytest.raises(ValueError):
+        bar_store.append_bars(synthetic_pkl, changed, store_root)
+    # 拒絕時不寫入任何K棒
+    _assert_same(_read(synthetic_pkl, store_root), df.iloc[:500])
+
+def test_append_bars_rejects_unsorted_time(synthetic_pkl, store_root):
+    new, _ = _split(synthetic_pkl, 400)
+    new['time'] = new['time'][::-1]
+    with pytest.raises(ValueError):
+        bar_store.append_bars(synthetic_pkl, new, store_root)
+
+def test_compact_keeps_rows(synthetic_pkl, store_root):
+    new, df = _split(synthetic_pkl, 400)
+    for i in range(0, len(new['time']), 150):
+        bar_store.append_bars(synthetic_pkl, {name: values[i:i + 150] for name, values in new.items()}, store_root)
+    manifest = bar_store.compact(synthetic_pkl, store_root)
+    assert not manifest.get('segments')
+    _assert_same(_read(synthetic_pkl, store_root), df)
+
+def test_dataset_dir_separates_same_name(tmp_path, store_root):
+    a = str(tmp_path / 'a' / 'x.pkl')
+    b = str(tmp_path / 'b' / 'x.pkl')
+    assert bar_store.dataset_dir(a, store_root) != bar_store.dataset_dir(b, store_root)
+
+def test_live_feed_store_round_trip(synthetic_pkl):
+    assert live_feed.verify_store(synthetic_pkl, limit=600, head=200) == 0
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+KBar：整批產生(TimeBatchAdd/VolumeBatchAdd)與逐筆更新(TimeAdd/VolumeAdd)的K棒相同，分批接續也相同
+"""
+
+import numpy as np
+from indicator_f_Lo2_short import KBar
+
+def _ticks(n, seed=0):
+    rng = np.random.default_rng(seed)
+    start = np.datetime64('2024-01-02T08:45')
+    time = start + np.cumsum(rng.integers(0, 20, n)).astype('timedelta64[s]')
+    price = np.round(100 + np.cumsum(rng.normal(0, 0.1, n)), 2)
+    qty = rng.integers(1, 200, n)
+    return time, price, qty
+
+def _columns(kbar, names):
+    return {name: np.asarray(getattr(kbar, name)).copy() for name in names}
+
+def _assert_same(a, b):
+    assert a.keys() == b.keys()
+    for name in a:
+        assert np.array_equal(a[name], b[name]), name
+
+def test_volume_batch_matches_ticks():
+    _, price, qty = _ticks(5000)
+    amount = np.cumsum(qty)
+    for cycle in (1, 150, 2000):
+        ticks = KBar('20240102', 'volume', cycle)
+        for p, a in zip(price.tolist(), amount.tolist()):
+            ticks.VolumeAdd(p, a)
+        batch = KBar('20240102', 'volume', cycle)
+        # 分批接續：批次邊界落在K棒中間
+        for i0 in range(0, len(price), 777):
+            batch.VolumeBatchAdd(price[i0:i0 + 777], amount[i0:i0 + 777])
+        names = ['Open', 'High', 'Low', 'Close']
+        _assert_same(_columns(ticks, names), _columns(batch, names))
+
+def test_time_batch_matches_ticks():
+    time, price, qty = _ticks(5000, seed=1)
+    ticks = KBar('20240102', 'time', 5)
+    for t, p, q in zip(time.astype('datetime64[us]').tolist(), price.tolist(), qty.tolist()):
+        ticks.TimeAdd(t, p, q, 'TXF')
+    batch = KBar('20240102', 'time', 5)
+    for i0 in range(0, len(time), 777):
+        batch.TimeBatchAdd(time[i0:i0 + 777], price[i0:i0 + 777], qty[i0:i0 + 777], ['TXF'] * len(time[i0:i0 + 777]))
+    names = ['Time', 'Open', 'High', 'Low', 'Close', 'Volume', 'Prod']
+    _assert_same(_columns(ticks, names), _columns(batch, names))
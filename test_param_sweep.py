@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""
+參數掃描與滾動式最佳化：每組參數的結果與逐組回測相同
+"""
+
+import numpy as np
+import indicator_engine
+import param_sweep
+import strategies
+import walk_forward
+from bar_schema import as_float64
+from conftest import synthetic_bars
+
+def test_rolling_means_independent_of_start():
+    close = synthetic_bars()['close'].to_numpy()
+    full = indicator_engine.ma(close, 20)['MA']
+    part = indicator_engine.ma(close[300:], 20)['MA']
+    assert np.array_equal(full[319:], part[19:])
+
+def test_sweep_matches_strategy():
+    close = synthetic_bars(days=5)['close'].to_numpy()
+    short, long = np.arange(2, 9), np.arange(10, 31, 5)
+    result = param_sweep.ma_cross_sweep(close, short, long, start=40)
+    for i, s in enumerate(short):
+        for j, l in enumerate(long):
+            signal = strategies.ma_cross_signal(indicator_engine.ma(close, s)['MA'][40:],
+                                                indicator_engine.ma(close, l)['MA'][40:])
+            expected = np.prod(1 + strategies.strategy_returns(close[40:], signal)[1]) - 1
+            assert abs(result['return'][i, j] - expected) <= 1e-12
+
+def test_sweep_verify(synthetic_pkl, store_root):
+    for swept, traded in param_sweep.verify(synthetic_pkl, root=store_root).values():
+        assert abs(swept - traded) <= 1e-12
+
+def test_walk_forward_verify(synthetic_pkl, store_root):
+    for _, score, rescored in walk_forward.verify(synthetic_pkl, folds=3, root=store_root):
+        assert abs(score - rescored) <= 1e-12
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+排序時間索引：以 int64 epoch 奈秒保存時間欄，並預先算好每日的起始列
+日期區間與「最近 N 筆」的切片都用 searchsorted 完成，不需每次掃描整段歷史
+"""
+
+import datetime
+import numpy as np
+
+class TimeIndex():
+    # time: 已排序的時間欄(datetime64 或 epoch 奈秒)
+    def __init__(self, time):
+        self.Time = np.asarray(time).astype('datetime64[ns]').view(np.int64)
+        day = self.Time.view('datetime64[ns]').astype('datetime64[D]')
+        # 每日第一列的位置(最後再加上總筆數，方便取區間終點)
+        starts = np.flatnonzero(np.r_[True, day[1:] != day[:-1]]) if len(day) else np.empty(0, dtype=np.intp)
+        self.Days = day[starts]
+        self.DayOffset = np.r_[starts, len(day)]
+
+    def __len__(self):
+        return len(self.Time)
+
+    # 第一個交易日與最後一個交易日
+    def FirstDate(self):
+        return self.Days[0].astype(datetime.date)
+
+    def LastDate(self):
+        return self.Days[-1].astype(datetime.date)
+
+    # 交易日清單
+    def GetDays(self):
+        return self.Days
+
+    # [start_date, end_date] 兩端皆含的日期區間 → 列區間 (i0, i1)
+    def DateRange(self, start_date, end_date):
+        d0 = np.searchsorted(self.Days, np.datetime64(start_date, 'D'), 'left')
+        d1 = np.searchsorted(self.Days, np.datetime64(end_date, 'D'), 'right')
+        return int(self.DayOffset[d0]), int(self.DayOffset[max(d0, d1)])
+
+    # [start, end) 時間區間 → 列區間 (i0, i1)
+    def TimeRange(self, start, end):
+        i0 = np.searchsorted(self.Time, np.datetime64(start, 'ns').astype(np.int64), 'left')
+        i1 = np.searchsorted(self.Time, np.datetime64(end, 'ns').astype(np.int64), 'left')
+        return int(i0), int(max(i0, i1))
+
+    # 只保留列區間內最近 n 筆
+    @staticmethod
+    def Last(i0, i1, n):
+        return max(i0, i1 - int(n)), i1
+
+    # 區間內的時間(view)
+    def Slice(self, i0, i1):
+        return self.Time[i0:i1]
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+滾動式(walk-forward)最佳化：把一個商品的歷史切成連續的訓練/測試區段，避免只在畫面上的區間調參數而過度配適
+每一段在訓練區間掃描參數格選出最佳參數，再拿到緊接著的測試區間評估(樣本外)，下一段整體往後移一個測試區間
+各段交給行程池平行計算，收盤價放進共享記憶體(shared_cache.publish)，worker 以名稱附加，不複製陣列
+各段測試區間首尾相接，拼接後的樣本外訊號經 Record 進出場，得到樣本外權益曲線與績效統計
+均線交叉的訓練(參數掃描)與測試(訊號)使用同一個移動平均(indicator_engine.rolling_means)與同一個交叉規則
+執行：python walk_forward.py [檔案.pkl] [段數] [ma|rsi]
+檢查各段訓練分數與以測試用的訊號重算的分數相同：python walk_forward.py verify [檔案...]
+"""
+
+import os
+import sys
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import bar_store
+import indicator_engine
+import shared_cache
+import strategies
+from backtest_engine import run_signal
+from bar_schema import as_float64
+from contract_spec import get_spec
+from param_sweep import ma_cross_sweep
+
+# 參數格
+MA_SHORT = np.arange(2, 31)
+MA_LONG = np.arange(10, 61)
+RSI_PERIODS = (7, 14, 21)
+RSI_BUY = (20, 25, 30, 35, 40)
+RSI_SELL = (60, 65, 70, 75, 80)
+# 指標暖機所需的K棒數(取訓練/測試區間之前的資料，不列入績效)
+WARMUP = 64
+
+# ──────────────────────────────────────────────────────────────────────────────
+# 切分區段：n 根K棒平分成 folds + train_blocks 塊，第 k 段以第 [k, k+train_blocks) 塊訓練、第 k+train_blocks 塊測試
+# 回傳 [(訓練起, 測試起, 測試迄), ...]，最後一段的測試區間延伸到資料結尾
+def make_folds(n, folds, train_blocks=3):
+    block = n // (folds + train_blocks)
+    if block < 2:
+        raise ValueError('K棒數不足以切出 %d 段' % folds)
+    bounds = [(k * block, (k + train_blocks) * block, (k + train_blocks + 1) * block) for k in range(folds)]
+    bounds[-1] = bounds[-1][:2] + (n,)
+    return bounds
+
+# 訓練區間的績效(第 t 根的報酬由第 t-1 根的訊號決定)：回傳 {'return','sharpe'}
+def _metrics(close, signal, start):
+    ret = close[start + 1:] / close[start:-1] - 1
+    strategy = signal[start:-1] * ret
+    std = strategy.std()
+    return {'return': np.prod(1 + strategy) - 1, 'sharpe': strategy.mean() / std if std > 0 else 0.0}
+
+# 均線交叉：訓練區間以 ma_cross_sweep 一次評估整個參數格，短期須小於長期
+# 掃描的每一組與 _signal_ma 產生的訊號完全相同(param_sweep.verify)，選出的分數即該組訊號的訓練績效
+def _fit_ma(close, start, objective):
+    score = ma_cross_sweep(close, MA_SHORT, MA_LONG, start=start)[objective]
+    score = np.where(MA_SHORT[:, None] < MA_LONG[None, :], np.nan_to_num(score, nan=-np.inf), -np.inf)
+    i, j = np.unravel_index(np.argmax(score), score.shape)
+    return {'short_window': int(MA_SHORT[i]), 'long_window': int(MA_LONG[j])}, float(score[i, j])
+
+def _signal_ma(close, params):
+    return strategies.ma_cross_signal(indicator_engine.ma(close, params['short_window'])['MA'],
+                                      indicator_engine.ma(close, params['long_window'])['MA'])
+
+# RSI：每個週期算一次 RSI，再逐組門檻評估
+def _fit_rsi(close, start, objective):
+    best, best_score = None, -np.inf
+    for period in RSI_PERIODS:
+        rsi = indicator_engine.rsi(close, period)['RSI']
+        for buy in RSI_BUY:
+            for sell in RSI_SELL:
+                score = _metrics(close, strategies.rsi_signal(rsi, buy, sell), start)[objective]
+                if score > best_score:
+                    best, best_score = {'rsi_period': period, 'rsi_buy': buy, 'rsi_sell': sell}, score
+    return best, float(best_score)
+
+def _signal_rsi(close, params):
+    rsi = indicator_engine.rsi(close, params['rsi_period'])['RSI']
+    return strategies.rsi_signal(rsi, params['rsi_buy'], params['rsi_sell'])
+
+STRATEGIES = {
+    'ma': (_fit_ma, _signal_ma),
+    'rsi': (_fit_rsi, _signal_rsi),
+}
+
+# ──────────────────────────────────────────────────────────────────────────────
+# worker：行程啟動時附加共享記憶體中的收盤價
+_close = None
+
+def _attach(name):
+    global _close, _shm
+    _shm, arrays = shared_cache.attach(name)
+    _close = arrays['close']
+
+# 計算一段：回傳 (最佳參數, 訓練分數, 測試區間的訊號)；測試區間最後一根強制平倉
+def _run_fold(fold, strategy, objective):
+    train_start, test_start, test_end = fold
+    fit, signal_of = STRATEGIES[strategy]
+    lo = max(train_start - WARMUP, 0)
+    params, score = fit(as_float64(_close[lo:test_start]), train_start - lo, objective)
+    lo = max(test_start - WARMUP, 0)
+    signal = np.asarray(signal_of(as_float64(_close[lo:test_end]), params), dtype=np.int8)[test_start - lo:]
+    signal[-1] = 0
+    return params, score, signal
+
+# 滾動式最佳化：bars 為 {'time','close'}(完整歷史)
+# strategy：'ma' 或 'rsi'；objective：訓練區間挑選參數的指標('sharpe' 或 'return')
+# max_workers=1 時在本行程依序計算
+# 回傳 {'folds': 每段一列的 DataFrame, 'record': 拼接後樣本外的 Record, 'time','signal','equity': 樣本外區間的陣列}
+def walk_forward(bars, product, strategy='ma', folds=24, train_blocks=3, objective='sharpe', max_workers=None):
+    global _close
+    time, close = np.asarray(bars['time']), np.asarray(bars['close'])
+    bounds = make_folds(len(close), folds, train_blocks)
+    args = (bounds, [strategy] * folds, [objective] * folds)
+    max_workers = min(max_workers or os.cpu_count() or 1, folds)
+    if max_workers == 1:
+        _close = close
+        results = list(map(_run_fold, *args))
+    else:
+        shm, _, _ = shared_cache.publish(shared_cache.SHM_PREFIX + 'wf_' + uuid.uuid4().hex[:12], {'close': close})
+        try:
+            with ProcessPoolExecutor(max_workers=max_workers, initializer=_attach, initargs=(shm.name,)) as pool:
+                results = list(pool.map(*((_run_fold,) + args)))
+        finally:
+            shm.close()
+            shm.unlink()
+    spec = get_spec(product)
+    rows = []
+    for k, ((train_start, test_start, test_end), (params, score, signal)) in enumerate(zip(bounds, results)):
+        record = run_signal({'time': time[test_start:test_end], 'close': close[test_start:test_end]},
+                            signal, product, spec)
+        rows.append({
+            '段': k + 1,
+            '訓練起': time[train_start],
+            '測試起': time[test_start],
+            '測試迄': time[test_end - 1],
+            **params,
+            '訓練分數': score,
+            **record.GetStatistics(),
+        })
+    # 拼接樣本外：各段訊號首尾相接，每段結尾已平倉，整段一次進出場即等於各段交易的合併
+    oos = slice(bounds[0][1], len(close))
+    signal = np.concatenate([signal for _, _, signal in results])
+    oos_bars = {'time': time[oos], 'close': close[oos]}
+    market, returns = strategies.strategy_returns(oos_bars['close'], signal)
+    return {
+        'folds': pd.DataFrame(rows),
+        'record': run_signal(oos_bars, signal, product, spec),
+        'time': time[oos],
+        'signal': signal,
+        'equity': np.cumprod(1 + returns),
+        'market': np.cumprod(1 + market),
+    }
+
+# 由 .pkl 讀取 1 分K 並執行滾動式最佳化
+def walk_forward_file(path, strategy='ma', folds=24, **kwargs):
+    directory, manifest = bar_store.open_dataset(path)
+    bars = bar_store.read_range(directory, manifest, fields=['time', 'close'])
+    product = os.path.basename(path).replace('.pkl', '').split('_')[2]
+    return walk_forward(bars, product, strategy, folds, **kwargs)
+
+# 檢查每一段：訓練時選出的分數與以 signal_of(測試用的訊號函數)在訓練區間重算的分數相同
+# 回傳 [(段, 訓練分數, 重算分數), ...]
+def verify(path, strategy='ma', folds=8, objective='sharpe', root=bar_store.STORE_ROOT):
+    directory, manifest = bar_store.open_dataset(path, root)
+    full = bar_store.read_range(directory, manifest, fields=['close'])['close']
+    fit, signal_of = STRATEGIES[strategy]
+    report = []
+    for k, (train_start, test_start, _) in enumerate(make_folds(len(full), folds)):
+        lo = max(train_start - WARMUP, 0)
+        close = as_float64(full[lo:test_start])
+        params, score = fit(close, train_start - lo, objective)
+        signal = np.asarray(signal_of(close, params), dtype=np.float64)
+        report.append((k + 1, score, _metrics(close, signal, train_start - lo)[objective]))
+    return report
+
+if __name__ == '__main__' and sys.argv[1:2] == ['verify']:
+    import glob
+    ok = True
+    for path in sys.argv[2:] or sorted(glob.glob('./*.pkl')):
+        bad = [(k, a, b) for k, a, b in verify(path) if abs(a - b) > 1e-9 * max(1.0, abs(b))]
+        ok &= not bad
+        print(('通過 ' if not bad else '不一致 %s ' % bad) + path)
+    sys.exit(0 if ok else 1)
+
+if __name__ == '__main__':
+    import glob
+    import time
+    path = sys.argv[1] if len(sys.argv) > 1 else sorted(glob.glob('./*.pkl'))[0]
+    folds = int(sys.argv[2]) if len(sys.argv) > 2 else 24
+    strategy = sys.argv[3] if len(sys.argv) > 3 else 'ma'
+    t0 = time.perf_counter()
+    result = walk_forward_file(path, strategy, folds)
+    elapsed = time.perf_counter() - t0
+    pd.set_option('display.width', 200)
+    print(result['folds'].to_string())
+    print(result['record'].GetStatistics())
+    print(f"樣本外累積報酬 {(result['equity'][-1] - 1) * 100:.2f}%，市場 {(result['market'][-1] - 1) * 100:.2f}%")
+    print(f"{folds} 段耗時 {elapsed:.2f} 秒")